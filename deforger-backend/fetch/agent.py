@@ -1,4 +1,5 @@
-import requests
+import asyncio
+import contextvars
 import json
 from uagents_core.contrib.protocols.chat import (
     chat_protocol_spec,
@@ -12,25 +13,160 @@ from datetime import datetime, timezone, timedelta
 from uuid import uuid4
 import os
 from dotenv import load_dotenv
+from http_client import UpstreamClient, is_unavailable
+from query_cache import QueryCache
+from tool_executor import ToolExecutor, is_read_only
+from tool_registry import ToolRegistry
+from intent_router import IntentRouter
+from answer_templates import render_direct_answer, render_local_answer
+from tool_selector import ToolSelector
+from completion_cache import CompletionCache, tools_fingerprint
+from streaming import ChunkFlusher
+from scheduler import SenderScheduler
+from resilience import CircuitBreaker, RetryPolicy
+from single_flight import SingleFlight
+from result_compactor import ResultCompactor
+from canister_mirror import CanisterMirror
+from skill_matcher import SkillMatcher
+from icp_batch import IcpBatcher, query_params
+from metrics import MetricsRegistry, MetricsServer
+from step_budget import StepBudget, usage_tokens
+from warm_store import WarmStore, carries_secrets
+from idempotency import IdempotencyStore
+from cassette import CassetteRecorder
 
 load_dotenv('./.env')
 
 # ASI1 API settings
 ASI1_API_KEY = os.getenv('ASI1_API_KEY')
 ASI1_BASE_URL = os.getenv('ASI1_BASE_URL')
+ASI1_MODEL = os.getenv('ASI1_MODEL', 'asi1-mini')
 ASI1_HEADERS = {
     "Authorization": f"Bearer {ASI1_API_KEY}",
     "Content-Type": "application/json"
 }
 
-CANISTER_ID = "uxrrr-q7777-77774-qaaaq-cai"
-BASE_URL = "http://127.0.0.1:4943"
+CANISTER_ID = os.getenv('CANISTER_ID', "uxrrr-q7777-77774-qaaaq-cai")
+BASE_URL = os.getenv('ICP_BASE_URL', "http://127.0.0.1:4943")
 
 HEADERS = {
     "Host": f"{CANISTER_ID}.raw.localhost", # added .raw to bypass local certification errors
     "Content-Type": "application/json"
 }
 
+# Connection pool settings (per upstream host)
+ASI1_MAX_CONNECTIONS = int(os.getenv('ASI1_MAX_CONNECTIONS', '32'))
+ASI1_TIMEOUT = float(os.getenv('ASI1_TIMEOUT', '60'))
+ICP_MAX_CONNECTIONS = int(os.getenv('ICP_MAX_CONNECTIONS', '64'))
+ICP_TIMEOUT = float(os.getenv('ICP_TIMEOUT', '15'))
+
+# Resilience: per-attempt and overall deadlines for get_* queries (the only calls retried),
+# and circuit breakers that fail fast after repeated upstream failures
+ICP_QUERY_TIMEOUT = float(os.getenv('ICP_QUERY_TIMEOUT', '3'))
+ICP_QUERY_DEADLINE = float(os.getenv('ICP_QUERY_DEADLINE', '6'))
+ICP_QUERY_MAX_ATTEMPTS = int(os.getenv('ICP_QUERY_MAX_ATTEMPTS', '3'))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '0.1'))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '1.0'))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))
+
+# Read-through cache for get_* canister queries
+ICP_CACHE_TTL = float(os.getenv('ICP_CACHE_TTL', '15'))
+ICP_CACHE_MAX_ENTRIES = int(os.getenv('ICP_CACHE_MAX_ENTRIES', '2048'))
+ICP_CACHE_MAX_BYTES = int(os.getenv('ICP_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+ICP_CACHE_STALE_TTL = float(os.getenv('ICP_CACHE_STALE_TTL', '300')) # serve stale while the replica is down; 0 disables
+# Revalidate expired entries with If-None-Match; a 304 reuses the cached body
+ICP_CONDITIONAL_GETS = os.getenv('ICP_CONDITIONAL_GETS', 'true').lower() == 'true'
+
+# Local mirror of canister state fed by /changes-since; get_* tools are served from it
+# while the last sync is at most MIRROR_MAX_STALENESS seconds old
+MIRROR_ENABLED = os.getenv('MIRROR_ENABLED', 'true').lower() == 'true'
+MIRROR_SYNC_INTERVAL = float(os.getenv('MIRROR_SYNC_INTERVAL', '2'))
+MIRROR_MAX_STALENESS = float(os.getenv('MIRROR_MAX_STALENESS', '10'))
+MIRROR_BATCH_SIZE = int(os.getenv('MIRROR_BATCH_SIZE', '500'))
+
+# Default number of results for the ranked skill-matching tools
+MATCH_TOP_K = int(os.getenv('MATCH_TOP_K', '5'))
+
+# Route well-known phrasings to tools locally, skipping the first ASI1 call
+INTENT_ROUTER_ENABLED = os.getenv('INTENT_ROUTER_ENABLED', 'true').lower() == 'true'
+
+# Format small single-tool results locally instead of a second ASI1 call
+DIRECT_ANSWERS_ENABLED = os.getenv('DIRECT_ANSWERS_ENABLED', 'true').lower() == 'true'
+
+# Send only the top-k relevant tool schemas (plus a fallback set); 0 sends all tools
+TOOL_SELECTOR_TOP_K = int(os.getenv('TOOL_SELECTOR_TOP_K', '6'))
+TOOL_SELECTOR_MAX_ENCODED = int(os.getenv('TOOL_SELECTOR_MAX_ENCODED', '256'))
+
+# Reuse ASI1 tool-call plans for repeated read-only queries
+COMPLETION_CACHE_TTL = float(os.getenv('COMPLETION_CACHE_TTL', '600')) # 0 disables
+COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv('COMPLETION_CACHE_MAX_ENTRIES', '1024'))
+
+# Stream the final ASI1 answer to the sender in chunks
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'false').lower() == 'true'
+STREAM_FLUSH_CHARS = int(os.getenv('STREAM_FLUSH_CHARS', '160'))
+STREAM_FLUSH_INTERVAL = float(os.getenv('STREAM_FLUSH_INTERVAL', '0.4'))
+
+# Chat scheduling: global worker limit, per-sender queue bound and total queue bound
+SCHEDULER_MAX_WORKERS = int(os.getenv('SCHEDULER_MAX_WORKERS', '16'))
+SCHEDULER_MAX_QUEUE_PER_SENDER = int(os.getenv('SCHEDULER_MAX_QUEUE_PER_SENDER', '4'))
+SCHEDULER_MAX_QUEUED = int(os.getenv('SCHEDULER_MAX_QUEUED', '256'))
+BUSY_MESSAGE = "The DeForger agent is busy right now. Please retry in a few seconds."
+
+# Redelivered chat messages (same sender and msg_id) get the first delivery's replies instead of a rerun
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '4096'))
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', '3600'))
+
+# Page size requested from the canister's paged list routes when the model doesn't pick one
+ICP_PAGE_SIZE = int(os.getenv('ICP_PAGE_SIZE', '50'))
+PAGED_TOOLS = {"get_all_projects", "get_project_messages", "get_all_agent_matches"}
+
+# Send a turn's canister calls as one /batch request instead of one request per call
+ICP_BATCH_ENABLED = os.getenv('ICP_BATCH_ENABLED', 'true').lower() == 'true'
+
+# Token budget per tool message sent back to ASI1; larger results are compacted (0 disables)
+TOOL_RESULT_TOKEN_BUDGET = int(os.getenv('TOOL_RESULT_TOKEN_BUDGET', '1500'))
+
+# Max concurrent read-only tool calls within one ASI1 turn
+TOOL_MAX_CONCURRENCY = int(os.getenv('TOOL_MAX_CONCURRENCY', '8'))
+
+# Per-query budget for the tool loop: ASI1 may chain tool rounds (e.g. login, then a
+# call using its token) until it answers or a limit is hit; AGENT_MAX_ROUNDS=1 is a
+# single round. 0 disables the seconds/tokens limits.
+AGENT_MAX_ROUNDS = int(os.getenv('AGENT_MAX_ROUNDS', '4'))
+AGENT_MAX_SECONDS = float(os.getenv('AGENT_MAX_SECONDS', '45'))
+AGENT_MAX_TOKENS = int(os.getenv('AGENT_MAX_TOKENS', '12000'))
+
+# Optional SQLite snapshot of the read cache, cached plans and canister mirror, so a
+# restart doesn't start cold; empty disables. Rows are loaded lazily and dropped once
+# older than WARM_CACHE_MAX_AGE or, for reads, once the canister's version moved on.
+WARM_CACHE_PATH = os.getenv('WARM_CACHE_PATH', '')
+WARM_CACHE_SNAPSHOT_INTERVAL = float(os.getenv('WARM_CACHE_SNAPSHOT_INTERVAL', '60'))
+WARM_CACHE_MAX_AGE = float(os.getenv('WARM_CACHE_MAX_AGE', '86400'))
+
+# Records every process_query with its ASI1 and canister exchanges to this cassette, for
+# offline replay with `python cassette.py`; empty disables. Secrets are redacted.
+CASSETTE_RECORD_PATH = os.getenv('CASSETTE_RECORD_PATH', '')
+
+# Prometheus-style metrics at http://METRICS_HOST:METRICS_PORT/metrics, next to the agent's port 8001
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '8002'))
+
+asi1_client = UpstreamClient("asi1", ASI1_BASE_URL, ASI1_HEADERS,
+                             limit_per_host=ASI1_MAX_CONNECTIONS, total_timeout=ASI1_TIMEOUT)
+icp_client = UpstreamClient("icp", BASE_URL, HEADERS,
+                            limit_per_host=ICP_MAX_CONNECTIONS, total_timeout=ICP_TIMEOUT)
+asi1_breaker = CircuitBreaker("asi1", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+icp_breaker = CircuitBreaker("icp", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+icp_query_retry = RetryPolicy(max_attempts=ICP_QUERY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY,
+                              max_delay=RETRY_MAX_DELAY, deadline=ICP_QUERY_DEADLINE)
+# Identical concurrent get_* queries and ASI1 completions share one in-flight request
+icp_flight = SingleFlight()
+asi1_flight = SingleFlight()
+query_cache = QueryCache(ttl=ICP_CACHE_TTL, max_entries=ICP_CACHE_MAX_ENTRIES,
+                         max_bytes=ICP_CACHE_MAX_BYTES, stale_ttl=ICP_CACHE_STALE_TTL)
+
 # Function definitions for ASI1 function calling
 tools = [
     {
@@ -309,11 +445,15 @@ tools = [
         "type": "function",
         "function": {
             "name": "get_all_projects",
-            "description": "Retrieves all projects.",
+            "description": "Retrieves projects, one page at a time; use nextOffset from the result to fetch the next page.",
             "parameters": {
                 "type": "object",
-                "properties": {},
-                "required": [],
+                "properties": {
+                    "offset": {"type": ["number", "null"], "description": "Index of the first project; null for the first page."},
+                    "limit": {"type": ["number", "null"], "description": "Maximum items per page (up to 200); null for the default."},
+                    "fields": {"type": ["string", "null"], "description": "Comma-separated fields to return, e.g. \"name,vision,openRoles\"; null for all."}
+                },
+                "required": ["offset", "limit", "fields"],
                 "additionalProperties": False
             },
             "strict": True
@@ -355,13 +495,16 @@ tools = [
         "type": "function",
         "function": {
             "name": "get_project_messages",
-            "description": "Retrieves messages for a project.",
+            "description": "Retrieves messages for a project, one page at a time (newest page by default).",
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "projectId": {"type": "number", "description": "Project ID."}
+                    "projectId": {"type": "number", "description": "Project ID."},
+                    "offset": {"type": ["number", "null"], "description": "Index of the first message; null for the newest page."},
+                    "limit": {"type": ["number", "null"], "description": "Maximum items per page (up to 200); null for the default."},
+                    "fields": {"type": ["string", "null"], "description": "Comma-separated fields to return, e.g. \"sender,content\"; null for all."}
                 },
-                "required": ["projectId"],
+                "required": ["projectId", "offset", "limit", "fields"],
                 "additionalProperties": False
             },
             "strict": True
@@ -387,11 +530,15 @@ tools = [
         "type": "function",
         "function": {
             "name": "get_all_agent_matches",
-            "description": "Retrieves all agent matches.",
+            "description": "Retrieves agent matches, one page at a time; use nextOffset from the result to fetch the next page.",
             "parameters": {
                 "type": "object",
-                "properties": {},
-                "required": [],
+                "properties": {
+                    "offset": {"type": ["number", "null"], "description": "Index of the first match; null for the first page."},
+                    "limit": {"type": ["number", "null"], "description": "Maximum items per page (up to 200); null for the default."},
+                    "fields": {"type": ["string", "null"], "description": "Comma-separated fields to return, e.g. \"projectId,userId,roleFilled\"; null for all."}
+                },
+                "required": ["offset", "limit", "fields"],
                 "additionalProperties": False
             },
             "strict": True
@@ -430,6 +577,41 @@ tools = [
             "strict": True
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_ranked_matching_projects",
+            "description": "Ranks projects by how well their open roles fit a user's skills, best first, with matched and missing skills.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "userId": {"type": "string", "description": "User ID."},
+                    "topK": {"type": ["number", "null"], "description": "Number of projects to return; null for the default."}
+                },
+                "required": ["userId", "topK"],
+                "additionalProperties": False
+            },
+            "strict": True
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_role_candidates",
+            "description": "Ranks users who best fit an open role of a project by skill coverage, excluding current team members.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "projectId": {"type": "number", "description": "Project ID."},
+                    "roleName": {"type": "string", "description": "Name of the open role."},
+                    "topK": {"type": ["number", "null"], "description": "Number of users to return; null for the default."}
+                },
+                "required": ["projectId", "roleName", "topK"],
+                "additionalProperties": False
+            },
+            "strict": True
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -464,98 +646,519 @@ tools = [
     }
 ]
 
+async def rank_projects_for_user(args: dict):
+    ensure_match_index()
+    user = canister_mirror.users.get(args["userId"]) if MIRROR_ENABLED else None
+    if user is None:
+        user = await call_icp_endpoint("get_user_profile", {"userId": args["userId"]})
+    if not user:
+        return {"error": f"User {args['userId']} not found"}
+    return skill_matcher.top_projects(user.get("skills"), int(args.get("topK") or MATCH_TOP_K))
+
+async def rank_role_candidates(args: dict):
+    ensure_match_index()
+    project_id = int(args["projectId"])
+    if project_id not in skill_matcher.projects:
+        return {"error": f"Project {project_id} not found"}
+    team = (canister_mirror.projects.get(project_id) or {}).get("team") or []
+    return skill_matcher.top_candidates(project_id, args["roleName"], int(args.get("topK") or MATCH_TOP_K),
+                                        exclude=set(team))
+
+def ensure_match_index():
+    # The index is fed by the mirror's change feed
+    if not MIRROR_ENABLED or (canister_mirror.synced_at is None and not skill_matcher.projects):
+        raise RuntimeError("The skill-matching index is not ready yet; use get_matching_projects instead")
+
+# get_* tools answered inside the agent rather than by the canister
+LOCAL_TOOLS = {
+    "get_ranked_matching_projects": rank_projects_for_user,
+    "get_role_candidates": rank_role_candidates,
+}
+
+def prepare_query_args(func_name: str, args: dict) -> dict:
+    # Unset optional arguments (paging, fields) are left to the canister's defaults
+    args = {k: v for k, v in args.items() if v is not None}
+    if func_name in PAGED_TOOLS:
+        args.setdefault("limit", ICP_PAGE_SIZE)
+    return args
+
+def read_locally(func_name: str, args: dict):
+    # Mirror first, then the query cache; returns (hit, result)
+    if MIRROR_ENABLED and canister_mirror.is_fresh():
+        hit, mirrored = canister_mirror.query(func_name, args)
+        if hit:
+            return True, mirrored
+    return query_cache.get(query_cache.make_key(func_name, args))
+
+def state_version():
+    # Canister version that local reads are current to, known only while the mirror is fresh
+    return canister_mirror.version if MIRROR_ENABLED and canister_mirror.is_fresh() else None
+
+async def warm_query_cache(cache_key: tuple):
+    # The first time a key is read after a restart, reloads its snapshot entry: as
+    # fresh if the canister is still at the entry's version, else as a validator
+    # for the next conditional GET if it has an ETag, else not at all
+    if warm_store is None:
+        return
+    row = await warm_store.take("icp", json.dumps(cache_key))
+    if row is None:
+        return
+    entry, version, _ = row
+    fresh = version is not None and version == state_version()
+    if fresh or entry["etag"]:
+        query_cache.restore(cache_key, entry["args"], entry["text"], entry["etag"], version, fresh)
+    else:
+        warm_stats["dropped"] += 1
+
+def after_update(func_name: str, args: dict, result):
+    query_cache.invalidate_for(func_name, args, result)
+    # Reads issued after the write must not join a read that started before it
+    icp_flight.forget_all()
+
+async def fetch_query(func_name: str, args: dict, cache_key: tuple):
+    # One canister read, revalidated with the cached entry's ETag when there is one
+    path = "/" + func_name.replace("_", "-")
+    params = {"canisterId": CANISTER_ID, **query_params(args)}
+
+    async def get(etag: str = None):
+        return await icp_query_retry.run(
+            icp_breaker, lambda: icp_client.get_json_conditional(path, params=params, etag=etag),
+            ICP_QUERY_TIMEOUT)
+
+    version, generation = state_version(), query_cache.generation
+    etag = query_cache.validator(cache_key) if ICP_CONDITIONAL_GETS else None
+    status, etag, result = await get(etag)
+    etag = etag if ICP_CONDITIONAL_GETS else None
+    if status == 304:
+        hit, result = query_cache.revalidate(cache_key)
+        if hit:
+            return result
+        # Evicted while the request was in flight
+        status, etag, result = await get()
+    query_cache.put(cache_key, args, result, etag, version, generation)
+    return result
+
 async def call_icp_endpoint(func_name: str, args: dict):
+    if func_name in LOCAL_TOOLS:
+        return await LOCAL_TOOLS[func_name](args)
     # Convert func_name to path: replace _ with -, add /
     path = "/" + func_name.replace("_", "-")
-    url = f"{BASE_URL}{path}?canisterId={CANISTER_ID}"
-    
+    params = {"canisterId": CANISTER_ID}
+
     if func_name.startswith("get_"):
-        # For GET queries
-        params = {k: str(v) if isinstance(v, (int, float)) else v for k, v in args.items()}
-        response = requests.get(url, headers=HEADERS, params=params)
+        args = prepare_query_args(func_name, args)
+        # For GET queries, served from the mirror or cache while fresh
+        cache_key = query_cache.make_key(func_name, args)
+        await warm_query_cache(cache_key)
+        hit, local = read_locally(func_name, args)
+        if hit:
+            return local
+        try:
+            return await icp_flight.do(cache_key, lambda: fetch_query(func_name, args, cache_key))
+        except Exception as e:
+            if is_unavailable(e):
+                hit, stale = query_cache.get(cache_key, allow_stale=True)
+                if hit:
+                    return stale
+            raise
     else:
-        # For POST updates
-        response = requests.post(url, headers=HEADERS, json=args)
-    
-    response.raise_for_status()
-    return response.json()
-
-async def process_query(query: str, ctx: Context) -> str:
+        # For POST updates; never retried, since a timed-out update may still have been applied
+        canister_mirror.mark_stale()
+        try:
+            result = await icp_breaker.call(lambda: icp_client.post_json(path, args, params=params), ICP_TIMEOUT)
+        finally:
+            canister_mirror.mark_stale()
+        after_update(func_name, args, result)
+        return result
+
+async def send_icp_batch(ops: list, writes: bool):
+    if writes:
+        canister_mirror.mark_stale()
+    try:
+        return await icp_breaker.call(lambda: icp_client.post_json(
+            "/batch", {"ops": ops}, params={"canisterId": CANISTER_ID}), ICP_TIMEOUT)
+    finally:
+        if writes:
+            canister_mirror.mark_stale()
+
+async def call_icp_batch(calls: list) -> list:
+    # Sends a turn's canister calls through icp_batcher.
+    # calls: [(func_name, args)]; returns (result or exception, seconds, batched) per call, in order
+    calls = [(func_name, prepare_query_args(func_name, args)
+              if func_name.startswith("get_") and func_name not in LOCAL_TOOLS else args)
+             for func_name, args in calls]
+    for func_name, args in calls:
+        if func_name.startswith("get_") and func_name not in LOCAL_TOOLS:
+            await warm_query_cache(query_cache.make_key(func_name, args))
+    return await icp_batcher.run(calls)
+
+async def fetch_changes(since: int, limit: int, cursor: str = None):
+    params = {"canisterId": CANISTER_ID, "since": str(since), "limit": str(limit)}
+    if cursor is not None:
+        params["cursor"] = cursor
+    return await icp_breaker.call(lambda: icp_client.get_json("/changes-since", params=params), ICP_QUERY_TIMEOUT)
+
+canister_mirror = CanisterMirror(fetch_changes, max_staleness=MIRROR_MAX_STALENESS, batch_size=MIRROR_BATCH_SIZE)
+skill_matcher = SkillMatcher()
+warm_store = WarmStore(WARM_CACHE_PATH, max_age=WARM_CACHE_MAX_AGE) if WARM_CACHE_PATH else None
+warm_restore = None  # startup task opening the warm store and restoring the mirror
+warm_stats = {"mirror_restored": 0, "mirror_saved_version": 0, "plans_restored": 0, "dropped": 0}
+canister_mirror.subscribe(skill_matcher)
+
+def encode_asi1_body(payload: dict, tools_json: str = None) -> str:
+    body = json.dumps(payload, separators=(",", ":"))
+    if tools_json is not None:
+        # Splice the pre-encoded tool schemas into the request body
+        body = f'{body[:-1]},"tools":{tools_json}}}'
+    return body
+
+async def within(awaitable, timeout: float = None):
+    # A caller's own deadline, e.g. its query's time left. It is kept outside the
+    # breaker: running into it says nothing about the upstream's health.
+    return await (asyncio.wait_for(awaitable, timeout) if timeout is not None else awaitable)
+
+async def call_asi1(payload: dict, tools_json: str = None, stage: str = None, timeout: float = None):
+    # stage: the metrics label; defaults to "plan" when tools are offered, else "answer"
+    # timeout: the caller's deadline, on top of ASI1_TIMEOUT
+    body = encode_asi1_body(payload, tools_json)
+    stage = stage or ("plan" if tools_json is not None else "answer")
+
+    async def request():
+        response = await asi1_breaker.call(
+            lambda: asi1_client.post_json("/chat/completions", data=body), ASI1_TIMEOUT)
+        # Recorded once per request sent, not per coalesced caller
+        record_usage(stage, response)
+        return response
+
+    return await within(asi1_flight.do(body, request), timeout)
+
+async def stream_asi1(payload: dict, on_text, tools_json: str = None, stage: str = None, timeout: float = None):
+    body = encode_asi1_body({**payload, "stream": True}, tools_json)
+    stage = stage or ("step" if tools_json is not None else "answer")
+    return await within(asi1_breaker.call(lambda: _stream_asi1(body, on_text, stage), ASI1_TIMEOUT), timeout)
+
+async def _stream_asi1(body: str, on_text, stage: str):
+    # Forwards content deltas as they arrive and returns the assembled completion,
+    # shaped like a non-streamed one; tool calls are rebuilt from their deltas by index
+    parts, tool_calls, usage = [], {}, {}
+    async for event in asi1_client.post_sse("/chat/completions", data=body):
+        record_usage(stage, event)
+        usage = event.get("usage") or usage
+        choices = event.get("choices") or [{}]
+        delta = choices[0].get("delta") or {}
+        for part in delta.get("tool_calls") or []:
+            call = tool_calls.setdefault(part.get("index", len(tool_calls)), {
+                "id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+            call["id"] = part.get("id") or call["id"]
+            function = part.get("function") or {}
+            call["function"]["name"] += function.get("name") or ""
+            call["function"]["arguments"] += function.get("arguments") or ""
+        text = delta.get("content")
+        if text:
+            parts.append(text)
+            await on_text(text)
+    message = {"role": "assistant", "content": "".join(parts)}
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+    return {"choices": [{"message": message}], "usage": usage}
+
+icp_batcher = IcpBatcher(call_icp_endpoint, fetch_query, send_icp_batch, read_locally, after_update, query_cache,
+                         icp_flight, state_version, local_tools=LOCAL_TOOLS, conditional=ICP_CONDITIONAL_GETS,
+                         max_concurrency=TOOL_MAX_CONCURRENCY)
+# Tool-call arguments are validated and coerced against the schemas above before any canister call
+tool_registry = ToolRegistry(tools)
+tool_executor = ToolExecutor(call_icp_endpoint, max_concurrency=TOOL_MAX_CONCURRENCY,
+                             call_batch=call_icp_batch if ICP_BATCH_ENABLED else None,
+                             validate=tool_registry.validate)
+intent_router = IntentRouter(tool["function"]["name"] for tool in tools)
+tool_selector = ToolSelector(tools, top_k=TOOL_SELECTOR_TOP_K or len(tools), max_encoded=TOOL_SELECTOR_MAX_ENCODED)
+result_compactor = ResultCompactor(token_budget=TOOL_RESULT_TOKEN_BUDGET)
+completion_cache = CompletionCache(tools_fingerprint(tools, ASI1_MODEL), ttl=COMPLETION_CACHE_TTL,
+                                   max_entries=COMPLETION_CACHE_MAX_ENTRIES)
+
+metrics = MetricsRegistry(prefix="deforger_")
+stage_seconds = metrics.histogram("stage_seconds", "Time spent in each stage of a query.", ("stage",))
+tool_seconds = metrics.histogram("tool_seconds", "Duration of each tool call.", ("tool",))
+tool_errors = metrics.counter("tool_errors_total", "Tool calls that returned an error.", ("tool",))
+plan_sources = metrics.counter("plans_total", "How each query's tool calls were chosen.", ("source",))
+answer_sources = metrics.counter("answers_total", "How each query was answered.", ("source",))
+asi1_tokens = metrics.counter("asi1_tokens_total", "Tokens reported in ASI1 usage.", ("stage", "kind"))
+tool_rounds = metrics.histogram("tool_rounds", "Tool rounds run per query.", buckets=(1, 2, 3, 4, 6, 8))
+budget_stops = metrics.counter("budget_stops_total", "Tool loops cut short, by the limit that ended them.", ("limit",))
+
+def record_usage(stage: str, response: dict):
+    usage = response.get("usage") or {}
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            asi1_tokens.inc(stage, kind[:-len("_tokens")], amount=usage[kind])
+
+def collect_upstreams():
+    breakers = (asi1_breaker, icp_breaker)
+    return [
+        ("upstream_errors_total", "counter", "Failed upstream calls by error kind.",
+         [({"upstream": b.name, "kind": kind}, count) for b in breakers for kind, count in sorted(b.errors.items())]),
+        ("upstream_calls_total", "counter", "Upstream calls attempted.",
+         [({"upstream": b.name}, b.stats["calls"]) for b in breakers]),
+        ("circuit_open", "gauge", "1 while the upstream's circuit breaker is open or half-open.",
+         [({"upstream": b.name}, int(b.state != CircuitBreaker.CLOSED)) for b in breakers]),
+    ]
+
+def collect_load():
+    cache_stats = query_cache.stats
+    return [
+        ("scheduler_active", "gauge", "Chat queries being answered.", [({}, scheduler.active)]),
+        ("scheduler_queued", "gauge", "Chat queries waiting for a worker.", [({}, scheduler.queued)]),
+        ("scheduler_rejected_total", "counter", "Chat queries shed with a busy reply.",
+         [({}, scheduler.stats["rejected"])]),
+        ("duplicate_messages_total", "counter", "Redelivered chat messages answered from the first delivery.",
+         [({"state": state}, idempotency.stats[k]) for state, k in (("completed", "replayed"), ("in_flight", "attached"))]),
+        ("query_cache_requests_total", "counter", "Query cache lookups by result.",
+         [({"result": k}, cache_stats[k]) for k in ("hits", "misses", "stale_hits")]),
+        ("mirror_served_total", "counter", "get_* calls answered from the canister mirror.",
+         [({}, canister_mirror.stats["served"])]),
+        ("mirror_version", "gauge", "Canister change-feed version the mirror has applied.",
+         [({}, canister_mirror.version)]),
+    ]
+
+def collect_tools():
+    return [
+        ("tool_arguments_total", "counter", "Tool calls by argument validation result.",
+         [({"result": k}, v) for k, v in tool_registry.stats.items()]),
+    ]
+
+metrics.add_collector(collect_upstreams)
+metrics.add_collector(collect_load)
+metrics.add_collector(collect_tools)
+metrics_server = MetricsServer(metrics, METRICS_HOST, METRICS_PORT)
+
+async def warm_plan(query: str):
+    # The first time a query's plan key is looked up after a restart, reloads its snapshot plan
+    if warm_store is None:
+        return
+    key = completion_cache.key(query)
+    row = await warm_store.take("plans", key)
+    if row is not None:
+        entry, _, saved_age = row
+        completion_cache.restore(key, entry["plan"], entry["age"] + saved_age)
+        warm_stats["plans_restored"] += 1
+
+async def process_query(query: str, ctx: Context, on_text=None) -> str:
+    # on_text: optional async callback receiving the answer text as it streams
+    with stage_seconds.time("end_to_end"):
+        return await _process_query(query, ctx, on_text)
+
+# Per chat message: {"private": bool}, set once a tool call carried a password or token
+current_reply = contextvars.ContextVar("current_reply", default=None)
+
+def call_key(tool_call: dict) -> tuple:
+    return tool_call["function"]["name"], tool_call["function"].get("arguments")
+
+async def run_tool_round(tool_calls: list, query: str, ctx: Context) -> tuple:
+    # Executes one turn's tool calls; returns (results, tool messages for ASI1)
+    with stage_seconds.time("tools"):
+        results = await tool_executor.execute(tool_calls, ctx.logger)
+    reply = current_reply.get()
+    if reply is not None and any(carries_secrets(result.arguments) for result in results):
+        # The answer may repeat a password or the session token login returned
+        reply["private"] = True
+    tool_messages = []
+    batch_elapsed = next((result.elapsed for result in results if result.batched), None)
+    if batch_elapsed is not None:
+        # Calls sent in one batch share its duration, so it is counted once
+        tool_seconds.observe(batch_elapsed, "batch")
+    for result in results:
+        if not result.batched:
+            tool_seconds.observe(result.elapsed, result.name)
+        if not result.ok:
+            tool_errors.inc(result.name)
+        content = result.content
+        if TOOL_RESULT_TOKEN_BUDGET > 0:
+            content = result_compactor.compact(result.name, content, query)
+        tool_messages.append({
+            "role": "tool",
+            "tool_call_id": result.tool_call_id,
+            "content": content
+        })
+    return results, tool_messages
+
+def render_without_llm(results: list, cached_calls, ctx: Context):
+    if cached_calls:
+        local_answer = render_local_answer(results)
+        if local_answer is not None:
+            answer_sources.inc("local")
+            return local_answer
+    if DIRECT_ANSWERS_ENABLED:
+        direct_answer = render_direct_answer(results)
+        if direct_answer is not None:
+            ctx.logger.info(f"Answered {results[0].name} from template")
+            answer_sources.inc("template")
+            return direct_answer
+    return None
+
+async def _process_query(query: str, ctx: Context, on_text=None) -> str:
     try:
-        # Step 1: Initial call to ASI1 with user query and tools
         initial_message = {
             "role": "user",
             "content": query
         }
-        payload = {
-            "model": "asi1-mini",
-            "messages": [initial_message],
-            "tools": tools,
-            "temperature": 0.7,
-            "max_tokens": 1024
-        }
-        response = requests.post(
-            f"{ASI1_BASE_URL}/chat/completions",
-            headers=ASI1_HEADERS,
-            json=payload
-        )
-        response.raise_for_status()
-        response_json = response.json()
+        budget = StepBudget(AGENT_MAX_ROUNDS, AGENT_MAX_SECONDS, AGENT_MAX_TOKENS)
+
+        # Step 1: Pick tools locally for well-known phrasings or a cached plan, otherwise ask ASI1
+        routed_calls = intent_router.route(query) if INTENT_ROUTER_ENABLED else None
+        cached_calls = None
+        offered = None
+        if not routed_calls and COMPLETION_CACHE_TTL > 0:
+            await warm_plan(query)
+            cached_calls = completion_cache.get(query)
+        if routed_calls:
+            plan_sources.inc("router")
+            ctx.logger.info(f"Routed locally to {routed_calls[0]['function']['name']} "
+                            f"(router hit rate {intent_router.hit_rate:.0%})")
+            assistant_message = {"role": "assistant", "content": "", "tool_calls": routed_calls}
+        elif cached_calls:
+            plan_sources.inc("cache")
+            ctx.logger.info(f"Reusing cached plan: {[tc['function']['name'] for tc in cached_calls]}")
+            assistant_message = {"role": "assistant", "content": "", "tool_calls": cached_calls}
+        else:
+            payload = {
+                "model": ASI1_MODEL,
+                "messages": [initial_message],
+                "temperature": 0.7,
+                "max_tokens": 1024
+            }
+            plan_sources.inc("llm")
+            offered = tool_selector.select(query)
+            with stage_seconds.time("plan"):
+                response_json = await call_asi1(payload, tool_selector.encoded(offered),
+                                                timeout=budget.remaining())
+                budget.charge(usage_tokens(response_json, payload["messages"], tool_selector.encoded(offered)))
+                assistant_message = response_json["choices"][0]["message"]
+                if assistant_message.get("tool_calls"):
+                    dropped = tool_selector.record_dropped(offered, assistant_message["tool_calls"])
+                    if dropped:
+                        ctx.logger.info(f"Model asked for {dropped} tool(s) outside the offered subset")
+                elif not tool_selector.is_full_set(offered):
+                    # The subset may have missed the right tool; retry once with all of them
+                    tool_selector.stats["retries_with_full_set"] += 1
+                    offered = list(tool_selector.by_name)
+                    response_json = await call_asi1(payload, tool_selector.encoded(offered),
+                                                    timeout=budget.remaining())
+                    budget.charge(usage_tokens(response_json, payload["messages"], tool_selector.encoded(offered)))
+                    assistant_message = response_json["choices"][0]["message"]
 
         # Step 2: Parse tool calls from response
-        tool_calls = response_json["choices"][0]["message"].get("tool_calls", [])
-        messages_history = [initial_message, response_json["choices"][0]["message"]]
+        tool_calls = assistant_message.get("tool_calls") or []
+        messages_history = [initial_message, assistant_message]
 
         if not tool_calls:
+            answer_sources.inc("no_tools")
             return "I couldn't determine what DeForger operation you're requesting. Please try rephrasing your question."
 
-        # Step 3: Execute tools and format results
-        for tool_call in tool_calls:
-            func_name = tool_call["function"]["name"]
-            arguments = json.loads(tool_call["function"]["arguments"])
-            tool_call_id = tool_call["id"]
-
-            ctx.logger.info(f"Executing {func_name} with arguments: {arguments}")
-
-            try:
-                result = await call_icp_endpoint(func_name, arguments)
-                content_to_send = json.dumps(result)
-            except Exception as e:
-                error_content = {
-                    "error": f"Tool execution failed: {str(e)}",
-                    "status": "failed"
-                }
-                content_to_send = json.dumps(error_content)
-
-            tool_result_message = {
-                "role": "tool",
-                "tool_call_id": tool_call_id,
-                "content": content_to_send
+        def remember_plan():
+            # Only a plan that needed no follow-up round is cached: a cache hit may
+            # be answered right after its first round
+            if COMPLETION_CACHE_TTL > 0 and not routed_calls and not cached_calls:
+                completion_cache.put(query, assistant_message["tool_calls"])
+
+        # Everything streamed to the sender, across every ASI1 turn of this query
+        streamed = []
+
+        async def forward(text: str):
+            streamed.append(text)
+            await on_text(text)
+
+        # Step 3: Run tool rounds. After each one ASI1 sees the results with the tools
+        # still offered, so it can chain a dependent call (e.g. use the token from
+        # login) or answer; routed plans are a single intent and get one round.
+        seen = set()
+        while True:
+            budget.rounds += 1
+            seen.update(call_key(tool_call) for tool_call in tool_calls)
+            results, tool_messages = await run_tool_round(tool_calls, query, ctx)
+            messages_history += tool_messages
+
+            # Step 4: Answer small results directly when no later round could need them
+            if budget.rounds == 1 and (routed_calls or all(is_read_only(r.name) for r in results)):
+                local_answer = render_without_llm(results, cached_calls, ctx)
+                if local_answer is not None:
+                    remember_plan()
+                    tool_rounds.observe(budget.rounds)
+                    return local_answer
+            if routed_calls:
+                break
+            limit = budget.exhausted()
+            if limit:
+                ctx.logger.info(f"Tool loop stopped by its {limit} limit after {budget.rounds} round(s)")
+                budget_stops.inc(limit)
+                break
+
+            step_payload = {
+                "model": ASI1_MODEL,
+                "messages": messages_history,
+                "temperature": 0.7,
+                "max_tokens": 1024
             }
-            messages_history.append(tool_result_message)
-
-        # Step 4: Send results back to ASI1 for final answer
+            offered = offered or tool_selector.select(query)
+            try:
+                with stage_seconds.time("step"):
+                    if on_text is not None:
+                        response_json = await stream_asi1(step_payload, forward, tool_selector.encoded(offered),
+                                                          timeout=budget.remaining())
+                    else:
+                        response_json = await call_asi1(step_payload, tool_selector.encoded(offered), stage="step",
+                                                        timeout=budget.remaining())
+            except asyncio.TimeoutError:
+                if budget.exhausted() != "seconds":
+                    raise
+                ctx.logger.info(f"Tool loop stopped by its seconds limit during round {budget.rounds + 1}")
+                budget_stops.inc("seconds")
+                break
+            budget.charge(usage_tokens(response_json, messages_history, tool_selector.encoded(offered)))
+            message = response_json["choices"][0]["message"]
+            next_calls = message.get("tool_calls") or []
+            if not next_calls:
+                # ASI1 answered from the results it has
+                if budget.rounds == 1:
+                    remember_plan()
+                answer_sources.inc("llm")
+                tool_rounds.observe(budget.rounds)
+                return "".join(streamed) if on_text is not None else message["content"]
+            if all(call_key(tool_call) in seen for tool_call in next_calls):
+                ctx.logger.info("Tool loop stopped: ASI1 repeated calls it already has results for")
+                budget_stops.inc("repeat")
+                break
+            messages_history.append(message)
+            tool_calls = next_calls
+
+        # Step 5: Ask ASI1 for a final answer from the results gathered so far
+        tool_rounds.observe(budget.rounds)
         final_payload = {
-            "model": "asi1-mini",
+            "model": ASI1_MODEL,
             "messages": messages_history,
             "temperature": 0.7,
             "max_tokens": 1024
         }
-        final_response = requests.post(
-            f"{ASI1_BASE_URL}/chat/completions",
-            headers=ASI1_HEADERS,
-            json=final_payload
-        )
-        final_response.raise_for_status()
-        final_response_json = final_response.json()
+        answer_sources.inc("llm")
+        with stage_seconds.time("answer"):
+            if on_text is not None:
+                await stream_asi1(final_payload, forward)
+                return "".join(streamed)
+            final_response_json = await call_asi1(final_payload)
 
-        # Step 5: Return the model's final answer
         return final_response_json["choices"][0]["message"]["content"]
 
     except Exception as e:
+        answer_sources.inc("error")
         ctx.logger.error(f"Error processing query: {str(e)}")
         return f"An error occurred while processing your request: {str(e)}"
 
+cassette_recorder = CassetteRecorder(CASSETTE_RECORD_PATH, secrets=[ASI1_API_KEY]) if CASSETTE_RECORD_PATH else None
+if cassette_recorder is not None:
+    process_query = cassette_recorder.wrap_query(process_query)
+    call_asi1, stream_asi1 = cassette_recorder.wrap_asi1(call_asi1, stream_asi1)
+    tool_executor.call, tool_executor.call_batch = cassette_recorder.wrap_icp(tool_executor.call,
+                                                                              tool_executor.call_batch)
+
 agent = Agent(
     name='deforger-agent',
     port=8001,
@@ -563,6 +1166,69 @@ agent = Agent(
 )
 chat_proto = Protocol(spec=chat_protocol_spec)
 
+scheduler = SenderScheduler(SCHEDULER_MAX_WORKERS, SCHEDULER_MAX_QUEUE_PER_SENDER, SCHEDULER_MAX_QUEUED)
+idempotency = IdempotencyStore(IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL)
+
+async def send_text(ctx: Context, sender: str, text: str):
+    await ctx.send(sender, ChatMessage(
+        timestamp=datetime.now(timezone.utc),
+        msg_id=uuid4(),
+        content=[TextContent(type="text", text=text)]
+    ))
+
+async def answer_query(ctx: Context, sender: str, text: str, replies: list = None):
+    # replies: optional list collecting every text sent back, for idempotent redelivery
+    async def reply(text: str):
+        await send_text(ctx, sender, text)
+        if replies is not None:
+            replies.append(text)
+
+    flusher = ChunkFlusher(reply, STREAM_FLUSH_CHARS, STREAM_FLUSH_INTERVAL) if STREAM_RESPONSES else None
+    try:
+        response_text = await process_query(text, ctx, flusher.add if flusher else None)
+        ctx.logger.info(f"Response text: {response_text}")
+        if flusher is not None and flusher.streamed:
+            await flusher.flush()
+            ctx.logger.info(f"Streamed response in {flusher.chunks_sent} chunks")
+            if response_text != flusher.text:
+                # The query failed after part of the answer was streamed
+                await reply(response_text)
+        else:
+            await reply(response_text)
+    except Exception as e:
+        ctx.logger.error(f"Error answering {sender}: {str(e)}")
+        await reply(f"An error occurred: {str(e)}")
+    finally:
+        if flusher is not None:
+            flusher.close()
+
+async def answer_message(ctx: Context, sender: str, key: tuple, texts: list):
+    # Answers a message's text items in order and records the replies under its (sender, msg_id)
+    replies = []
+    reply = {"private": False}
+    current_reply.set(reply)
+    try:
+        for text in texts:
+            await answer_query(ctx, sender, text, replies)
+    finally:
+        # Private replies are kept for redelivery but never written to the warm store
+        idempotency.complete(key, replies, private=reply["private"])
+
+async def replay_message(ctx: Context, sender: str, pending: asyncio.Future):
+    # Sends a duplicate the replies of the first delivery, once they are all sent
+    replies = await pending
+    for text in replies or []:
+        await send_text(ctx, sender, text)
+
+async def warm_idempotency(key: tuple):
+    # The first time a message is seen after a restart, reloads its snapshot entry
+    if warm_store is None:
+        return
+    row = await warm_store.take("replies", json.dumps(key))
+    if row is not None:
+        entry, _, saved_age = row
+        idempotency.restore(key, entry["replies"], entry["age"] + saved_age)
+
 @chat_proto.on_message(model=ChatMessage)
 async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
     try:
@@ -572,22 +1238,35 @@ async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
         )
         await ctx.send(sender, ack)
 
+        texts = []
         for item in msg.content:
             if isinstance(item, StartSessionContent):
                 ctx.logger.info(f"Got a start session message from {sender}")
                 continue
             elif isinstance(item, TextContent):
                 ctx.logger.info(f"Got a message from {sender}: {item.text}")
-                response_text = await process_query(item.text, ctx)
-                ctx.logger.info(f"Response text: {response_text}")
-                response = ChatMessage(
-                    timestamp=datetime.now(timezone.utc),
-                    msg_id=uuid4(),
-                    content=[TextContent(type="text", text=response_text)]
-                )
-                await ctx.send(sender, response)
+                texts.append(item.text)
             else:
                 ctx.logger.info(f"Got unexpected content from {sender}")
+        if not texts:
+            return
+
+        key = (sender, str(msg.msg_id))
+        await warm_idempotency(key)
+        pending = idempotency.begin(key)
+        if pending is not None:
+            # Redelivered: queued behind the sender's current job, it waits for the
+            # first delivery's replies instead of rerunning the query and its writes
+            ctx.logger.info(f"Duplicate message {msg.msg_id} from {sender}, replaying its replies")
+            job = lambda: replay_message(ctx, sender, pending)
+        else:
+            job = lambda: answer_message(ctx, sender, key, texts)
+        # Queue the query; the handler returns right away so other senders aren't blocked
+        if not scheduler.submit(sender, job):
+            if pending is None:
+                idempotency.abandon(key)
+            ctx.logger.info(f"Shedding load for {sender}: {scheduler.metrics()}")
+            await send_text(ctx, sender, BUSY_MESSAGE)
     except Exception as e:
         ctx.logger.error(f"Error handling chat message: {str(e)}")
         error_response = ChatMessage(
@@ -597,6 +1276,39 @@ async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
         )
         await ctx.send(sender, error_response)
 
+@agent.on_interval(period=60.0)
+async def log_scheduler_metrics(ctx: Context):
+    if scheduler.stats["submitted"]:
+        ctx.logger.info(f"Scheduler: {scheduler.metrics()}")
+
+@agent.on_interval(period=60.0)
+async def log_upstream_stats(ctx: Context):
+    for breaker in (asi1_breaker, icp_breaker):
+        if breaker.stats["failures"] or breaker.state != CircuitBreaker.CLOSED:
+            ctx.logger.info(f"Circuit {breaker.name}: {breaker.snapshot()}")
+    for name, flight in (("ICP", icp_flight), ("ASI1", asi1_flight)):
+        if flight.stats["coalesced"]:
+            ctx.logger.info(f"{name} requests coalesced: {flight.stats}")
+    if icp_batcher.stats["batches"] or icp_batcher.stats["fallbacks"]:
+        ctx.logger.info(f"ICP batches: {icp_batcher.stats}")
+    if icp_query_retry.stats["retries"]:
+        ctx.logger.info(f"ICP query retries: {icp_query_retry.stats}")
+
+@agent.on_interval(period=MIRROR_SYNC_INTERVAL)
+async def sync_canister_mirror(ctx: Context):
+    if not MIRROR_ENABLED or (warm_restore is not None and not warm_restore.done()):
+        # A restored mirror syncs on from its snapshot's version instead of from 0
+        return
+    previous_error = canister_mirror.last_error
+    try:
+        await canister_mirror.sync()
+    except Exception as e:
+        if str(e) != previous_error:
+            ctx.logger.warning(f"Canister mirror sync failed, serving reads directly: {str(e)}")
+        return
+    if previous_error is not None:
+        ctx.logger.info(f"Canister mirror caught up at version {canister_mirror.version}")
+
 @chat_proto.on_message(model=ChatAcknowledgement)
 async def handle_chat_acknowledgement(ctx: Context, sender: str, msg: ChatAcknowledgement):
     ctx.logger.info(f"Received acknowledgement from {sender} for message {msg.acknowledged_msg_id}")
@@ -605,6 +1317,85 @@ async def handle_chat_acknowledgement(ctx: Context, sender: str, msg: ChatAcknow
 
 agent.include(chat_proto)
 
+@agent.on_event("startup")
+async def start_metrics_server(ctx: Context):
+    if not METRICS_ENABLED:
+        return
+    try:
+        await metrics_server.start()
+        ctx.logger.info(f"Metrics available at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    except OSError as e:
+        ctx.logger.warning(f"Metrics server not started: {str(e)}")
+
+async def load_warm_state(ctx: Context):
+    try:
+        await warm_store.open()
+        row = await warm_store.take("mirror", "state") if MIRROR_ENABLED else None
+        if row is not None and await canister_mirror.restore(row[0]):
+            warm_stats["mirror_restored"] = warm_stats["mirror_saved_version"] = canister_mirror.version
+        ctx.logger.info(f"Warm cache opened: {warm_store.stats['keys']} entries on disk, "
+                        f"mirror restored at version {warm_stats['mirror_restored']}")
+    except Exception as e:
+        ctx.logger.warning(f"Warm cache not loaded, starting cold: {str(e)}")
+
+def plan_carries_secrets(plan: list) -> bool:
+    for _, arguments in plan:
+        try:
+            if carries_secrets(json.loads(arguments or "{}")):
+                return True
+        except ValueError:
+            return True
+    return False
+
+async def save_warm_state():
+    # Entries whose arguments hold a session token or password stay in memory only,
+    # so the file never holds working credentials
+    await warm_store.save("icp", [
+        (json.dumps(key), {"args": args, "text": text, "etag": etag}, version)
+        for key, args, text, etag, version in query_cache.snapshot() if not carries_secrets(args)
+    ])
+    await warm_store.save("plans", [
+        (key, {"plan": plan, "age": age}, None)
+        for key, plan, age in completion_cache.snapshot() if not plan_carries_secrets(plan)
+    ])
+    await warm_store.save("replies", [
+        (json.dumps(key), {"replies": replies, "age": age}, None) for key, replies, age in idempotency.snapshot()
+    ])
+    # The mirror is rewritten whole, so only once it has moved on
+    if MIRROR_ENABLED and canister_mirror.version and canister_mirror.version != warm_stats["mirror_saved_version"]:
+        await warm_store.save("mirror", [("state", canister_mirror.snapshot(), canister_mirror.version)])
+        warm_stats["mirror_saved_version"] = canister_mirror.version
+
+@agent.on_event("startup")
+async def open_warm_store(ctx: Context):
+    global warm_restore
+    if warm_store is not None:
+        # In the background, so startup never waits on the disk
+        warm_restore = asyncio.create_task(load_warm_state(ctx))
+
+@agent.on_interval(period=WARM_CACHE_SNAPSHOT_INTERVAL)
+async def snapshot_warm_state(ctx: Context):
+    if warm_store is None or not warm_store.ready:
+        return
+    try:
+        await save_warm_state()
+    except Exception as e:
+        ctx.logger.warning(f"Warm cache snapshot failed: {str(e)}")
+
+@agent.on_event("shutdown")
+async def close_http_clients(ctx: Context):
+    await asi1_client.close()
+    await icp_client.close()
+    await metrics_server.stop()
+    if warm_store is not None and warm_store.ready:
+        try:
+            await save_warm_state()
+        except Exception as e:
+            ctx.logger.warning(f"Warm cache snapshot failed: {str(e)}")
+        await warm_store.close()
+    if cassette_recorder is not None:
+        cassette_recorder.close()
+
 if __name__ == "__main__":
     agent.run()
 
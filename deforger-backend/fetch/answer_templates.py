@@ -0,0 +1,214 @@
+import json
+
+# Local "direct answer" rendering for small, single-tool results.
+# When a turn made exactly one tool call and its result has a template here,
+# the agent formats the answer itself instead of paying for a second ASI1
+# completion. Templates return None to defer to the LLM.
+#
+# render_local_answer goes further and formats any read result without the
+# LLM; it is used when a whole turn is replayed from the completion cache.
+
+MAX_LIST_ITEMS = 20
+
+
+def _failed(data) -> str:
+    if isinstance(data, dict) and "error" in data:
+        return str(data["error"])
+    return None
+
+
+def _update(done: str, failed: str):
+    def render(args: dict, data):
+        error = _failed(data)
+        if error is not None:
+            return f"{failed.format(**args)} The canister reported: {error}."
+        if isinstance(data, dict) and data.get("success") is True:
+            return done.format(**args)
+        return None
+    return render
+
+
+def _login(args: dict, data):
+    if isinstance(data, dict) and data.get("token"):
+        return f"Logged in as {args.get('username')}. Your session token is {data['token']}."
+    error = _failed(data)
+    return f"Login failed for {args.get('username')}: {error}." if error else None
+
+
+def _created(kind: str):
+    def render(args: dict, data):
+        if isinstance(data, dict) and isinstance(data.get("id"), int):
+            label = f' "{args["name"]}"' if args.get("name") else ""
+            return f"Created {kind}{label} with ID {data['id']}."
+        error = _failed(data)
+        return f"Could not create the {kind}: {error}." if error else None
+    return render
+
+
+def _trust_score(args: dict, data):
+    if isinstance(data, dict) and "trustScore" in data:
+        return f"User {args.get('userId')} has a trust score of {data['trustScore']}."
+    return None
+
+
+def _share_balance(args: dict, data):
+    if isinstance(data, dict) and "balance" in data:
+        shares = "share" if data["balance"] == 1 else "shares"
+        return f"User {args.get('userId')} holds {data['balance']} {shares} in project {args.get('projectId')}."
+    return None
+
+
+def _user_profile(args: dict, data):
+    if data is None:
+        return f"No user found with ID {args.get('userId')}."
+    if not isinstance(data, dict) or "username" not in data:
+        return None
+    skills = ", ".join(data.get("skills") or []) or "none listed"
+    return (f"{data.get('name')} (@{data['username']}, {data.get('id')}) is a {data.get('role')}. "
+            f"Skills: {skills}. Portfolio: {data.get('portfolioUrl')}. Trust score: {data.get('trustScore')}.")
+
+
+def _not_found(kind: str, arg: str):
+    def render(args: dict, data):
+        if data is None:
+            return f"No {kind} found with ID {args.get(arg)}."
+        return None
+    return render
+
+
+TEMPLATES = {
+    "get_user_trust_score": _trust_score,
+    "get_project_share_balance": _share_balance,
+    "get_user_profile": _user_profile,
+    "get_project": _not_found("project", "id"),
+    "get_contract": _not_found("contract", "contractId"),
+    "login": _login,
+    "register": _update("Registered user {username}.", "Could not register {username}."),
+    "change_password": _update("Your password has been changed.", "Could not change your password."),
+    "update_user_profile": _update("Your profile has been updated.", "Could not update your profile."),
+    "create_project": _created("project"),
+    "create_contract": _created("contract"),
+    "record_agent_match": _update("Recorded {userId} as {roleFilled} on project {projectId}.",
+                                  "Could not record the match on project {projectId}."),
+    "apply_to_project": _update("Your application to project {projectId} was submitted.",
+                                "Could not apply to project {projectId}."),
+    "review_application": _update("Application {applicationId} has been reviewed (accept: {accept}).",
+                                  "Could not review application {applicationId}."),
+    "send_message": _update("Your message was sent to project {projectId}.",
+                            "Could not send your message to project {projectId}."),
+    "tokenize_project": _update("Project {projectId} is now tokenized: {totalShares} shares at {pricePerShare} each.",
+                                "Could not tokenize project {projectId}."),
+    "buy_shares": _update("You bought {numShares} shares in project {projectId}.",
+                          "Could not buy {numShares} shares in project {projectId}."),
+    "withdraw_project_funds": _update("Funds withdrawn from project {projectId}.",
+                                      "Could not withdraw funds from project {projectId}."),
+    "add_review": _update("Your review of project {projectId} (rating {rating}) was added.",
+                          "Could not add your review to project {projectId}."),
+}
+
+
+def render_direct_answer(results: list, max_chars: int = 2048):
+    # results: ToolResult list from the tool executor
+    if len(results) != 1:
+        return None
+    result = results[0]
+    template = TEMPLATES.get(result.name)
+    if template is None or not result.ok or len(result.content) > max_chars:
+        return None
+    try:
+        return template(result.arguments, json.loads(result.content))
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def _items(items, line, empty: str, header: str) -> str:
+    # items: a plain list, or a page {"items", "total", "offset", "nextOffset"} from a paged route
+    total = len(items)
+    if isinstance(items, dict):
+        items, total = items["items"], items["total"]
+    if not items:
+        return empty
+    lines = [header.format(count=total)]
+    lines += [f"- {line(item)}" for item in items[:MAX_LIST_ITEMS]]
+    shown = min(len(items), MAX_LIST_ITEMS)
+    if total > shown:
+        lines.append(f"...and {total - shown} more.")
+    return "\n".join(lines)
+
+
+def _project_line(p: dict) -> str:
+    roles = ", ".join(r.get("roleName", "") for r in p.get("openRoles") or []) or "none"
+    return (f"#{p.get('id')} {p.get('name')} ({p.get('projectType')}): {p.get('vision')} "
+            f"Open roles: {roles}. Team: {p.get('teamSize', len(p.get('team') or []))} member(s).")
+
+
+def _project(args: dict, data):
+    if data is None:
+        return f"No project found with ID {args.get('id')}."
+    text = f"Project {_project_line(data)} Owner: {data.get('owner')}."
+    if data.get("isTokenized"):
+        text += (f" Tokenized: {data.get('availableShares')} of {data.get('totalShares')} shares available "
+                 f"at {data.get('pricePerShare')} each.")
+    return text
+
+
+def _contract(args: dict, data):
+    if data is None:
+        return f"No contract found with ID {args.get('contractId')}."
+    return (f"Contract #{data.get('id')} between project {data.get('projectId')} and {data.get('userId')} "
+            f"({data.get('status')}): {data.get('terms')}")
+
+
+SUMMARIES = {
+    "get_all_projects": lambda args, data: _items(
+        data, _project_line, "There are no projects yet.", "Found {count} project(s):"),
+    "get_matching_projects": lambda args, data: _items(
+        data, _project_line, "No projects match your skills right now.", "{count} project(s) match your skills:"),
+    "get_project": _project,
+    "get_project_messages": lambda args, data: _items(
+        data, lambda m: f"{m.get('sender')}: {m.get('content')}",
+        f"Project {args.get('projectId')} has no messages yet.",
+        f"{{count}} message(s) in project {args.get('projectId')}:"),
+    "get_project_reviews": lambda args, data: _items(
+        data, lambda r: f"{r.get('reviewer')} ({r.get('rating')}/5): {r.get('content')}",
+        f"Project {args.get('projectId')} has no reviews yet.",
+        f"{{count}} review(s) for project {args.get('projectId')}:"),
+    "get_all_agent_matches": lambda args, data: _items(
+        data, lambda m: f"{m.get('userId')} filled {m.get('roleFilled')} on project {m.get('projectId')}",
+        "There are no agent matches yet.", "{count} agent match(es):"),
+    "get_contract": _contract,
+    "get_ranked_matching_projects": lambda args, data: _items(
+        data, lambda m: (f"#{m.get('projectId')} {m.get('name')}: best fit {m.get('bestRole')} "
+                         f"({m.get('coverage', 0):.0%} of required skills; missing: "
+                         f"{', '.join(m.get('missingSkills') or []) or 'none'})"),
+        f"No projects fit the skills of {args.get('userId')} right now.",
+        f"Top {{count}} project(s) for {args.get('userId')}:"),
+    "get_role_candidates": lambda args, data: _items(
+        data, lambda c: (f"{c.get('userId')} ({c.get('coverage', 0):.0%} of required skills; missing: "
+                         f"{', '.join(c.get('missingSkills') or []) or 'none'})"),
+        f"No users fit the {args.get('roleName')} role on project {args.get('projectId')}.",
+        f"Top {{count}} candidate(s) for {args.get('roleName')} on project {args.get('projectId')}:"),
+}
+
+
+def render_local_answer(results: list):
+    # Formats every result without the LLM; None if any result can't be rendered
+    parts = []
+    for result in results:
+        if not result.ok:
+            return None
+        data = json.loads(result.content)
+        text = None
+        for renderer in (TEMPLATES.get(result.name), SUMMARIES.get(result.name)):
+            if renderer is None:
+                continue
+            try:
+                text = renderer(result.arguments, data)
+            except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+                text = None
+            if text is not None:
+                break
+        if text is None:
+            return None
+        parts.append(text)
+    return "\n\n".join(parts) if parts else None
@@ -0,0 +1,395 @@
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from fake_upstreams import FakeASI1, FakeCanister, build_dataset, start_server
+
+# Offline benchmark for agent.py: no ASI1 key or dfx replica needed.
+# Starts FakeASI1 and FakeCanister on free local ports, points the agent at
+# them through its environment settings, then drives process_query (or the
+# chat handler, through the scheduler) with a weighted query mix at a fixed
+# concurrency. Prints throughput and p50/p95/p99 latency per stage as JSON:
+#   plan        first ASI1 completion (picking tools); skipped on router/cache hits
+#   tools       executing one turn's tool calls
+#   tool:<name> one tool call, as timed by the executor
+#   tool:batch  one turn's calls sent together as an ICP batch (ICP_BATCH_ENABLED)
+#   answer      final ASI1 completion; skipped on template answers
+#   first_chunk first streamed piece of the answer (--stream)
+#   first_reply first chat message back to the sender (--mode chat)
+#   end_to_end  the whole query
+# Any other agent setting (ICP_BATCH_ENABLED, MIRROR_ENABLED, ...) is read from
+# the environment as usual, so runs can be compared with features on and off.
+#
+#   python benchmark.py --requests 500 --concurrency 32 --output run.json
+
+# {project}, {other_project}, {user} and {role} are filled per request from the dataset
+DEFAULT_MIX = [
+    {"query": "What are all the projects?", "weight": 2},
+    {"query": "Whats the details of project {project}?", "weight": 3},
+    {"query": "What are the messages in project {project}?", "weight": 2},
+    {"query": "What is the trust score for user {user}?", "weight": 2},
+    {"query": "Tell me about project {project} and its reviews", "weight": 2},
+    {"query": "Compare project {project} and project {other_project}", "weight": 1},
+    {"query": "Which projects fit {user} best?", "weight": 2},
+    {"query": "Who could fill the {role} role on project {project}?", "weight": 1},
+    {"query": "Send message to project {project}: Hello team!, token xyz.", "weight": 1},
+    {"query": "Log in as {user} with password secret and show my matching projects", "weight": 1},
+]
+
+ERROR_PREFIX = "An error occurred"
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)  # stage -> seconds
+
+    def record(self, stage: str, seconds: float):
+        self.samples[stage].append(seconds)
+
+    def clear(self):
+        self.samples.clear()
+
+    def summary(self) -> dict:
+        return {stage: summarize(samples) for stage, samples in sorted(self.samples.items())}
+
+
+def percentile(ordered: list, q: float) -> float:
+    # Nearest-rank percentile of an already sorted list
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1))]
+
+
+def summarize(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def make_queries(mix: list, dataset: dict, count: int, key_space: int, seed: int) -> list:
+    rng = random.Random(seed)
+    projects = dataset["projects"][:key_space]
+    users = dataset["users"][:key_space]
+    templates = [entry["query"] for entry in mix]
+    weights = [entry.get("weight", 1) for entry in mix]
+    queries = []
+    for template in rng.choices(templates, weights=weights, k=count):
+        project, other = rng.choice(projects), rng.choice(projects)
+        queries.append(template.format(
+            project=project["id"], other_project=other["id"], user=rng.choice(users)["id"],
+            role=rng.choice(project["openRoles"])["roleName"]))
+    return queries
+
+
+def instrument(agent, stages: StageTimer):
+    # Times the stages of process_query by wrapping the module functions it calls
+    call_asi1, stream_asi1, execute = agent.call_asi1, agent.stream_asi1, agent.tool_executor.execute
+
+    async def timed_call_asi1(payload: dict, tools_json: str = None, stage: str = None, timeout: float = None):
+        started = time.perf_counter()
+        try:
+            return await call_asi1(payload, tools_json, stage, timeout)
+        finally:
+            stages.record(stage or ("plan" if tools_json is not None else "answer"), time.perf_counter() - started)
+
+    async def timed_stream_asi1(payload: dict, on_text, tools_json: str = None, stage: str = None,
+                                timeout: float = None):
+        started = time.perf_counter()
+        try:
+            return await stream_asi1(payload, on_text, tools_json, stage, timeout)
+        finally:
+            stages.record(stage or ("step" if tools_json is not None else "answer"), time.perf_counter() - started)
+
+    async def timed_execute(tool_calls: list, logger=None):
+        started = time.perf_counter()
+        results = await execute(tool_calls, logger)
+        stages.record("tools", time.perf_counter() - started)
+        batch_elapsed = None
+        for result in results:
+            if result.batched:
+                batch_elapsed = result.elapsed
+            else:
+                stages.record(f"tool:{result.name}", result.elapsed)
+        if batch_elapsed is not None:
+            stages.record("tool:batch", batch_elapsed)
+        return results
+
+    agent.call_asi1 = timed_call_asi1
+    agent.stream_asi1 = timed_stream_asi1
+    agent.tool_executor.execute = timed_execute
+
+
+class BenchContext:
+    # Stands in for uagents' Context: a logger and a send() that never leaves the process
+    def __init__(self, logger, on_send=None):
+        self.logger = logger
+        self.on_send = on_send
+
+    async def send(self, destination: str, message):
+        if self.on_send is not None:
+            self.on_send(destination, message)
+
+
+class QueryDriver:
+    # --mode process: calls process_query directly
+    def __init__(self, agent, stages: StageTimer, logger, stream: bool):
+        self.agent = agent
+        self.stages = stages
+        self.ctx = BenchContext(logger)
+        self.stream = stream
+        self.outcomes = {"ok": 0, "errors": 0, "rejected": 0}
+
+    async def run_one(self, sender: str, query: str):
+        started = time.perf_counter()
+        first_chunk = []
+
+        async def on_text(text: str):
+            if not first_chunk:
+                first_chunk.append(True)
+                self.stages.record("first_chunk", time.perf_counter() - started)
+
+        answer = await self.agent.process_query(query, self.ctx, on_text if self.stream else None)
+        self.stages.record("end_to_end", time.perf_counter() - started)
+        self.outcomes["errors" if answer.startswith(ERROR_PREFIX) else "ok"] += 1
+
+
+class ChatDriver:
+    # --mode chat: sends ChatMessages through handle_chat_message and the scheduler,
+    # and waits until answer_query has replied to the sender
+    def __init__(self, agent, stages: StageTimer, logger):
+        self.agent = agent
+        self.stages = stages
+        self.ctx = BenchContext(logger, self.on_send)
+        self.outcomes = {"ok": 0, "errors": 0, "rejected": 0}
+        self.pending = defaultdict(deque)  # sender -> its requests, oldest first
+        answer_query = agent.answer_query
+
+        async def finish_after(ctx, sender: str, text: str, replies: list = None):
+            try:
+                await answer_query(ctx, sender, text, replies)
+            finally:
+                self.finish(self.pending[sender].popleft())
+
+        agent.answer_query = finish_after
+
+    def on_send(self, sender: str, message):
+        if not isinstance(message, self.agent.ChatMessage) or not self.pending[sender]:
+            return
+        text = message.content[0].text
+        if text == self.agent.BUSY_MESSAGE:
+            # Sent while handling the newest request, before it was queued
+            request = self.pending[sender].pop()
+            request["rejected"] = True
+            self.finish(request)
+            return
+        # A sender's requests are answered in order, so replies belong to the oldest one
+        request = self.pending[sender][0]
+        if request["first_reply"] is None:
+            request["first_reply"] = time.perf_counter()
+            self.stages.record("first_reply", request["first_reply"] - request["started"])
+        request["text"] = text
+
+    def finish(self, request: dict):
+        if request["rejected"]:
+            self.outcomes["rejected"] += 1
+        else:
+            self.stages.record("end_to_end", time.perf_counter() - request["started"])
+            self.outcomes["errors" if (request["text"] or "").startswith(ERROR_PREFIX) else "ok"] += 1
+        request["done"].set_result(None)
+
+    async def run_one(self, sender: str, query: str):
+        request = {"started": time.perf_counter(), "first_reply": None, "text": None, "rejected": False,
+                   "done": asyncio.get_running_loop().create_future()}
+        self.pending[sender].append(request)
+        await self.agent.handle_chat_message(self.ctx, sender, self.agent.ChatMessage(
+            timestamp=datetime.now(timezone.utc),
+            msg_id=uuid4(),
+            content=[self.agent.TextContent(type="text", text=query)]
+        ))
+        await request["done"]
+
+
+async def drive(driver, queries: list, concurrency: int, senders: int):
+    queue = deque(queries)
+
+    async def worker(index: int):
+        sender = f"bench-sender-{index % senders}"
+        while queue:
+            await driver.run_one(sender, queue.popleft())
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+
+async def keep_mirror_synced(agent, ctx):
+    # Mirrors the agent's sync_canister_mirror interval handler
+    while True:
+        await asyncio.sleep(agent.MIRROR_SYNC_INTERVAL)
+        await agent.sync_canister_mirror(ctx)
+
+
+def agent_stats(agent) -> dict:
+    counts, rounds = agent.tool_rounds.series.get((), ([], 0))
+    return {
+        "query_cache": agent.query_cache.stats,
+        "completion_cache": agent.completion_cache.stats,
+        "intent_router": agent.intent_router.stats,
+        "tool_selector": agent.tool_selector.stats,
+        "tool_registry": agent.tool_registry.stats,
+        "result_compactor": agent.result_compactor.stats,
+        "icp_flight": agent.icp_flight.stats,
+        "asi1_flight": agent.asi1_flight.stats,
+        "icp_batches": agent.icp_batcher.stats,
+        "icp_retries": agent.icp_query_retry.stats,
+        "breakers": {b.name: {**b.snapshot(), "errors": dict(b.errors)} for b in (agent.asi1_breaker, agent.icp_breaker)},
+        "asi1_tokens": {f"{stage}_{kind}": count for (stage, kind), count in sorted(agent.asi1_tokens.values.items())},
+        "tool_loop": {"queries": sum(counts), "rounds": rounds,
+                      "budget_stops": {limit: count for (limit,), count in agent.budget_stops.values.items()}},
+        "mirror": {**agent.canister_mirror.stats, "version": agent.canister_mirror.version},
+        "warm_store": {**agent.warm_store.stats, **agent.warm_stats} if agent.warm_store else None,
+        "scheduler": agent.scheduler.metrics(),
+        "idempotency": agent.idempotency.stats,
+    }
+
+
+async def run(args) -> dict:
+    dataset = build_dataset(args.projects, args.users, args.messages_per_project, seed=args.seed)
+    canister = FakeCanister(dataset, query_latency=args.query_latency / 1000,
+                            update_latency=args.update_latency / 1000, jitter=args.jitter,
+                            error_rate=args.canister_error_rate, change_window=args.change_window)
+    script = json.load(open(args.script)) if args.script else None
+    asi1 = FakeASI1(script, plan_latency=args.plan_latency / 1000, answer_latency=args.answer_latency / 1000,
+                    jitter=args.jitter, answer_tokens=args.answer_tokens, error_rate=args.asi1_error_rate)
+    canister_runner, canister_url = await start_server(canister.app())
+    asi1_runner, asi1_url = await start_server(asi1.app())
+
+    # The agent reads its upstreams from the environment at import time
+    os.environ.update({
+        "ASI1_BASE_URL": asi1_url,
+        "ASI1_API_KEY": "benchmark",
+        "ICP_BASE_URL": canister_url,
+        "STREAM_RESPONSES": "true" if args.stream else "false",
+    })
+    with contextlib.redirect_stdout(sys.stderr):
+        # uagents logs to stdout; keep it clean for the report
+        agent = importlib.import_module("agent")
+    logger = logging.getLogger("benchmark")
+    stages = StageTimer()
+    instrument(agent, stages)
+    if args.mode == "chat":
+        driver = ChatDriver(agent, stages, logger)
+    else:
+        driver = QueryDriver(agent, stages, logger, args.stream)
+
+    mix = json.load(open(args.mix)) if args.mix else DEFAULT_MIX
+    queries = make_queries(mix, dataset, args.warmup + args.requests,
+                           args.key_space or len(dataset["projects"]), args.seed)
+    report = {"config": vars(args)}
+    mirror_task = None
+    try:
+        if agent.warm_store is not None:
+            # Mirrors the agent's startup handler, awaited so the restored mirror is measured
+            started = time.perf_counter()
+            await agent.load_warm_state(driver.ctx)
+            report["warm_load_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        if agent.MIRROR_ENABLED:
+            started = time.perf_counter()
+            await agent.canister_mirror.sync()
+            report["mirror_initial_sync_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            mirror_task = asyncio.create_task(keep_mirror_synced(agent, driver.ctx))
+
+        senders = args.senders or args.concurrency
+        if args.warmup:
+            await drive(driver, queries[:args.warmup], args.concurrency, senders)
+            stages.clear()
+            canister.requests.clear()
+            asi1.requests.clear()
+            driver.outcomes = dict.fromkeys(driver.outcomes, 0)
+
+        started = time.perf_counter()
+        await drive(driver, queries[args.warmup:], args.concurrency, senders)
+        duration = time.perf_counter() - started
+
+        report.update({
+            "requests": args.requests,
+            **driver.outcomes,
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(args.requests / duration, 2),
+            "stages": stages.summary(),
+            "upstream_requests": {"asi1": dict(asi1.requests), "canister": dict(canister.requests)},
+            # Agent counters include the warmup
+            "agent": agent_stats(agent),
+        })
+        return report
+    finally:
+        if mirror_task is not None:
+            mirror_task.cancel()
+        if agent.warm_store is not None and agent.warm_store.ready:
+            # Leaves the snapshot a second run with the same WARM_CACHE_PATH starts from
+            await agent.save_warm_state()
+            await agent.warm_store.close()
+        if agent.cassette_recorder is not None:
+            # Run with CASSETTE_RECORD_PATH set, the benchmark leaves a cassette to replay
+            agent.cassette_recorder.close()
+        await agent.asi1_client.close()
+        await agent.icp_client.close()
+        await asi1_runner.cleanup()
+        await canister_runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the DeForger agent against local fake upstreams.")
+    parser.add_argument("--mode", choices=["process", "chat"], default="process",
+                        help="call process_query directly, or go through the chat handler and scheduler")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=0, help="requests run before measuring")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--senders", type=int, default=0, help="distinct chat senders (default: concurrency)")
+    parser.add_argument("--mix", help="JSON file of [{\"query\": template, \"weight\": n}]")
+    parser.add_argument("--script", help="JSON file of [{\"match\": regex, \"tool_calls\": [...]}] for fake ASI1")
+    parser.add_argument("--key-space", type=int, default=0,
+                        help="only the first N projects/users appear in queries (default: all)")
+    parser.add_argument("--projects", type=int, default=200)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--messages-per-project", type=int, default=40)
+    parser.add_argument("--change-window", type=int, default=0,
+                        help="changes the fake canister keeps for /changes-since (default: all)")
+    parser.add_argument("--plan-latency", type=float, default=600, help="ms")
+    parser.add_argument("--answer-latency", type=float, default=900, help="ms")
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--query-latency", type=float, default=5, help="canister query call, ms")
+    parser.add_argument("--update-latency", type=float, default=2000, help="canister update call, ms")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency jitter, as a fraction")
+    parser.add_argument("--asi1-error-rate", type=float, default=0.0)
+    parser.add_argument("--canister-error-rate", type=float, default=0.0)
+    parser.add_argument("--stream", action="store_true", help="stream final answers")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the agent's logs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import asyncio
+import time
+
+# In-memory mirror of the canister's public state, kept current from the
+# /changes-since feed. sync() pulls change sets until it reaches the
+# canister's head version; get_* tools are answered locally only while the
+# last completed sync is within max_staleness, otherwise callers go to the
+# canister directly. Responses mimic the canister's JSON, including pages.
+# The canister only keeps a trailing window of changes; a mirror that falls
+# behind it starts over, reloading the whole state in resync pages that it
+# follows by cursor, then catching up on the changes made meanwhile. Those
+# can repeat records already reloaded: users, projects and contracts are
+# replaced by ID, and messages, reviews and matches not newer than the last
+# one held are skipped, since their IDs only grow.
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 200
+
+# Project fields that the paged route replaces with counts
+PROJECT_COUNTS = {"team": "teamSize", "applications": "applicationCount"}
+
+
+def _fields(args: dict):
+    fields = args.get("fields")
+    return None if fields is None else {f.strip() for f in str(fields).split(",")}
+
+
+def _view(item: dict, fields, key: str) -> dict:
+    # Unrequested fields come back as null, like the canister's *View records
+    if fields is None:
+        return dict(item)
+    return {k: (v if k == key or k in fields else None) for k, v in item.items()}
+
+
+def _project_view(project: dict, fields) -> dict:
+    view = _view(project, fields, "id")
+    for name, count_name in PROJECT_COUNTS.items():
+        view[count_name] = len(project.get(name) or [])
+    return view
+
+
+def _page(items: list, args: dict, newest_first_page: bool = False) -> dict:
+    limit = min(max(int(args.get("limit") or DEFAULT_PAGE_LIMIT), 1), MAX_PAGE_LIMIT)
+    total = len(items)
+    offset = args.get("offset")
+    if offset is None:
+        offset = max(total - limit, 0) if newest_first_page else 0
+    first = min(int(offset), total)
+    last = min(first + limit, total)
+    return {"items": items[first:last], "total": total, "offset": first,
+            "nextOffset": last if last < total else None}
+
+
+def _append_new(records: list, record: dict, key: str):
+    # Records arrive in ID order; one not newer than the last was already applied
+    if not records or record[key] > records[-1][key]:
+        records.append(record)
+
+
+def _is_paged(args: dict) -> bool:
+    return any(args.get(k) is not None for k in ("offset", "limit", "fields"))
+
+
+class CanisterMirror:
+    def __init__(self, fetch_changes, max_staleness: float = 10.0, batch_size: int = 500):
+        # fetch_changes: async (since, limit, cursor) -> ChangeSet dict from /changes-since
+        self.fetch_changes = fetch_changes
+        self.max_staleness = max_staleness
+        self.batch_size = batch_size
+        self.version = 0
+        self.synced_at = None
+        self.last_error = None
+        self._writes = 0  # bumped by mark_stale so an overlapping sync can't mark the mirror fresh
+        self._lock = asyncio.Lock()
+        self.listeners = []  # objects with apply_changes(change_set) and clear()
+        self._reset()
+        self.stats = {"served": 0, "syncs": 0, "changes": 0, "resets": 0, "resyncs": 0, "sync_errors": 0}
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def _reset(self):
+        for listener in getattr(self, "listeners", []):
+            listener.clear()
+        self.version = 0
+        self.users = {}
+        self.projects = {}
+        self.messages = {}  # projectId -> messages in canister order
+        self.reviews = {}  # projectId -> reviews in canister order
+        self.agent_matches = []
+        self.contracts = {}
+
+    @property
+    def lag(self) -> float:
+        return float("inf") if self.synced_at is None else time.monotonic() - self.synced_at
+
+    def is_fresh(self) -> bool:
+        return self.lag <= self.max_staleness
+
+    def mark_stale(self):
+        # Around a write through the agent, reads go to the canister until a later sync
+        self._writes += 1
+        self.synced_at = None
+
+    async def sync(self):
+        async with self._lock:
+            writes = self._writes
+            try:
+                cursor = None
+                while True:
+                    change_set = await self.fetch_changes(self.version, self.batch_size, cursor)
+                    if change_set.get("resync"):
+                        if cursor is None:
+                            # Behind the canister's change window: reload everything. Nothing is
+                            # served until a sync completes, since pages leave the mirror partial.
+                            self._reset()
+                            self.synced_at = None
+                            self.stats["resyncs"] += 1
+                        cursor = change_set.get("cursor")
+                        if cursor is not None:
+                            self._apply({**change_set, "version": self.version})
+                            continue
+                    elif change_set["head"] < self.version:
+                        # The canister's state was reset (reinstall); start over
+                        self._reset()
+                        self.stats["resets"] += 1
+                        continue
+                    self._apply(change_set)
+                    if self.version >= change_set["head"]:
+                        break
+            except Exception as e:
+                self.stats["sync_errors"] += 1
+                self.last_error = str(e)
+                raise
+            self.last_error = None
+            self.stats["syncs"] += 1
+            if writes == self._writes:
+                self.synced_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        # The whole state as one change set, for a warm restart. Records are
+        # replaced rather than mutated by _apply, so copying the containers is
+        # enough for the snapshot to be serialized later, off the event loop.
+        return {
+            "version": self.version,
+            "head": self.version,
+            "users": list(self.users.values()),
+            "projects": list(self.projects.values()),
+            "messages": [m for messages in self.messages.values() for m in messages],
+            "reviews": [r for reviews in self.reviews.values() for r in reviews],
+            "agentMatches": list(self.agent_matches),
+            "contracts": list(self.contracts.values()),
+        }
+
+    async def restore(self, change_set: dict) -> bool:
+        # Loads a snapshot() change set into a mirror that hasn't synced yet; the
+        # next sync() then continues from its version. The mirror stays not fresh
+        # until that sync, so nothing is served from the snapshot alone.
+        async with self._lock:
+            if self.version:
+                return False
+            changes = self.stats["changes"]
+            self._reset()
+            self._apply(change_set)
+            self.stats["changes"] = changes
+            return True
+
+    def _apply(self, change_set: dict):
+        self.stats["changes"] += change_set["version"] - self.version
+        for user in change_set.get("users") or []:
+            self.users[user["id"]] = user
+        for project in change_set.get("projects") or []:
+            self.projects[project["id"]] = project
+        for message in change_set.get("messages") or []:
+            _append_new(self.messages.setdefault(message["projectId"], []), message, "id")
+        for review in change_set.get("reviews") or []:
+            _append_new(self.reviews.setdefault(review["projectId"], []), review, "id")
+        for match in change_set.get("agentMatches") or []:
+            _append_new(self.agent_matches, match, "matchId")
+        for contract in change_set.get("contracts") or []:
+            self.contracts[contract["id"]] = contract
+        self.version = change_set["version"]
+        for listener in self.listeners:
+            listener.apply_changes(change_set)
+
+    def query(self, func_name: str, args: dict):
+        # Returns (hit, result); hit is False for tools the mirror can't answer
+        handler = getattr(self, f"_{func_name}", None)
+        if handler is None:
+            return False, None
+        try:
+            result = handler(args)
+        except (KeyError, TypeError, ValueError):
+            return False, None
+        self.stats["served"] += 1
+        return True, result
+
+    def _get_project(self, args: dict):
+        return self.projects.get(int(args["id"]))
+
+    def _get_all_projects(self, args: dict):
+        projects = [self.projects[k] for k in sorted(self.projects)]
+        if not _is_paged(args):
+            return projects
+        fields = _fields(args)
+        page = _page(projects, args)
+        page["items"] = [_project_view(p, fields) for p in page["items"]]
+        return page
+
+    def _get_user_profile(self, args: dict):
+        return self.users.get(args["userId"])
+
+    def _get_user_trust_score(self, args: dict):
+        user = self.users.get(args["userId"])
+        return {"trustScore": user["trustScore"] if user else 0}
+
+    def _get_project_messages(self, args: dict):
+        messages = self.messages.get(int(args["projectId"]), [])
+        if not _is_paged(args):
+            return list(messages)
+        fields = _fields(args)
+        page = _page(messages, args, newest_first_page=True)
+        page["items"] = [_view(m, fields, "id") for m in page["items"]]
+        return page
+
+    def _get_project_reviews(self, args: dict):
+        return list(self.reviews.get(int(args["projectId"]), []))
+
+    def _get_all_agent_matches(self, args: dict):
+        if not _is_paged(args):
+            return list(self.agent_matches)
+        fields = _fields(args)
+        page = _page(self.agent_matches, args)
+        page["items"] = [_view(m, fields, "matchId") for m in page["items"]]
+        return page
+
+    def _get_contract(self, args: dict):
+        return self.contracts.get(int(args["contractId"]))
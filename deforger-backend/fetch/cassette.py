@@ -0,0 +1,441 @@
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import gzip
+import hashlib
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict, deque
+
+from warm_store import SENSITIVE_KEYS
+
+# Record/replay of the agent's upstream traffic, for reproducible performance runs.
+# Recording (CASSETTE_RECORD_PATH on the agent) wraps call_asi1, stream_asi1 and
+# the tool executor's canister calls, and writes each process_query with the
+# exchanges it made and how long each took to a JSON Lines cassette (gzipped if
+# the path ends in .gz). Passwords, tokens and API keys are redacted; a secret
+# seen once is also scrubbed from every other string of the session.
+# Replay serves the exchanges back at their recorded latency, times a scale,
+# and matches each request on its redacted content, falling back to the next
+# unused exchange of the same kind within the query, so a changed prompt still
+# replays. Run as a script, it replays a cassette offline and diffs per-stage
+# timings against the recording or an earlier report. Only upstream-bound
+# stages fail the run by default: a tool:<name> stage mixes calls answered
+# from the mirror or cache, which take microseconds and so are dominated by
+# the replay's own scheduling, with calls that waited on the canister.
+#
+#   CASSETTE_RECORD_PATH=session.jsonl.gz python agent.py
+#   python cassette.py session.jsonl.gz --output replay.json
+#   python cassette.py session.jsonl.gz --baseline replay.json --tolerance 0.1
+
+CASSETTE_FORMAT = 1
+REDACTED = "[REDACTED]"
+ERROR_PREFIX = "An error occurred"
+
+_query_id = contextvars.ContextVar("cassette_query", default=None)
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+class ReplayedError(RuntimeError):
+    # An upstream error captured in the cassette, raised again on replay
+    pass
+
+
+def _open(path: str, mode: str):
+    return gzip.open(path, mode + "t", encoding="utf-8") if path.endswith(".gz") else open(path, mode, encoding="utf-8")
+
+
+class Redactor:
+    def __init__(self, secrets=()):
+        self.secrets = {s for s in secrets if s}
+
+    def __call__(self, value):
+        if isinstance(value, dict):
+            redacted = {}
+            for k, v in value.items():
+                if k.lower() in SENSITIVE_KEYS and isinstance(v, str) and v:
+                    self.secrets.add(v)
+                    redacted[k] = REDACTED
+                elif k == "arguments" and isinstance(v, str):
+                    # Tool-call arguments are JSON text inside ASI1 messages
+                    redacted[k] = self._json_text(v)
+                else:
+                    redacted[k] = self(v)
+            return redacted
+        if isinstance(value, (list, tuple)):
+            return [self(v) for v in value]
+        if isinstance(value, str):
+            for secret in self.secrets:
+                if secret in value:
+                    value = value.replace(secret, REDACTED)
+        return value
+
+    def _json_text(self, text: str) -> str:
+        try:
+            parsed = json.loads(text or "{}")
+        except ValueError:
+            return self(text)
+        return json.dumps(self(parsed), separators=(",", ":"))
+
+
+def _without_call_ids(message: dict) -> dict:
+    # Routed and cached plans get fresh tool-call IDs on every run
+    message = {k: v for k, v in message.items() if k != "tool_call_id"}
+    if message.get("tool_calls"):
+        message["tool_calls"] = [{k: v for k, v in call.items() if k != "id"} for call in message["tool_calls"]]
+    return message
+
+
+def request_key(kind: str, request) -> str:
+    # Matches a redacted request on replay
+    if kind == "asi1":
+        payload = request["payload"]
+        request = {**request, "payload": {**payload, "messages": [_without_call_ids(m) for m in payload["messages"]]}}
+    encoded = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()[:16]
+
+
+def _asi1_request(payload: dict, tools_json: str) -> dict:
+    # The message list is copied, since the tool loop keeps appending to it
+    tools = hashlib.sha256(tools_json.encode()).hexdigest()[:16] if tools_json is not None else None
+    return {"payload": {**payload, "messages": list(payload.get("messages") or [])}, "tools": tools}
+
+
+def _error(e: Exception) -> dict:
+    return {"type": type(e).__name__, "message": str(e)}
+
+
+class CassetteRecorder:
+    def __init__(self, path: str, secrets=()):
+        self.path = path
+        self.redact = Redactor(secrets)
+        self.started = time.perf_counter()
+        self._next_id = 0
+        self._pending = {}  # query id -> records, written when the query ends
+        self._file = _open(path, "w")
+        self._write([{"type": "session", "format": CASSETTE_FORMAT, "recorded_at": time.time()}])
+        self.stats = {"queries": 0, "exchanges": 0}
+
+    def _write(self, records: list):
+        # Redacted last, so secrets revealed later in a query are scrubbed from its earlier records
+        for record in map(self.redact, records):
+            if record["type"] == "exchange":
+                record["key"] = request_key(record["kind"], record["request"])
+            self._file.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+        self._file.flush()
+
+    def _record(self, kind: str, name: str, request, started: float, response=None, error=None, first=None):
+        record = {"type": "exchange", "query": _query_id.get(), "kind": kind, "name": name, "request": request,
+                  "start": round(started - self.started, 6), "elapsed": round(time.perf_counter() - started, 6)}
+        if first is not None:
+            record["first"] = round(first - started, 6)
+        if error is not None:
+            record["error"] = _error(error)
+        else:
+            record["response"] = response
+        self.stats["exchanges"] += 1
+        if record["query"] in self._pending:
+            self._pending[record["query"]].append(record)
+        else:
+            self._write([record])
+
+    async def _timed(self, kind: str, name: str, request, call, first: list = (None,)):
+        # first: holds the time the first streamed text arrived, if any
+        started = time.perf_counter()
+        try:
+            response = await call()
+        except Exception as e:
+            self._record(kind, name, request, started, error=e, first=first[0])
+            raise
+        self._record(kind, name, request, started, response=response, first=first[0])
+        return response
+
+    def wrap_query(self, process_query):
+        async def recorded_process_query(query: str, ctx, on_text=None) -> str:
+            query_id = self._next_id
+            self._next_id += 1
+            self._pending[query_id] = []
+            token = _query_id.set(query_id)
+            started = time.perf_counter()
+            answer = None
+            try:
+                answer = await process_query(query, ctx, on_text)
+                return answer
+            finally:
+                _query_id.reset(token)
+                self.stats["queries"] += 1
+                exchanges = self._pending.pop(query_id)
+                self._write([{"type": "query", "id": query_id, "query": query, "stream": on_text is not None,
+                              "start": round(started - self.started, 6),
+                              "elapsed": round(time.perf_counter() - started, 6),
+                              "ok": answer is not None and not answer.startswith(ERROR_PREFIX)}, *exchanges])
+        return recorded_process_query
+
+    def wrap_asi1(self, call_asi1, stream_asi1):
+        async def recorded_call_asi1(payload: dict, tools_json: str = None, stage: str = None,
+                                     timeout: float = None):
+            name = stage or ("plan" if tools_json is not None else "answer")
+            return await self._timed("asi1", name, _asi1_request(payload, tools_json),
+                                     lambda: call_asi1(payload, tools_json, stage, timeout))
+
+        async def recorded_stream_asi1(payload: dict, on_text, tools_json: str = None, stage: str = None,
+                                       timeout: float = None):
+            name = stage or ("step" if tools_json is not None else "answer")
+            first = [None]
+
+            async def forward(text: str):
+                if first[0] is None:
+                    first[0] = time.perf_counter()
+                await on_text(text)
+
+            return await self._timed("asi1", name, {**_asi1_request(payload, tools_json), "stream": True},
+                                     lambda: stream_asi1(payload, forward, tools_json, stage, timeout), first)
+        return recorded_call_asi1, recorded_stream_asi1
+
+    def wrap_icp(self, call, call_batch=None):
+        # call / call_batch: the ToolExecutor's canister callables
+        async def recorded_call(func_name: str, args: dict):
+            return await self._timed("icp", func_name, args, lambda: call(func_name, args))
+
+        async def recorded_call_batch(calls: list) -> list:
+            started = time.perf_counter()
+            outcomes = await call_batch(calls)
+            response = [{**({"error": _error(o)} if isinstance(o, Exception) else {"result": o}),
+                         "elapsed": round(elapsed, 6), "batched": batched} for o, elapsed, batched in outcomes]
+            self._record("icp_batch", "batch", [list(c) for c in calls], started, response=response)
+            return outcomes
+        return recorded_call, (recorded_call_batch if call_batch is not None else None)
+
+    def close(self):
+        for query_id in list(self._pending):
+            self._write(self._pending.pop(query_id))
+        self._file.close()
+
+
+class CassettePlayer:
+    def __init__(self, path: str, latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self.redact = Redactor()
+        self.queries = []
+        self.exchanges = []
+        self._by_key = defaultdict(deque)  # (query, kind, name, key) -> exchange records, in order
+        self._by_name = defaultdict(deque)  # (query, kind, name) -> exchange records, in order
+        with _open(path, "r") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["type"] == "query":
+                    self.queries.append(record)
+                elif record["type"] == "exchange":
+                    self.exchanges.append(record)
+                    record["used"] = False
+                    self._by_key[(record["query"], record["kind"], record["name"], record["key"])].append(record)
+                    self._by_name[(record["query"], record["kind"], record["name"])].append(record)
+        self.queries.sort(key=lambda q: q["start"])
+        self.stats = {"matched": 0, "fallback": 0, "missed": 0}
+
+    def _take(self, kind: str, name: str, request) -> dict:
+        query_id = _query_id.get()
+        key = request_key(kind, self.redact(request))
+        for queue, stat in ((self._by_key[(query_id, kind, name, key)], "matched"),
+                            (self._by_name[(query_id, kind, name)], "fallback")):
+            while queue and queue[0]["used"]:
+                queue.popleft()
+            if queue:
+                record = queue.popleft()
+                record["used"] = True
+                self.stats[stat] += 1
+                return record
+        self.stats["missed"] += 1
+        raise CassetteMiss(f"No recorded {kind} exchange for {name} in query {query_id}")
+
+    @property
+    def unused(self) -> int:
+        return sum(1 for record in self.exchanges if not record["used"])
+
+    async def _replay(self, record: dict):
+        await asyncio.sleep(record["elapsed"] * self.latency_scale)
+        if "error" in record:
+            raise ReplayedError(record["error"]["message"])
+        return record["response"]
+
+    def wrap_asi1(self):
+        async def replayed_call_asi1(payload: dict, tools_json: str = None, stage: str = None,
+                                     timeout: float = None):
+            name = stage or ("plan" if tools_json is not None else "answer")
+            return await self._replay(self._take("asi1", name, _asi1_request(payload, tools_json)))
+
+        async def replayed_stream_asi1(payload: dict, on_text, tools_json: str = None, stage: str = None,
+                                       timeout: float = None):
+            name = stage or ("step" if tools_json is not None else "answer")
+            record = self._take("asi1", name, {**_asi1_request(payload, tools_json), "stream": True})
+            first = record.get("first")
+            content = ((record.get("response") or {}).get("choices") or [{}])[0].get("message", {}).get("content")
+            if first is None or not content:
+                return await self._replay(record)
+            await asyncio.sleep(first * self.latency_scale)
+            await on_text(content)
+            return await self._replay({**record, "elapsed": max(record["elapsed"] - first, 0.0)})
+        return replayed_call_asi1, replayed_stream_asi1
+
+    def wrap_icp(self):
+        async def replayed_call(func_name: str, args: dict):
+            return await self._replay(self._take("icp", func_name, args))
+
+        async def replayed_call_batch(calls: list) -> list:
+            outcomes = await self._replay(self._take("icp_batch", "batch", [list(c) for c in calls]))
+            return [(ReplayedError(o["error"]["message"]) if "error" in o else o["result"],
+                     o["elapsed"] * self.latency_scale, o["batched"]) for o in outcomes]
+        return replayed_call, replayed_call_batch
+
+    async def replay_query(self, record: dict, process_query, ctx, on_text=None) -> str:
+        token = _query_id.set(record["id"])
+        try:
+            return await process_query(record["query"], ctx, on_text)
+        finally:
+            _query_id.reset(token)
+
+    def recorded_stages(self) -> dict:
+        # Per-stage timings as recorded, in the benchmark's stage names
+        from benchmark import StageTimer
+        stages = StageTimer()
+        for query in self.queries:
+            stages.record("end_to_end", query["elapsed"])
+        names = {"asi1": "{}", "icp": "tool:{}"}
+        for record in self.exchanges:
+            if record["kind"] in names:
+                stages.record(names[record["kind"]].format(record["name"]), record["elapsed"])
+            elif record["kind"] == "icp_batch" and "response" in record:
+                # As timed by the executor: calls sent in the batch count once, as tool:batch
+                batch_elapsed = None
+                for (func_name, _), outcome in zip(record["request"], record["response"]):
+                    if outcome["batched"]:
+                        batch_elapsed = outcome["elapsed"]
+                    else:
+                        stages.record(f"tool:{func_name}", outcome["elapsed"])
+                if batch_elapsed is not None:
+                    stages.record("tool:batch", batch_elapsed)
+        return stages.summary()
+
+
+# Stages that always wait on an upstream, and the query as a whole
+GATED_STAGES = {"plan", "step", "answer", "tool:batch", "end_to_end"}
+
+
+def diff_stages(current: dict, baseline: dict, tolerance: float, min_delta_ms: float,
+                gated=GATED_STAGES) -> tuple:
+    # Returns ({stage: {metric: [baseline, current, delta %]}}, gated stages slower than tolerance);
+    # gated=None gates every stage
+    diff, regressions = {}, []
+    for stage in sorted(set(current) & set(baseline)):
+        row = {}
+        for metric in ("mean_ms", "p50_ms", "p95_ms"):
+            before, after = baseline[stage][metric], current[stage][metric]
+            change = (after - before) / before if before else 0.0
+            row[metric] = [before, after, round(change * 100, 1)]
+            if (change > tolerance and after - before >= min_delta_ms and stage not in regressions
+                    and (gated is None or stage in gated)):
+                regressions.append(stage)
+        diff[stage] = row
+    return diff, regressions
+
+
+async def run(args) -> dict:
+    from benchmark import BenchContext, StageTimer, instrument
+
+    player = CassettePlayer(args.cassette, latency_scale=args.latency_scale)
+    # Nothing leaves the process on replay; the agent still needs upstream URLs to import
+    os.environ.setdefault("ASI1_BASE_URL", "http://127.0.0.1:9")
+    os.environ["CASSETTE_RECORD_PATH"] = ""
+    with contextlib.redirect_stdout(sys.stderr):
+        # uagents logs to stdout; keep it clean for the report
+        agent = importlib.import_module("agent")
+    agent.call_asi1, agent.stream_asi1 = player.wrap_asi1()
+    call, call_batch = player.wrap_icp()
+    agent.tool_executor.call = call
+    if agent.tool_executor.call_batch is not None:
+        agent.tool_executor.call_batch = call_batch
+    stages = StageTimer()
+    instrument(agent, stages)
+    ctx = BenchContext(logging.getLogger("replay"))
+    outcomes = {"ok": 0, "errors": 0}
+
+    async def replay(query: dict):
+        if not args.sequential:
+            await asyncio.sleep(max(query["start"] - (time.perf_counter() - started), 0.0))
+        query_started = time.perf_counter()
+
+        async def on_text(text: str):
+            pass
+
+        answer = await player.replay_query(query, agent.process_query, ctx, on_text if query["stream"] else None)
+        stages.record("end_to_end", time.perf_counter() - query_started)
+        outcomes["errors" if answer.startswith(ERROR_PREFIX) else "ok"] += 1
+
+    started = time.perf_counter()
+    try:
+        if args.sequential:
+            for query in player.queries:
+                await replay(query)
+        else:
+            # Queries start at their recorded offsets, so the recorded overlap is kept
+            await asyncio.gather(*(replay(query) for query in player.queries))
+    finally:
+        await agent.asi1_client.close()
+        await agent.icp_client.close()
+
+    report = {
+        "config": vars(args),
+        "queries": len(player.queries),
+        **outcomes,
+        "duration_s": round(time.perf_counter() - started, 3),
+        "stages": stages.summary(),
+        "cassette": {**player.stats, "exchanges": len(player.exchanges), "unused": player.unused},
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline, baseline_name = json.load(f)["stages"], args.baseline
+    else:
+        baseline, baseline_name = player.recorded_stages(), "recording"
+    report["diff"], report["regressions"] = diff_stages(report["stages"], baseline, args.tolerance, args.min_delta_ms,
+                                                        None if args.all_stages else GATED_STAGES)
+    report["baseline"] = baseline_name
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded agent session offline and diff stage timings.")
+    parser.add_argument("cassette", help="cassette written with CASSETTE_RECORD_PATH")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="multiplies the recorded upstream latencies (0 replays instantly)")
+    parser.add_argument("--sequential", action="store_true",
+                        help="one query at a time, instead of at the recorded start offsets")
+    parser.add_argument("--baseline", help="earlier replay or benchmark report (default: the recorded timings)")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown per stage, as a fraction")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore slowdowns smaller than this")
+    parser.add_argument("--all-stages", action="store_true",
+                        help="also fail on tool:<name> stages, which mix local and upstream calls")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the agent's logs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    if report["regressions"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+
+from tool_executor import is_read_only
+
+# Cache of ASI1 tool-call plans for read-only intents.
+# The key is the normalized query plus a hash of the tool schemas and model,
+# so a schema or model change never reuses an old plan. Only the plan (which
+# tools, which arguments) is stored; on a hit the agent re-runs it against
+# fresh canister data. Plans containing any mutating tool are never cached.
+
+FILLER_WORDS = {
+    "a", "an", "the", "what", "whats", "is", "are", "show", "me", "list", "get", "give", "display",
+    "tell", "please", "can", "could", "you", "all", "every", "of", "for", "in", "on", "from",
+    "retrieve", "info", "information", "details", "available", "about",
+}
+
+
+def normalize_query(query: str) -> str:
+    text = query.lower().replace("’", "'").replace("'", "")
+    words = re.findall(r"[a-z0-9]+(?:-[a-z0-9]+)*", text)
+    words = [w[:-1] if w.endswith("s") and len(w) > 3 and not w[-2].isdigit() else w for w in words]
+    return " ".join(w for w in words if w not in FILLER_WORDS)
+
+
+def tools_fingerprint(tools: list, model: str) -> str:
+    encoded = json.dumps(tools, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{model}\0{encoded}".encode()).hexdigest()[:16]
+
+
+class CompletionCache:
+    def __init__(self, fingerprint: str, ttl: float = 600.0, max_entries: int = 1024):
+        self.fingerprint = fingerprint
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._plans = OrderedDict()  # key -> (stored_at, [(name, arguments_json)])
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "rejected_mutating": 0}
+
+    def key(self, query: str) -> str:
+        normalized = normalize_query(query)
+        return hashlib.sha256(f"{self.fingerprint}\0{normalized}".encode()).hexdigest()
+
+    def get(self, query: str):
+        # Returns fresh ASI1-style tool_calls for a cached plan, or None
+        key = self.key(query)
+        entry = self._plans.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                del self._plans[key]
+            self.stats["misses"] += 1
+            return None
+        self._plans.move_to_end(key)
+        self.stats["hits"] += 1
+        return [
+            {"id": f"cached_{i}", "type": "function", "function": {"name": name, "arguments": arguments}}
+            for i, (name, arguments) in enumerate(entry[1])
+        ]
+
+    def put(self, query: str, tool_calls: list) -> bool:
+        if not tool_calls:
+            return False
+        plan = [(tc["function"]["name"], tc["function"]["arguments"] or "{}") for tc in tool_calls]
+        if not all(is_read_only(name) for name, _ in plan):
+            self.stats["rejected_mutating"] += 1
+            return False
+        key = self.key(query)
+        self._plans[key] = (time.monotonic(), plan)
+        self._plans.move_to_end(key)
+        self.stats["stored"] += 1
+        while len(self._plans) > self.max_entries:
+            self._plans.popitem(last=False)
+        return True
+
+    def snapshot(self) -> list:
+        # [(key, plan, age in seconds)] of the unexpired plans, for a warm restart
+        now = time.monotonic()
+        return [(key, plan, now - stored_at) for key, (stored_at, plan) in self._plans.items()
+                if now - stored_at <= self.ttl]
+
+    def restore(self, key: str, plan: list, age: float = 0.0):
+        # Reloads a snapshot plan under its key; the key embeds the fingerprint, so
+        # plans made for other tool schemas or another model are never looked up
+        if key in self._plans or age > self.ttl:
+            return
+        self._plans[key] = (time.monotonic() - age, [tuple(step) for step in plan])
+        while len(self._plans) > self.max_entries:
+            self._plans.popitem(last=False)
+
+    def __len__(self):
+        return len(self._plans)
@@ -0,0 +1,394 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from collections import Counter
+from urllib.parse import parse_qsl, urlsplit
+
+from aiohttp import web
+
+from canister_mirror import CanisterMirror
+
+# Local stand-ins for the agent's two upstreams, used by benchmark.py.
+# FakeASI1 speaks the OpenAI-compatible /chat/completions API: the planning
+# turn answers with scripted tool calls, the final turn with filler text
+# (optionally as server-sent events). FakeCanister serves a generated dataset
+# through the canister's HTTP routes, /batch and /changes-since, in the JSON
+# shapes the Motoko canister produces. Writes are acknowledged but not
+# applied, so every run sees the same data. Latencies are configurable.
+
+SKILLS = ["python", "rust", "motoko", "typescript", "react", "solidity", "go", "ui", "ux", "figma",
+          "marketing", "sales", "finance", "legal", "devops", "kubernetes", "ml", "data-science",
+          "writing", "community", "3d-modeling", "unity", "c++", "leadership", "project-management"]
+ROLES = ["Developer", "Designer", "Manager", "Engineer", "Artist", "Marketer", "Analyst", "Scientist"]
+WORDS = ["decentralized", "platform", "for", "open", "talent", "tokenized", "community", "marketplace",
+         "building", "sustainable", "tools", "creators", "funding", "global", "teams", "with", "AI"]
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def build_dataset(projects: int = 200, users: int = 500, messages_per_project: int = 40,
+                  reviews_per_project: int = 5, seed: int = 7) -> dict:
+    # Returns the whole state as one /changes-since change set
+    rng = random.Random(seed)
+    now = time.time_ns()
+    user_list = [{
+        "id": f"user-{i}",
+        "username": f"user{i}",
+        "name": f"User {i}",
+        "role": rng.choice(ROLES),
+        "skills": rng.sample(SKILLS, rng.randint(2, 6)),
+        "portfolioUrl": f"https://portfolio.example/user{i}",
+        "trustScore": rng.randint(0, 100),
+    } for i in range(1, users + 1)]
+    user_ids = [u["id"] for u in user_list]
+
+    project_list, messages, reviews, matches, contracts = [], [], [], [], []
+    application_id = 0
+    for project_id in range(1, projects + 1):
+        team = rng.sample(user_ids, min(len(user_ids), rng.randint(1, 5)))
+        applications = []
+        for applicant in rng.sample(user_ids, min(len(user_ids), rng.randint(0, 4))):
+            application_id += 1
+            applications.append({"id": application_id, "applicant": applicant, "projectId": project_id,
+                                 "message": _sentence(rng, 8), "status": rng.choice(["pending", "accepted"])})
+        tokenized = rng.random() < 0.4
+        total_shares = rng.choice([1000, 5000, 10000]) if tokenized else 0
+        project_list.append({
+            "id": project_id,
+            "owner": team[0],
+            "name": f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS).capitalize()} {project_id}",
+            "vision": _sentence(rng, 24),
+            "team": team,
+            "openRoles": [{"roleName": role, "requiredSkills": rng.sample(SKILLS, rng.randint(2, 4))}
+                          for role in rng.sample(ROLES, rng.randint(1, 3))],
+            "applications": applications,
+            "isTokenized": tokenized,
+            "totalShares": total_shares,
+            "availableShares": total_shares // 2,
+            "pricePerShare": rng.randint(1, 20) if tokenized else 0,
+            "shareBalances": [[member, total_shares // (2 * len(team))] for member in team] if tokenized else [],
+            "projectType": rng.choice(["startup", "freelance"]),
+        })
+        for _ in range(messages_per_project):
+            messages.append({"id": len(messages), "projectId": project_id, "sender": rng.choice(team),
+                             "content": _sentence(rng, rng.randint(4, 30)), "timestamp": now})
+        for _ in range(reviews_per_project):
+            reviews.append({"id": len(reviews), "projectId": project_id, "reviewer": rng.choice(user_ids),
+                            "content": _sentence(rng, 12), "rating": rng.randint(1, 5), "timestamp": now})
+        matches.append({"matchId": len(matches) + 1, "projectId": project_id, "userId": rng.choice(user_ids),
+                        "roleFilled": rng.choice(ROLES), "timestamp": now})
+        contracts.append({"id": project_id, "projectId": project_id, "userId": team[-1],
+                          "terms": _sentence(rng, 16), "status": "active", "nftId": project_id,
+                          "timestamp": now})
+
+    records = len(user_list) + len(project_list) + len(messages) + len(reviews) + len(matches) + len(contracts)
+    return {"version": records, "head": records, "users": user_list, "projects": project_list,
+            "messages": messages, "reviews": reviews, "agentMatches": matches, "contracts": contracts}
+
+
+def _jittered(seconds: float, jitter: float) -> float:
+    return max(0.0, seconds * (1 + random.uniform(-jitter, jitter)))
+
+
+def _params(query: str) -> dict:
+    return {k: (None if v == "" else v) for k, v in parse_qsl(query, keep_blank_values=True)}
+
+
+class FakeCanister:
+    # Record kinds in /changes-since order
+    CHANGE_KINDS = ["users", "projects", "messages", "reviews", "agentMatches", "contracts"]
+
+    def __init__(self, dataset: dict, query_latency: float = 0.005, update_latency: float = 2.0,
+                 jitter: float = 0.2, error_rate: float = 0.0, change_window: int = 0):
+        self.dataset = dataset
+        self.change_window = change_window  # changes kept for /changes-since, like the canister's log; 0 keeps all
+        self.query_latency = query_latency
+        self.update_latency = update_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # Reads are answered by a mirror loaded with the dataset, so pages and
+        # field views match what the agent's own mirror would serve
+        self.store = CanisterMirror(fetch_changes=None)
+        self.store._apply(dataset)
+        self.changes = [(kind, record) for kind in self.CHANGE_KINDS for record in dataset[kind]]
+        self.next_project_id = len(dataset["projects"]) + 1
+        self.requests = Counter()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/{path:.*}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        path = "/" + request.match_info["path"].rstrip("/")
+        body = await request.text()
+        self.requests[path] += 1
+        if random.random() < self.error_rate:
+            return web.json_response({"error": "Injected failure"}, status=503)
+        if path == "/batch":
+            ops = json.loads(body)["ops"]
+            writes = any(op["method"] != "GET" for op in ops)
+            await asyncio.sleep(_jittered(self.update_latency if writes else self.query_latency, self.jitter))
+            results = []
+            for op in ops:
+                url = urlsplit(op["url"])
+                status, result = self.route(op["method"], url.path.rstrip("/"), _params(url.query), op["body"])
+                results.append({"status": status, "body": result})
+            return web.json_response({"results": results})
+
+        latency = self.query_latency if request.method == "GET" else self.update_latency
+        await asyncio.sleep(_jittered(latency, self.jitter))
+        status, result = self.route(request.method, path, _params(request.query_string), body)
+        if request.method != "GET" or status != 200 or path == "/changes-since":
+            return web.json_response(result, status=status)
+        # Writes aren't applied, so a body's hash is a stable ETag
+        etag = '"%s"' % hashlib.sha1(json.dumps(result, sort_keys=True).encode()).hexdigest()[:16]
+        if etag in request.headers.get("If-None-Match", ""):
+            self.requests["not_modified"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.json_response(result, headers={"ETag": etag})
+
+    def route(self, method: str, path: str, params: dict, body: str):
+        # Returns (status, JSON body) for one canister route call
+        name = path.strip("/").replace("-", "_")
+        if method == "GET":
+            if name == "changes_since":
+                return 200, self.changes_since(int(params.get("since") or 0), int(params.get("limit") or 500),
+                                               params.get("cursor"))
+            if name == "get_project_share_balance":
+                project = self.store.projects.get(int(params["projectId"])) or {}
+                balances = dict(project.get("shareBalances") or [])
+                return 200, {"balance": balances.get(params.get("userId"), 0)}
+            if name == "get_matching_projects":
+                return 200, self.matching_projects(params.get("token") or "")
+            hit, result = self.store.query(name, params)
+            return (200, result) if hit else (404, {"error": "Not found"})
+        try:
+            args = json.loads(body or "{}")
+        except ValueError:
+            return 400, {"error": "Invalid JSON"}
+        if name == "login":
+            return 200, {"token": f"session-{args.get('username', 'user')}"}
+        if name == "create_project":
+            self.next_project_id += 1
+            return 200, {"id": self.next_project_id - 1}
+        if name in ("register", "change_password", "update_user_profile", "record_agent_match",
+                    "apply_to_project", "review_application", "send_message", "tokenize_project", "buy_shares",
+                    "withdraw_project_funds", "add_review"):
+            return 200, {"success": True}
+        if name == "create_contract":
+            return 200, {"id": len(self.store.contracts) + 1}
+        return 404, {"error": "Not found"}
+
+    def changes_since(self, since: int, limit: int, cursor: str = None) -> dict:
+        head = len(self.changes)
+        base = max(head - self.change_window, 0) if self.change_window else 0
+        if cursor is None and since >= base:
+            first, last = since, min(since + limit, head)
+            change_set = {"version": last, "head": head, "base": base, "resync": False, "cursor": None}
+        else:
+            # Fallen out of the window: pages of the whole state. Writes aren't applied,
+            # so the log holds every record once, in the canister's resync order.
+            first = int(cursor.split("-")[1]) if cursor else 0
+            last = min(first + limit, head)
+            change_set = {"version": head, "head": head, "base": base, "resync": True,
+                          "cursor": f"{head}-{last}" if last < head else None}
+        change_set.update({kind: [] for kind in self.CHANGE_KINDS})
+        for kind, record in self.changes[first:last]:
+            change_set[kind].append(record)
+        return change_set
+
+    def matching_projects(self, token: str) -> list:
+        # Any token is a session for some user; projects with an open role sharing a skill
+        users = self.dataset["users"]
+        skills = set(users[sum(map(ord, token)) % len(users)]["skills"])
+        return [p for p in self.dataset["projects"]
+                if any(skills & set(role["requiredSkills"]) for role in p["openRoles"])]
+
+
+# Planning-turn script: the first rule whose regex matches the query (case-insensitive,
+# anywhere in the text) supplies the tool calls. "{name}" in an argument is replaced by
+# the named group; a whole-number replacement becomes an int. A rule's optional "then"
+# lists the calls of later rounds, made while tools are still offered; there "{name}"
+# may also name a top-level field of the previous round's results, such as a token.
+DEFAULT_SCRIPT = [
+    {"match": r"log in as (?P<username>\S+) with password (?P<password>\S+) and show my matching projects",
+     "tool_calls": [{"name": "login", "arguments": {"username": "{username}", "password": "{password}"}}],
+     "then": [[{"name": "get_matching_projects", "arguments": {"token": "{token}"}}]]},
+    {"match": r"compare project (?P<a>\d+) and project (?P<b>\d+)",
+     "tool_calls": [{"name": "get_project", "arguments": {"id": "{a}"}},
+                    {"name": "get_project", "arguments": {"id": "{b}"}}]},
+    {"match": r"project (?P<p>\d+) and its reviews",
+     "tool_calls": [{"name": "get_project", "arguments": {"id": "{p}"}},
+                    {"name": "get_project_reviews", "arguments": {"projectId": "{p}"}}]},
+    {"match": r"which projects fit (?P<u>user-\d+)",
+     "tool_calls": [{"name": "get_ranked_matching_projects", "arguments": {"userId": "{u}", "topK": None}}]},
+    {"match": r"who could fill the (?P<role>.+?) role on project (?P<p>\d+)",
+     "tool_calls": [{"name": "get_role_candidates",
+                     "arguments": {"projectId": "{p}", "roleName": "{role}", "topK": None}}]},
+    {"match": r"message to project (?P<p>\d+): (?P<content>[^,]+), token (?P<token>[^\s.]+)",
+     "tool_calls": [{"name": "send_message",
+                     "arguments": {"token": "{token}", "projectId": "{p}", "content": "{content}"}}]},
+    {"match": r"messages (?:in|from) project (?P<p>\d+)",
+     "tool_calls": [{"name": "get_project_messages",
+                     "arguments": {"projectId": "{p}", "offset": None, "limit": None, "fields": None}}]},
+    {"match": r"project (?P<p>\d+)",
+     "tool_calls": [{"name": "get_project", "arguments": {"id": "{p}"}}]},
+    {"match": r"trust (?:score|credit).*?(?P<u>user-\d+)",
+     "tool_calls": [{"name": "get_user_trust_score", "arguments": {"userId": "{u}"}}]},
+    {"match": r"all (?:the )?projects|every project",
+     "tool_calls": [{"name": "get_all_projects", "arguments": {"offset": None, "limit": None, "fields": None}}]},
+]
+
+
+def _fill(value, groups: dict):
+    if isinstance(value, str):
+        whole = re.fullmatch(r"\{(\w+)\}", value)
+        if whole and whole.group(1) in groups:
+            text = groups[whole.group(1)]
+            return int(text) if text.isdigit() else text
+        return re.sub(r"\{(\w+)\}", lambda m: groups.get(m.group(1), m.group(0)), value)
+    return value
+
+
+class FakeASI1:
+    def __init__(self, script: list = None, plan_latency: float = 0.6, answer_latency: float = 0.9,
+                 jitter: float = 0.2, answer_tokens: int = 120, error_rate: float = 0.0):
+        self.script = [(re.compile(rule["match"], re.IGNORECASE), [rule["tool_calls"], *rule.get("then", [])])
+                       for rule in (script or DEFAULT_SCRIPT)]
+        self.plan_latency = plan_latency
+        self.answer_latency = answer_latency
+        self.jitter = jitter
+        self.answer_tokens = answer_tokens
+        self.error_rate = error_rate
+        self.requests = Counter()
+        self._calls = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/chat/completions", self.handle)
+        return app
+
+    def plan(self, query: str, round_index: int = 0, results: list = ()) -> list:
+        # The calls for one round of the first matching rule; results are the
+        # previous round's tool results, whose top-level fields fill placeholders
+        for regex, rounds in self.script:
+            m = regex.search(query)
+            if m:
+                if round_index >= len(rounds):
+                    return []
+                groups = {}
+                for result in results:
+                    if isinstance(result, dict):
+                        groups.update({k: str(v) for k, v in result.items() if isinstance(v, (str, int))})
+                groups.update({k: v for k, v in m.groupdict().items() if v is not None})
+                return [{"name": call["name"],
+                         "arguments": {k: _fill(v, groups) for k, v in call["arguments"].items()}}
+                        for call in rounds[round_index]]
+        return []
+
+    def tool_calls(self, calls: list) -> list:
+        tool_calls = []
+        for call in calls:
+            self._calls += 1
+            tool_calls.append({"id": f"call_{self._calls}", "type": "function",
+                               "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])}})
+        return tool_calls
+
+    def answer(self, messages: list) -> str:
+        tool_chars = sum(len(m.get("content") or "") for m in messages if m.get("role") == "tool")
+        words = [f"Based on {tool_chars} characters of DeForger data, here is a summary."]
+        while len(words) < self.answer_tokens:
+            words.append(WORDS[len(words) % len(WORDS)])
+        return " ".join(words)
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        payload = json.loads(await request.text())
+        messages = payload["messages"]
+        planning = messages[-1]["role"] == "user"
+        stepping = not planning and bool(payload.get("tools"))
+        self.requests["plan" if planning else "step" if stepping else "answer"] += 1
+        if random.random() < self.error_rate:
+            return web.json_response({"error": {"message": "Injected failure"}}, status=503)
+        prompt_tokens = len(json.dumps(payload)) // 4
+
+        if planning:
+            await asyncio.sleep(_jittered(self.plan_latency, self.jitter))
+            tool_calls = self.tool_calls(self.plan(messages[-1]["content"]))
+            message = {"role": "assistant", "content": "" if tool_calls else "I can only help with DeForger."}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            return web.json_response(self._completion(payload, message, prompt_tokens, 20 * len(tool_calls) + 10,
+                                                      "tool_calls" if tool_calls else "stop"))
+
+        if stepping:
+            # A later round of the matching rule, or the answer once the rule is done
+            rounds_done = sum(1 for m in messages if m["role"] == "assistant" and m.get("tool_calls"))
+            results = []
+            for m in reversed(messages):
+                if m["role"] != "tool":
+                    break
+                try:
+                    results.append(json.loads(m["content"]))
+                except ValueError:
+                    pass
+            tool_calls = self.tool_calls(self.plan(messages[0]["content"], rounds_done, results))
+            if tool_calls:
+                await asyncio.sleep(_jittered(self.plan_latency, self.jitter))
+                message = {"role": "assistant", "content": "", "tool_calls": tool_calls}
+                if not payload.get("stream"):
+                    return web.json_response(self._completion(payload, message, prompt_tokens,
+                                                              20 * len(tool_calls) + 10, "tool_calls"))
+                response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+                await response.prepare(request)
+                deltas = [{"index": i, **call} for i, call in enumerate(tool_calls)]
+                event = {"choices": [{"index": 0, "delta": {"tool_calls": deltas}}]}
+                await response.write(f"data: {json.dumps(event)}\n\ndata: [DONE]\n\n".encode())
+                await response.write_eof()
+                return response
+
+        text = self.answer(messages)
+        if not payload.get("stream"):
+            await asyncio.sleep(_jittered(self.answer_latency, self.jitter))
+            return web.json_response(self._completion(
+                payload, {"role": "assistant", "content": text}, prompt_tokens, self.answer_tokens, "stop"))
+
+        # Streamed answers spread the same latency over ~4-word chunks
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        words = text.split(" ")
+        chunks = [" ".join(words[i:i + 4]) + " " for i in range(0, len(words), 4)]
+        delay = _jittered(self.answer_latency, self.jitter) / len(chunks)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            event = {"choices": [{"index": 0, "delta": {"content": chunk}}]}
+            await response.write(f"data: {json.dumps(event)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    @staticmethod
+    def _completion(payload: dict, message: dict, prompt_tokens: int, completion_tokens: int,
+                    finish_reason: str) -> dict:
+        return {
+            "id": f"chatcmpl-{time.monotonic_ns()}",
+            "object": "chat.completion",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+
+async def start_server(app: web.Application, host: str = "127.0.0.1", port: int = 0):
+    # Returns (runner, base_url); port 0 picks a free port
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner, f"http://{host}:{runner.addresses[0][1]}"
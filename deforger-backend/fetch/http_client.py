@@ -0,0 +1,111 @@
+import asyncio
+import json
+import math
+
+import aiohttp
+
+# Shared async HTTP client for the agent's upstreams (ASI1 and the local replica).
+# Each upstream gets its own keep-alive pool so a slow LLM reply can't starve
+# canister calls of connections, and vice versa.
+
+
+class CircuitOpenError(Exception):
+    # Raised without contacting the upstream while its circuit breaker is open
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is temporarily unavailable; retry in {math.ceil(retry_in)}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def is_unavailable(exc: Exception) -> bool:
+    # Connection failures, timeouts, 5xx and open circuits mean the upstream is
+    # down or overloaded; 4xx means the request itself was wrong.
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status >= 500
+    return isinstance(exc, (aiohttp.ClientConnectionError, asyncio.TimeoutError, CircuitOpenError))
+
+
+def error_kind(exc: Exception) -> str:
+    # Coarse error class used as a metrics label
+    if isinstance(exc, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(exc, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return f"http_{exc.status // 100}xx"
+    if isinstance(exc, aiohttp.ClientConnectionError):
+        return "connection"
+    return "other"
+
+
+def is_not_found(exc: Exception) -> bool:
+    return isinstance(exc, aiohttp.ClientResponseError) and exc.status == 404
+
+
+class UpstreamClient:
+    def __init__(self, name: str, base_url: str, headers: dict, limit_per_host: int = 20,
+                 total_timeout: float = 60.0, connect_timeout: float = 5.0, keepalive_timeout: float = 30.0):
+        self.name = name
+        self.base_url = base_url.rstrip("/") if base_url else ""
+        self.headers = headers
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+
+    # The session is created lazily because aiohttp binds it to the running loop,
+    # which only exists once the agent has started.
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit_per_host,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=connector,
+                timeout=self.timeout,
+            )
+        return self._session
+
+    async def get_json(self, path: str, params: dict = None):
+        async with self.session().get(f"{self.base_url}{path}", params=params) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def get_json_conditional(self, path: str, params: dict = None, etag: str = None):
+        # Returns (status, etag, data); with etag sent as If-None-Match, an
+        # unchanged resource comes back as (304, etag, None) without a body
+        headers = {"If-None-Match": etag} if etag else None
+        async with self.session().get(f"{self.base_url}{path}", params=params, headers=headers) as response:
+            if response.status == 304:
+                return 304, response.headers.get("ETag", etag), None
+            response.raise_for_status()
+            return response.status, response.headers.get("ETag"), await response.json(content_type=None)
+
+    async def post_json(self, path: str, payload: dict = None, params: dict = None, data: str = None):
+        # data: an already JSON-encoded body, sent as-is instead of payload
+        kwargs = {"data": data.encode()} if data is not None else {"json": payload}
+        async with self.session().post(f"{self.base_url}{path}", params=params, **kwargs) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def post_sse(self, path: str, payload: dict = None, data: str = None):
+        # Yields the JSON events of a server-sent-events response until [DONE]
+        kwargs = {"data": data.encode()} if data is not None else {"json": payload}
+        async with self.session().post(f"{self.base_url}{path}", **kwargs) as response:
+            response.raise_for_status()
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                yield json.loads(data)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
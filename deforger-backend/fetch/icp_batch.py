@@ -0,0 +1,238 @@
+import asyncio
+import functools
+import json
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlencode
+
+from http_client import is_not_found
+
+# Sends the canister calls of one ASI1 turn as ordered /batch requests.
+# plan() decides where each call goes, without I/O; run() carries the plan out:
+#   local   reads ahead of the first write answered from the mirror or cache
+#   single  reads ahead of the first write that another query already has in
+#           flight or that hold an ETag to revalidate; sent one by one through
+#           call(), so they keep single-flight, retries and conditional GETs
+#   ops     everything else that needs the canister, in order, in batches of at
+#           most max_ops (the canister's maxBatchOps). Batched reads ahead of the
+#           first write are registered in the single-flight group, so identical
+#           concurrent reads join them. Reads after a write are never answered
+#           locally or joined, so they observe it.
+#   after   local tools, run once the canister calls are done
+# Single reads finish before any write is sent. If a batch holding writes fails,
+# its writes may still have been applied: what they make stale is invalidated,
+# and neither they nor anything after them is replayed.
+
+MAX_BATCH_OPS = 32
+
+
+def query_params(args: dict) -> dict:
+    return {k: str(v) if isinstance(v, (int, float)) else v for k, v in args.items()}
+
+
+def batch_op(func_name: str, args: dict) -> dict:
+    url = "/" + func_name.replace("_", "-")
+    if func_name.startswith("get_"):
+        return {"method": "GET", "url": f"{url}?{urlencode(query_params(args))}", "body": ""}
+    return {"method": "POST", "url": url, "body": json.dumps(args)}
+
+
+def _op_error(func_name: str, result: dict) -> Exception:
+    return RuntimeError(f"{func_name} failed with HTTP {result['status']}: {json.dumps(result['body'])}")
+
+
+@dataclass
+class BatchPlan:
+    local: dict = field(default_factory=dict)  # index -> result read locally
+    single: list = field(default_factory=list)  # indexes sent on their own
+    ops: list = field(default_factory=list)  # indexes sent through /batch, in order
+    flights: dict = field(default_factory=dict)  # index in ops -> cache key joiners can share
+    after: list = field(default_factory=list)  # indexes of local tools
+    wrote: bool = False
+
+
+class IcpBatcher:
+    def __init__(self, call, fetch, send, read_locally, after_update, cache, flight, state_version,
+                 local_tools=(), conditional: bool = True, max_ops: int = MAX_BATCH_OPS,
+                 max_concurrency: int = 8):
+        # call: async (func_name, args) -> result, one call with the agent's usual handling
+        # fetch: async (func_name, args, cache_key) -> result, one canister read bypassing flight
+        # send: async (ops, writes) -> /batch response
+        # read_locally: (func_name, args) -> (hit, result)
+        # after_update: (func_name, args, result) after a write; result is None
+        #   when the write may or may not have been applied
+        # state_version: () -> canister version local reads are current to, or None
+        self.call = call
+        self.fetch = fetch
+        self.send = send
+        self.read_locally = read_locally
+        self.after_update = after_update
+        self.cache = cache
+        self.flight = flight
+        self.state_version = state_version
+        self.local_tools = set(local_tools)
+        self.conditional = conditional
+        self.max_ops = max(1, max_ops)
+        self.max_concurrency = max(1, max_concurrency)
+        self.stats = {"batches": 0, "ops": 0, "fallbacks": 0}
+
+    def plan(self, calls: list) -> BatchPlan:
+        # calls: [(func_name, args)] with query arguments already prepared
+        plan = BatchPlan()
+        for index, (func_name, args) in enumerate(calls):
+            if func_name in self.local_tools:
+                plan.after.append(index)
+            elif not func_name.startswith("get_"):
+                plan.wrote = True
+                plan.ops.append(index)
+            elif plan.wrote:
+                plan.ops.append(index)
+            else:
+                hit, result = self.read_locally(func_name, args)
+                if hit:
+                    plan.local[index] = result
+                    continue
+                key = self.cache.make_key(func_name, args)
+                if key in self.flight or (self.conditional and self.cache.validator(key)):
+                    plan.single.append(index)
+                else:
+                    plan.ops.append(index)
+                    plan.flights[index] = key
+        if len(plan.ops) == 1 and not plan.wrote:
+            # Not worth a batch envelope
+            plan.single += plan.ops
+            plan.ops, plan.flights = [], {}
+        return plan
+
+    async def run(self, calls: list) -> list:
+        # Returns (result or exception, seconds, batched) per call, in order.
+        # Batched calls share the batches' duration.
+        plan = self.plan(calls)
+        results = {index: (result, 0.0, False) for index, result in plan.local.items()}
+        chunks = [(plan.ops[i:i + self.max_ops], asyncio.get_running_loop().create_future())
+                  for i in range(0, len(plan.ops), self.max_ops)]
+        # Registered before anything is awaited, so no identical read slips in first
+        flights = self._start_flights(calls, plan, chunks)
+        singles = asyncio.ensure_future(self._run_each(calls, plan.single))
+        if plan.wrote:
+            # Reads ahead of a write must not observe it
+            results.update(await singles)
+        if len(plan.ops) == 1:
+            # A lone write
+            results.update(await self._run_each(calls, plan.ops))
+        elif plan.ops:
+            started = time.perf_counter()
+            outcomes = await self._send_chunks(calls, chunks, flights)
+            for index, task in flights.items():
+                try:
+                    outcomes[index] = await asyncio.shield(task)
+                except Exception as e:
+                    outcomes[index] = e
+            elapsed = time.perf_counter() - started
+            results.update((index, (outcome, elapsed, True)) for index, outcome in outcomes.items())
+        results.update(await singles)
+        results.update(await self._run_each(calls, plan.after))
+        return [results[index] for index in range(len(calls))]
+
+    async def _run_each(self, calls: list, indexes: list) -> dict:
+        # index -> (result or exception, seconds, False), at most max_concurrency at a time
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_one(index: int):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    outcome = await self.call(*calls[index])
+                except Exception as e:
+                    outcome = e
+                return outcome, time.perf_counter() - started, False
+
+        return dict(zip(indexes, await asyncio.gather(*(run_one(index) for index in indexes))))
+
+    def _start_flights(self, calls: list, plan: BatchPlan, chunks: list) -> dict:
+        flights = {}
+        for chunk, sent in chunks:
+            writes = any(not calls[index][0].startswith("get_") for index in chunk)
+            for position, index in enumerate(chunk):
+                key = plan.flights.get(index)
+                if key is not None:
+                    flights[index] = self.flight.start(key, functools.partial(
+                        self._batched_read, *calls[index], key, sent, position, writes))
+        return flights
+
+    async def _batched_read(self, func_name: str, args: dict, key: tuple, sent: asyncio.Future,
+                            position: int, writes: bool):
+        try:
+            response, version, generation = await asyncio.shield(sent)
+        except Exception as e:
+            if writes and not is_not_found(e):
+                raise
+            # Nothing in the batch was applied; read on its own
+            return await self.fetch(func_name, args, key)
+        result = response["results"][position]
+        if result["status"] >= 400:
+            raise _op_error(func_name, result)
+        self.cache.put(key, args, result["body"], version=version, generation=generation)
+        return result["body"]
+
+    async def _send_chunks(self, calls: list, chunks: list, flights: dict) -> dict:
+        # index -> result or exception of every batched call not in flights
+        outcomes = {}
+        failure = None
+        for chunk, sent in chunks:
+            if failure is not None:
+                # An earlier batch's writes may have been applied; nothing after them is sent
+                sent.set_exception(failure)
+                sent.exception()
+                outcomes.update((index, failure) for index in chunk if index not in flights)
+                continue
+            chunk_outcomes, failure = await self._send_chunk(calls, chunk, sent, flights)
+            outcomes.update(chunk_outcomes)
+        return outcomes
+
+    async def _send_chunk(self, calls: list, chunk: list, sent: asyncio.Future, flights: dict) -> tuple:
+        # Returns (index -> outcome of the calls not in flights, exception if writes may be half-applied)
+        writes = [index for index in chunk if not calls[index][0].startswith("get_")]
+        version, generation = self.state_version(), self.cache.generation
+        try:
+            response = await self.send([batch_op(*calls[index]) for index in chunk], bool(writes))
+        except Exception as e:
+            sent.set_exception(e)
+            sent.exception()
+            if writes and not is_not_found(e):
+                for index in writes:
+                    self.after_update(*calls[index], None)
+                return {index: e for index in chunk if index not in flights}, e
+            # Read-only, or a canister without /batch: nothing was applied
+            self.stats["fallbacks"] += 1
+            outcomes = {}
+            for index in chunk:
+                if index not in flights:
+                    try:
+                        outcomes[index] = await self.call(*calls[index])
+                    except Exception as call_error:
+                        outcomes[index] = call_error
+            return outcomes, None
+        sent.set_result((response, version, generation))
+        self.stats["batches"] += 1
+        self.stats["ops"] += len(chunk)
+        outcomes = {}
+        for index, result in zip(chunk, response["results"]):
+            if index in flights:
+                continue
+            func_name, args = calls[index]
+            if result["status"] >= 400:
+                outcomes[index] = _op_error(func_name, result)
+            elif func_name.startswith("get_"):
+                self.cache.put(self.cache.make_key(func_name, args), args, result["body"], version=version,
+                               generation=generation)
+                outcomes[index] = result["body"]
+            else:
+                # Reads after this write in the batch saw it, so they may still be cached,
+                # unless another write was invalidated while the batch was in flight
+                unchanged = self.cache.generation == generation
+                self.after_update(func_name, args, result["body"])
+                if unchanged:
+                    generation = self.cache.generation
+                outcomes[index] = result["body"]
+        return outcomes, None
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+# Deduplicates redelivered chat messages. Mailbox redelivery and client
+# retries can hand the agent the same (sender, msg_id) again; only the first
+# delivery is answered, which keeps a retry from rerunning ASI1 and repeating
+# writes such as buy_shares. The replies sent for it are kept, so a later
+# duplicate gets them again, and one arriving while the original is still in
+# flight waits for them. Completed entries expire after a TTL and are evicted
+# oldest-first beyond max_entries; entries in flight are never evicted.
+# Replies marked private (e.g. ones that may echo a session token) are kept
+# for redelivery but left out of snapshot(), so they never reach disk.
+
+
+class IdempotencyStore:
+    def __init__(self, max_entries: int = 4096, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (completed_at or None, future of the replies)
+        self._private = set()  # keys whose replies are never snapshotted
+        self.stats = {"started": 0, "replayed": 0, "attached": 0, "evicted": 0}
+
+    def begin(self, key: tuple):
+        # Returns None if key is new (the caller must complete() or abandon() it),
+        # else a future of the replies sent for the first delivery
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is not None and time.monotonic() - entry[0] > self.ttl:
+            self._forget(key)
+            entry = None
+        if entry is not None:
+            self.stats["replayed" if entry[1].done() else "attached"] += 1
+            return entry[1]
+        self._entries[key] = (None, asyncio.get_running_loop().create_future())
+        self.stats["started"] += 1
+        return None
+
+    def complete(self, key: tuple, replies: list, private: bool = False):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] is not None:
+            return
+        if private:
+            self._private.add(key)
+        self._entries[key] = (time.monotonic(), entry[1])
+        self._entries.move_to_end(key)
+        entry[1].set_result(list(replies))
+        self._evict()
+
+    def abandon(self, key: tuple):
+        # The message wasn't processed (e.g. shed as busy), so a retry is handled afresh
+        entry = self._entries.pop(key, None)
+        self._private.discard(key)
+        if entry is not None and not entry[1].done():
+            entry[1].set_result(None)
+
+    def snapshot(self) -> list:
+        # [(key, replies, age in seconds)] of the unexpired completed entries
+        now = time.monotonic()
+        return [(key, future.result(), now - completed_at) for key, (completed_at, future) in self._entries.items()
+                if completed_at is not None and now - completed_at <= self.ttl and key not in self._private]
+
+    def restore(self, key: tuple, replies: list, age: float = 0.0):
+        if key in self._entries or age > self.ttl:
+            return
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(list(replies))
+        self._entries[key] = (time.monotonic() - age, future)
+        self._evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self):
+        excess = len(self._entries) - self.max_entries
+        oldest = []
+        for key, (completed_at, _) in self._entries.items():
+            if len(oldest) >= excess:
+                break
+            if completed_at is not None:
+                oldest.append(key)
+        for key in oldest:
+            self._forget(key)
+        self.stats["evicted"] += len(oldest)
+
+    def _forget(self, key: tuple):
+        del self._entries[key]
+        self._private.discard(key)
@@ -0,0 +1,307 @@
+import json
+import re
+from collections import Counter
+from uuid import uuid4
+
+# Deterministic fast path in front of the first ASI1 completion.
+# Each rule is an anchored regex for a phrasing we see often (see the sample
+# queries at the bottom of agent.py) plus a builder for the tool arguments.
+# A query is only routed when exactly one tool matches; anything else falls
+# back to the LLM.
+
+FLAGS = re.IGNORECASE
+
+PROJECT = r"project\s*(?:id\s*|with\s+id\s+|#)?(?P<projectId>\d+)"
+USER = r"(?:user\s*id\s+|user\s+)?(?P<userId>user-\d+)"
+TOKEN = r",?\s*(?:(?:with|using)\s+)?(?:session\s+)?token\s+(?P<token>[^\s,]+)"
+ASK = r"(?:what\s+are|what's|whats|what\s+is|list|show(?:\s+me)?|get|retrieve|give\s+me|display)"
+
+
+def _int(value: str) -> int:
+    return int(value)
+
+
+def _skills(value: str) -> list:
+    return [s for s in re.split(r"[\s,]+|\band\b", value) if s]
+
+
+def _split_segments(body: str) -> list:
+    # Split on commas that are not inside double quotes
+    parts = re.split(r',\s*(?=(?:[^"]*"[^"]*")*[^"]*$)', body)
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _parse_fields(body: str, aliases: dict, fields: dict = None):
+    # Every comma-separated segment must start with a known key, otherwise
+    # the query is not "simple" enough to route without the LLM.
+    fields = dict(fields or {})
+    for segment in _split_segments(body):
+        segment = re.sub(r"^(?:and|with|using)\s+", "", segment, flags=FLAGS)
+        for key, alias in aliases.items():
+            m = re.fullmatch(rf"(?:{alias})\s*[:=]?\s+(.+)", segment, FLAGS)
+            if m:
+                if key in fields:
+                    return None
+                fields[key] = m.group(1).strip()
+                break
+        else:
+            return None
+    return fields
+
+
+class Rule:
+    def __init__(self, tool: str, pattern: str, build=None):
+        self.tool = tool
+        self.regex = re.compile(pattern, FLAGS)
+        self.build = build or self._groups
+
+    @staticmethod
+    def _groups(m: re.Match) -> dict:
+        args = {}
+        for k, v in m.groupdict().items():
+            if v is None:
+                continue
+            args[k] = _int(v) if k in ("projectId", "contractId", "applicationId", "numShares",
+                                       "totalShares", "pricePerShare", "rating") else v.strip()
+        return args
+
+    def match(self, text: str):
+        m = self.regex.fullmatch(text)
+        if not m:
+            return None
+        return self.build(m)
+
+
+def _register(m: re.Match):
+    fields = {"username": m.group("username")} if m.groupdict().get("username") else {}
+    fields = _parse_fields(m.group("body"), {
+        "username": r"username",
+        "password": r"password",
+        "name": r"full\s+name|name",
+        "role": r"role",
+        "skills": r"skills",
+        "portfolioUrl": r"portfolio(?:\s*url)?",
+    }, fields)
+    if not fields or len(fields) != 6:
+        return None
+    fields["skills"] = _skills(fields["skills"])
+    return fields
+
+
+def _register_with_password(m: re.Match):
+    # "Sign up as charlie with password secure, name ..."
+    body = f"password {m.group('password')}, {m.group('body')}"
+    fields = _parse_fields(body, {
+        "password": r"password",
+        "name": r"full\s+name|name",
+        "role": r"role",
+        "skills": r"skills",
+        "portfolioUrl": r"portfolio(?:\s*url)?",
+    }, {"username": m.group("username")})
+    if not fields or len(fields) != 6:
+        return None
+    fields["skills"] = _skills(fields["skills"])
+    return fields
+
+
+def _update_profile(m: re.Match):
+    fields = {"token": m.group("token")} if m.groupdict().get("token") else {}
+    fields = _parse_fields(m.group("body"), {
+        "token": r"(?:session\s+)?token",
+        "name": r"full\s+name|name",
+        "role": r"role",
+        "skills": r"skills",
+        "portfolioUrl": r"portfolio(?:\s*url)?",
+    }, fields)
+    if not fields or len(fields) != 5:
+        return None
+    fields["skills"] = _skills(fields["skills"])
+    return fields
+
+
+def _create_project(m: re.Match):
+    segments = _split_segments(m.group("body"))
+    if not segments:
+        return None
+    aliases = {
+        "name": r"name|named|title|titled|called",
+        "vision": r"vision|description",
+        "openRoles": r"open\s*roles|roles\s+needed|roles",
+        "projectType": r"project\s*type|type",
+        "token": r"(?:session\s+)?token",
+    }
+    role_pattern = r'(?P<role>[\w+#. -]+?)\s+"(?P<skills>[^"]*)"'
+    fields = {}
+    # The first segment may be the bare project name ("Initiate project Eco Friendly")
+    if not any(re.match(rf"(?:{a})\s", segments[0], FLAGS) for a in aliases.values()):
+        fields["name"] = segments.pop(0)
+    roles = None
+    for segment in segments:
+        segment = re.sub(r"^(?:and|with|using)\s+", "", segment, flags=FLAGS)
+        role = re.fullmatch(role_pattern, segment, FLAGS)
+        if roles is not None and role and not any(re.match(rf"(?:{a})\s", segment, FLAGS) for a in aliases.values()):
+            roles.append({"roleName": role.group("role").strip(), "requiredSkills": _skills(role.group("skills"))})
+            continue
+        for key, alias in aliases.items():
+            km = re.fullmatch(rf"(?:{alias})\s*[:=]?\s+(.+)", segment, FLAGS)
+            if km:
+                if key in fields:
+                    return None
+                if key == "openRoles":
+                    role = re.fullmatch(role_pattern, km.group(1).strip(), FLAGS)
+                    if not role:
+                        return None
+                    roles = [{"roleName": role.group("role").strip(), "requiredSkills": _skills(role.group("skills"))}]
+                    fields[key] = roles
+                else:
+                    roles = None
+                    fields[key] = km.group(1).strip()
+                break
+        else:
+            return None
+    if len(fields) != 5:
+        return None
+    fields["projectType"] = fields["projectType"].lower()
+    if fields["projectType"] not in ("startup", "freelance"):
+        return None
+    return fields
+
+
+def _record_match(m: re.Match):
+    fields = _parse_fields(m.group("body"), {
+        "projectId": r"project\s*id|project",
+        "userId": r"(?:matched\s+)?user\s*id|(?:matched\s+)?user",
+        "roleFilled": r"(?:filling\s+)?role\s*filled|(?:filling\s+)?role",
+        "token": r"(?:session\s+)?token",
+    })
+    if not fields or len(fields) != 4 or not fields["projectId"].isdigit():
+        return None
+    fields["projectId"] = int(fields["projectId"])
+    return fields
+
+
+def _project_id(m: re.Match):
+    # get_project takes the project ID as "id"
+    return {"id": int(m.group("projectId"))}
+
+
+def _review_by_verb(m: re.Match):
+    accept = m.group("verb").lower() in ("accept", "approve")
+    explicit = m.group("accept")
+    if explicit is not None and (explicit.lower() == "true") != accept:
+        return None
+    return {
+        "token": m.group("token"),
+        "applicationId": int(m.group("applicationId")),
+        "accept": "true" if accept else "false",
+    }
+
+
+def _review_explicit(m: re.Match):
+    return {
+        "token": m.group("token"),
+        "applicationId": int(m.group("applicationId")),
+        "accept": m.group("accept").lower(),
+    }
+
+
+def _add_review(m: re.Match):
+    return {
+        "token": m.group("token"),
+        "projectId": int(m.group("projectId") or m.group("projectId2")),
+        "content": m.group("content").strip(),
+        "rating": int(m.group("rating")),
+    }
+
+
+RULES = [
+    # Reads
+    Rule("get_all_projects", rf"{ASK}\s+(?:all|every)\s+(?:the\s+)?projects?(?:\s+available)?"),
+    Rule("get_project", rf"(?:what's|whats|what\s+is|what\s+are)\s+the\s+(?:details|info|information)\s+(?:of|on|for|about)\s+{PROJECT}", _project_id),
+    Rule("get_project", rf"(?:get|show|retrieve|give\s+me)\s+(?:me\s+)?(?:the\s+)?(?:details|info|information)\s+(?:of|on|for|about)\s+{PROJECT}", _project_id),
+    Rule("get_project", rf"(?:get|show|retrieve)\s+(?:me\s+)?{PROJECT}(?:\s+details)?", _project_id),
+    Rule("get_user_profile", rf"(?:get|show|retrieve)\s+(?:me\s+)?(?:the\s+)?(?:user\s+)?profile\s+(?:(?:for|of)\s+)?{USER}"),
+    Rule("get_user_profile", rf"(?:what's|whats|what\s+is)\s+the\s+(?:info|information|profile)\s+(?:on|for|of)\s+{USER}"),
+    Rule("get_project_messages", rf"{ASK}\s+(?:the\s+)?(?:messages|chat|chats)\s+(?:in|for|from|of)\s+{PROJECT}"),
+    Rule("get_project_messages", rf"{ASK}\s+{PROJECT}\s+(?:messages|chat)"),
+    Rule("get_project_reviews", rf"{ASK}\s+(?:the\s+)?reviews\s+(?:in|for|from|of)\s+{PROJECT}"),
+    Rule("get_project_reviews", rf"{ASK}\s+{PROJECT}\s+reviews"),
+    Rule("get_all_agent_matches", rf"{ASK}\s+(?:all|every)\s+(?:the\s+)?(?:agent\s+)?match(?:es)?"),
+    Rule("get_project_share_balance", rf"{ASK}\s+(?:the\s+)?share\s+balance\s+(?:for|of)\s+{USER}\s+(?:in|for)\s+{PROJECT}"),
+    Rule("get_project_share_balance", rf"(?:get|show)\s+(?:the\s+)?shares\s+(?:of|for)\s+{USER}\s+in\s+{PROJECT}"),
+    Rule("get_project_share_balance", rf"how\s+many\s+shares\s+does\s+{USER}\s+(?:have|own|hold)\s+in\s+{PROJECT}"),
+    Rule("get_matching_projects", rf"(?:show(?:\s+me)?|list|get|find)\s+(?:the\s+)?projects\s+(?:that\s+)?match(?:ing)?\s+my\s+skills{TOKEN}"),
+    Rule("get_matching_projects", rf"what\s+projects\s+can\s+i\s+join(?:\s+based\s+on\s+my\s+skills)?{TOKEN}"),
+    Rule("get_matching_projects", rf"recommended\s+projects(?:\s+for\s+me)?{TOKEN}"),
+    Rule("get_contract", r"(?:get|show|retrieve)\s+(?:me\s+)?(?:the\s+)?(?:details\s+(?:of|for)\s+)?contract\s*(?:id\s*|with\s+id\s+|#)?(?P<contractId>\d+)(?:\s+(?:details|information|info))?"),
+    Rule("get_user_trust_score", rf"{ASK}\s+(?:the\s+)?trust\s+(?:score|credit)\s+(?:for|of)\s+{USER}"),
+
+    # Updates
+    Rule("register", r"(?:register(?:\s+me)?(?:\s+with)?|create\s+(?:a\s+)?(?:new\s+)?account|sign\s+up)\s*:?\s*(?P<body>.+)", _register),
+    Rule("register", r"sign\s+up\s+as\s+(?P<username>[^\s,]+)\s+with\s+password\s+(?P<password>[^\s,]+),\s*(?P<body>.+)", _register_with_password),
+    Rule("login", r"(?:log\s+me\s+in|log\s+in|sign\s+(?:me\s+)?in|authenticate)(?:\s+user)?(?:\s+(?:with|as))?\s+(?:username\s+)?(?P<username>[^\s,]+)(?:,\s*|\s+(?:and|with)\s+)password\s+(?P<password>\S+)"),
+    Rule("change_password", rf"(?:change|update|set)\s+(?:my\s+)?(?:new\s+)?password\s+(?:to\s+)?(?P<newPassword>[^\s,]+){TOKEN}"),
+    Rule("change_password", r"(?:change|update)\s+password\s+for\s+(?:current\s+)?session\s+token\s+(?P<token>[^\s,]+)\s+to\s+(?P<newPassword>\S+)"),
+    Rule("update_user_profile", r"(?:update\s+my\s+profile|update\s+profile|change\s+profile\s+details|modify\s+user\s+info)(?:\s+with\s+token\s+(?P<token>[^\s:,]+))?\s*[:\-]?\s*(?P<body>.+)", _update_profile),
+    Rule("create_project", r"(?:create\s+(?:a\s+)?(?:new\s+)?project|start\s+(?:a\s+)?new\s+project|initiate\s+project)\s*:?\s*(?P<body>.+)", _create_project),
+    Rule("record_agent_match", r"(?:record\s+(?:agent\s+)?match\s+for|add\s+agent\s+match|log\s+agent\s+connection\s+for)\s*:?\s*(?P<body>.+)", _record_match),
+    Rule("apply_to_project", rf"(?:apply\s+to|submit\s+(?:an\s+)?application\s+(?:for|to)|send\s+(?:an\s+)?application\s+to)\s+{PROJECT}(?:\s+with\s+(?:message|cover\s+letter)|,\s*(?:message|cover\s+letter)|:\s*(?:message\s+)?)\s*(?P<message>.+?){TOKEN}"),
+    Rule("review_application", rf"review\s+(?:application|app)\s*(?:id\s*)?(?P<applicationId>\d+),?\s*accept\s+(?P<accept>true|false){TOKEN}", _review_explicit),
+    Rule("review_application", rf"(?P<verb>accept|reject|approve|decline)\s+(?:application|app)\s*(?:id\s*)?(?P<applicationId>\d+)(?:,?\s*accept\s+(?P<accept>true|false))?{TOKEN}", _review_by_verb),
+    Rule("send_message", rf"(?:send\s+(?:a\s+)?message\s+to|post\s+(?:a\s+)?(?:chat|message)\s+in|message)\s+{PROJECT}(?::\s*|,?\s*content\s+)(?P<content>.+?){TOKEN}"),
+    Rule("tokenize_project", rf"tokenize\s+{PROJECT}\s+with\s+total\s*shares\s+(?P<totalShares>\d+),?\s*(?:and\s+)?price\s*per\s*share\s+(?P<pricePerShare>\d+){TOKEN}"),
+    Rule("tokenize_project", rf"enable\s+tokenization\s+for\s+{PROJECT},?\s*(?P<totalShares>\d+)\s+shares\s+at\s+(?P<pricePerShare>\d+)\s+each{TOKEN}"),
+    Rule("tokenize_project", rf"set\s+up\s+shares\s+for\s+{PROJECT}:?\s*total\s+(?P<totalShares>\d+),?\s*price\s+(?P<pricePerShare>\d+){TOKEN}"),
+    Rule("buy_shares", rf"(?:buy|purchase|acquire)\s+(?P<numShares>\d+)\s+shares\s+(?:in|of|for)\s+{PROJECT}{TOKEN}"),
+    Rule("buy_shares", rf"(?:buy|purchase)\s+num\s*shares\s+(?P<numShares>\d+)\s+(?:for|in)\s+{PROJECT}{TOKEN}"),
+    Rule("withdraw_project_funds", rf"(?:withdraw|pull|extract)\s+(?:the\s+)?(?:funds|earnings)\s+(?:from|for)\s+{PROJECT}{TOKEN}"),
+    Rule("withdraw_project_funds", rf"(?:withdraw|pull|extract)\s+{PROJECT}\s+(?:funds|earnings){TOKEN}"),
+    Rule("add_review", rf"(?:add\s+(?:a\s+)?review\s+to|review|submit\s+(?:a\s+)?(?:project\s+)?review\s+for)\s+(?:{PROJECT}|id\s+(?P<projectId2>\d+))(?::\s*|,?\s*content\s+)(?P<content>.+?),?\s*rating\s+(?P<rating>[1-5]){TOKEN}", _add_review),
+    Rule("create_contract", rf"(?:create|draft|initiate)\s+(?:an?\s+)?(?:nft\s+)?contract(?:\s+for|:)\s*{PROJECT}(?:,\s*|\s+and\s+){USER}\s*[:,]?\s*terms\s+(?P<terms>.+?){TOKEN}"),
+]
+
+
+def normalize_query(query: str, strip_punctuation: bool = True) -> str:
+    text = query.strip().replace("’", "'")
+    text = re.sub(r"\s+", " ", text)
+    return re.sub(r"[.!?\s]+$", "", text) if strip_punctuation else text
+
+
+class IntentRouter:
+    def __init__(self, tool_names, rules=None):
+        known = set(tool_names)
+        self.rules = [r for r in (rules or RULES) if r.tool in known]
+        self.stats = {"queries": 0, "routed": 0, "fallback": 0, "ambiguous": 0}
+        self.routed_by_tool = Counter()
+
+    @property
+    def hit_rate(self) -> float:
+        return self.stats["routed"] / self.stats["queries"] if self.stats["queries"] else 0.0
+
+    def route(self, query: str):
+        # Returns ASI1-style tool_calls for a confidently recognized query, else None
+        self.stats["queries"] += 1
+        raw, text = normalize_query(query, strip_punctuation=False), normalize_query(query)
+        matches = {}
+        for rule in self.rules:
+            try:
+                # The unstripped text first, so a password, URL or message that ends
+                # the query keeps its trailing punctuation
+                args = rule.match(raw)
+                if args is None and text != raw:
+                    args = rule.match(text)
+            except (ValueError, KeyError):
+                args = None
+            if args is not None:
+                matches.setdefault(rule.tool, args)
+        if len(matches) != 1:
+            self.stats["ambiguous" if matches else "fallback"] += 1
+            return None
+        tool, args = next(iter(matches.items()))
+        self.stats["routed"] += 1
+        self.routed_by_tool[tool] += 1
+        return [{
+            "id": f"route_{uuid4().hex[:24]}",
+            "type": "function",
+            "function": {"name": tool, "arguments": json.dumps(args)}
+        }]
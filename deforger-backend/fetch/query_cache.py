@@ -0,0 +1,187 @@
+import json
+import time
+from collections import OrderedDict
+
+# In-process read-through cache for get_* canister queries.
+# Entries are keyed on function name plus normalized arguments, expire after a
+# TTL, and are evicted LRU-first once either the entry or byte cap is reached.
+# Values are kept as JSON text so callers can't mutate a cached result.
+# Entries stored with the canister's ETag outlive their TTL as validators: an
+# expired entry is revalidated with If-None-Match and, on a 304, served again.
+# Entries also record the canister state version the fetch started at (if
+# known), so a snapshot of them can be reloaded after a restart only while the
+# canister hasn't moved on since.
+# Every invalidation bumps a generation counter. A caller reads it before its
+# request and passes it to put(), which drops the result if a write was
+# invalidated in between, since the body may predate that write. Null and
+# error bodies are never cached.
+
+# Mutating tool -> get_* entries it makes stale. The second element names the
+# argument that must match between the mutation and the cached query; None
+# drops every entry of that function.
+INVALIDATIONS = {
+    "register": [("get_user_profile", None)],
+    "change_password": [("get_user_profile", None)],
+    "update_user_profile": [("get_user_profile", None), ("get_matching_projects", None)],
+    "create_project": [("get_all_projects", None), ("get_project", None), ("get_matching_projects", None)],
+    "record_agent_match": [("get_project", "projectId"), ("get_all_projects", None),
+                           ("get_all_agent_matches", None), ("get_matching_projects", None)],
+    "apply_to_project": [("get_project", "projectId"), ("get_all_projects", None),
+                         ("get_matching_projects", None)],
+    "review_application": [("get_project", None), ("get_all_projects", None), ("get_matching_projects", None)],
+    "send_message": [("get_project_messages", "projectId")],
+    "tokenize_project": [("get_project", "projectId"), ("get_all_projects", None),
+                         ("get_project_share_balance", "projectId"), ("get_matching_projects", None)],
+    "buy_shares": [("get_project_share_balance", "projectId"), ("get_project", "projectId"),
+                   ("get_all_projects", None), ("get_matching_projects", None)],
+    "add_review": [("get_project_reviews", "projectId"), ("get_user_trust_score", None),
+                   ("get_user_profile", None)],
+    "create_contract": [("get_contract", None)],
+}
+
+
+def normalize_args(args: dict) -> dict:
+    normalized = {}
+    for k, v in (args or {}).items():
+        if isinstance(v, float) and v.is_integer():
+            v = int(v)
+        elif isinstance(v, str):
+            v = v.strip()
+        normalized[k] = v
+    return normalized
+
+
+def is_successful(result) -> bool:
+    # The canister reports failed updates as 200 with an "error" field
+    return not (isinstance(result, dict) and "error" in result)
+
+
+class QueryCache:
+    def __init__(self, ttl: float = 30.0, max_entries: int = 1024, max_bytes: int = 8 * 1024 * 1024,
+                 stale_ttl: float = 0.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()  # key -> (stored_at, args, text, etag, version)
+        self._bytes = 0
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0, "stale_hits": 0, "evictions": 0, "invalidations": 0,
+                      "revalidated": 0, "stale_puts": 0}
+
+    @staticmethod
+    def make_key(func_name: str, args: dict) -> tuple:
+        return func_name, json.dumps(normalize_args(args), sort_keys=True, separators=(",", ":"))
+
+    def get(self, key: tuple, allow_stale: bool = False):
+        entry = self._entries.get(key)
+        if entry is None:
+            if not allow_stale:
+                self.stats["misses"] += 1
+            return False, None
+        stored_at, _, text, etag, _ = entry
+        age = time.monotonic() - stored_at
+        if age <= self.ttl:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return True, json.loads(text)
+        if allow_stale and age <= self.ttl + self.stale_ttl:
+            self.stats["stale_hits"] += 1
+            return True, json.loads(text)
+        if not allow_stale:
+            self.stats["misses"] += 1
+            # Keep the expired entry around while it can still be served stale or revalidated
+            if age > self.ttl + self.stale_ttl and etag is None:
+                self._remove(key)
+        return False, None
+
+    def validator(self, key: tuple):
+        # The ETag of the entry under key, fresh or not; None if there is none
+        entry = self._entries.get(key)
+        return entry[3] if entry is not None else None
+
+    def revalidate(self, key: tuple):
+        # After a 304: restarts the entry's TTL and returns (hit, value)
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        _, args, text, etag, version = entry
+        self._entries[key] = (time.monotonic(), args, text, etag, version)
+        self._entries.move_to_end(key)
+        self.stats["revalidated"] += 1
+        return True, json.loads(text)
+
+    def put(self, key: tuple, args: dict, value, etag: str = None, version: int = None, generation: int = None):
+        # generation: self.generation as read before the request that produced value
+        if generation is not None and generation != self.generation:
+            self.stats["stale_puts"] += 1
+            return
+        if value is None or not is_successful(value):
+            # Misses and errors aren't kept: a later write may make them wrong, and
+            # a write through another client wouldn't invalidate them
+            return
+        self._store(key, time.monotonic(), normalize_args(args), json.dumps(value, separators=(",", ":")),
+                    etag, version)
+
+    def _store(self, key: tuple, stored_at: float, args: dict, text: str, etag: str, version):
+        if len(text) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (stored_at, args, text, etag, version)
+        self._bytes += len(text)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, func_name: str, match: dict = None):
+        self.generation += 1
+        stale = [
+            key for key, (_, args, _, _, _) in self._entries.items()
+            if key[0] == func_name and all(args.get(k) == v for k, v in (match or {}).items())
+        ]
+        for key in stale:
+            self._remove(key)
+        self.stats["invalidations"] += len(stale)
+
+    def invalidate_for(self, func_name: str, args: dict, result):
+        if not is_successful(result):
+            return
+        # Bumped even when nothing is cached yet, for reads still in flight
+        self.generation += 1
+        normalized = normalize_args(args)
+        for target, arg_name in INVALIDATIONS.get(func_name, []):
+            if arg_name is None or arg_name not in normalized:
+                self.invalidate(target)
+            else:
+                self.invalidate(target, {arg_name: normalized[arg_name]})
+
+    def snapshot(self) -> list:
+        # [(key, args, text, etag, version)] of the entries worth keeping across
+        # a restart: those still fresh or revalidatable
+        now = time.monotonic()
+        return [(key, args, text, etag, version)
+                for key, (stored_at, args, text, etag, version) in self._entries.items()
+                if etag is not None or now - stored_at <= self.ttl]
+
+    def restore(self, key: tuple, args: dict, text: str, etag: str = None, version: int = None,
+                fresh: bool = False):
+        # Reloads a snapshot entry: fresh ones get a new TTL, the rest only serve
+        # as validators for their next revalidation
+        if key in self._entries:
+            return
+        stored_at = time.monotonic() - (0.0 if fresh else self.ttl + self.stale_ttl + 1.0)
+        self._store(key, stored_at, args, text, etag, version)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key: tuple):
+        _, _, text, _, _ = self._entries.pop(key)
+        self._bytes -= len(text)
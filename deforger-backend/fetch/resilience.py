@@ -0,0 +1,128 @@
+import asyncio
+import random
+import time
+from collections import Counter
+
+from http_client import CircuitOpenError, error_kind, is_unavailable
+
+# Deadlines, retries and circuit breaking for the agent's upstreams.
+# Each upstream has one CircuitBreaker: after failure_threshold consecutive
+# unavailability errors it opens and fails fast for reset_timeout seconds,
+# then lets a single probe through (half-open) to decide whether to close.
+# RetryPolicy retries unavailability errors with full-jitter backoff, but only
+# within an overall deadline, so a retry never stretches the tail further than
+# the caller allowed. Only idempotent calls should be retried.
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.stats = {"calls": 0, "failures": 0, "timeouts": 0, "rejected": 0, "opened": 0}
+        self.errors = Counter()  # error_kind -> count, including rejections while open
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def retry_in(self) -> float:
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def before_call(self):
+        state = self.state
+        if state == self.OPEN or (state == self.HALF_OPEN and self._probe_in_flight):
+            self.stats["rejected"] += 1
+            self.errors["circuit_open"] += 1
+            raise CircuitOpenError(self.name, self.retry_in())
+        if state == self.HALF_OPEN:
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self._failures = 0
+        self._probe_in_flight = False
+        self._state = self.CLOSED
+
+    def record_failure(self):
+        self._failures += 1
+        self.stats["failures"] += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.stats["opened"] += 1
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    async def call(self, fn, timeout: float = None):
+        # fn: async () -> result; timeout bounds this single attempt
+        self.before_call()
+        self.stats["calls"] += 1
+        try:
+            result = await (asyncio.wait_for(fn(), timeout) if timeout else fn())
+        except asyncio.CancelledError:
+            self._probe_in_flight = False
+            raise
+        except Exception as e:
+            self.errors[error_kind(e)] += 1
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["timeouts"] += 1
+            if is_unavailable(e):
+                self.record_failure()
+            else:
+                # The upstream answered (e.g. a 4xx), so it's healthy
+                self.record_success()
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "retry_in": round(self.retry_in(), 1) if self._state == self.OPEN else 0.0,
+        }
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.1, max_delay: float = 1.0,
+                 deadline: float = 5.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.stats = {"retries": 0, "gave_up": 0}
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, min(max_delay, base_delay * 2^(attempt - 1))]
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    async def run(self, breaker: CircuitBreaker, fn, attempt_timeout: float):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = self.deadline - (time.monotonic() - started)
+            try:
+                return await breaker.call(fn, min(attempt_timeout, remaining))
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                if not is_unavailable(e):
+                    raise
+                delay = self.backoff(attempt)
+                if attempt >= self.max_attempts or time.monotonic() - started + delay >= self.deadline:
+                    self.stats["gave_up"] += 1
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
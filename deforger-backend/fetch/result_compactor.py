@@ -0,0 +1,123 @@
+import json
+import math
+
+# Shrinks tool results before they are sent back to ASI1 for the final answer.
+# Project listings keep a core set of fields plus the field groups the query
+# asks about; other nested lists become counts. Long lists and strings are
+# then cut at progressively tighter limits until the message fits the token
+# budget. Everything is deterministic, so identical results compact identically.
+# The executor's raw results are untouched; local templates still see them.
+
+PROJECT_FIELDS = ("id", "name", "projectType", "vision", "owner", "openRoles")
+
+# Query keywords -> optional project fields kept when any keyword appears
+PROJECT_FIELD_GROUPS = [
+    (("application", "apply", "applied", "applicant", "pending"), ("applications",)),
+    (("share", "token", "invest", "price", "buy", "stake"),
+     ("isTokenized", "totalShares", "availableShares", "pricePerShare", "shareBalances")),
+    (("team", "member"), ("team",)),
+]
+
+# Nested lists that are replaced by their length when not kept
+PROJECT_COUNTS = {"team": "teamSize", "applications": "applicationCount", "shareBalances": "shareholderCount"}
+
+# Tools whose list results are chronological, so the newest items are kept
+KEEP_NEWEST = {"get_project_messages", "get_project_reviews", "get_all_agent_matches"}
+
+PROJECT_LIST_TOOLS = {"get_all_projects", "get_matching_projects"}
+
+# (max list items, max string chars), tried in order until the result fits
+LIMITS = [(20, 400), (10, 200), (5, 120), (3, 80), (1, 60)]
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for JSON-heavy English text
+    return math.ceil(len(text) / 4)
+
+
+def project_fields(query: str) -> set:
+    query = (query or "").lower()
+    fields = set(PROJECT_FIELDS)
+    for keywords, group in PROJECT_FIELD_GROUPS:
+        if any(keyword in query for keyword in keywords):
+            fields.update(group)
+    return fields
+
+
+def project(item, fields: set):
+    if not isinstance(item, dict):
+        return item
+    projected = {k: v for k, v in item.items() if k in fields}
+    for name, count_name in PROJECT_COUNTS.items():
+        if name in fields:
+            continue
+        if isinstance(item.get(name), list):
+            projected[count_name] = len(item[name])
+        elif count_name in item:
+            # Paged routes already report the count
+            projected[count_name] = item[count_name]
+    return projected
+
+
+def truncate(value, max_items: int, max_chars: int, newest: bool = False):
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else value[:max_chars] + "…"
+    if isinstance(value, dict):
+        return {k: truncate(v, max_items, max_chars) for k, v in value.items()}
+    if isinstance(value, list):
+        kept = value[-max_items:] if newest else value[:max_items]
+        kept = [truncate(v, max_items, max_chars) for v in kept]
+        if len(value) > max_items:
+            note = f"…{len(value) - max_items} {'earlier' if newest else 'more'} item(s) omitted"
+            kept = [note] + kept if newest else kept + [note]
+        return kept
+    return value
+
+
+def shape(data, max_items: int, max_chars: int, newest: bool = False):
+    if isinstance(data, dict) and isinstance(data.get("items"), list):
+        # Pages from the paged routes already carry total and nextOffset
+        return {**data, "items": truncate(data["items"], max_items, max_chars, newest)}
+    # A truncated top-level list is wrapped so the model still sees the real total
+    if not isinstance(data, list) or len(data) <= max_items:
+        return truncate(data, max_items, max_chars, newest)
+    kept = data[-max_items:] if newest else data[:max_items]
+    return {"total": len(data), "shown": len(kept), "items": [truncate(v, max_items, max_chars) for v in kept]}
+
+
+class ResultCompactor:
+    def __init__(self, token_budget: int = 1500):
+        self.token_budget = token_budget
+        self.stats = {"compacted": 0, "over_budget": 0, "chars_saved": 0}
+
+    def compact(self, func_name: str, content: str, query: str = "") -> str:
+        if estimate_tokens(content) <= self.token_budget and func_name not in PROJECT_LIST_TOOLS:
+            return content
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return content
+        if isinstance(data, dict) and "error" in data:
+            return content
+
+        if func_name in PROJECT_LIST_TOOLS:
+            fields = project_fields(query)
+            if isinstance(data, list):
+                data = [project(item, fields) for item in data]
+            elif isinstance(data, dict) and isinstance(data.get("items"), list):
+                data = {**data, "items": [project(item, fields) for item in data["items"]]}
+
+        for max_items, max_chars in LIMITS:
+            shaped = shape(data, max_items, max_chars, newest=func_name in KEEP_NEWEST)
+            compacted = json.dumps(shaped, separators=(",", ":"), ensure_ascii=False)
+            if estimate_tokens(compacted) <= self.token_budget:
+                break
+        else:
+            self.stats["over_budget"] += 1
+            compacted = json.dumps({"truncated": compacted[:self.token_budget * 4]}, ensure_ascii=False)
+
+        if len(compacted) < len(content):
+            self.stats["compacted"] += 1
+            self.stats["chars_saved"] += len(content) - len(compacted)
+            return compacted
+        return content
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+# Fair scheduler for incoming chat queries.
+# Each sender gets a bounded FIFO queue; a global worker limit caps how many
+# conversations run at once, and senders are served round-robin with at most
+# one job in flight per sender (which also keeps a sender's replies in order).
+# submit() returns False when the job can't be queued so the caller can shed
+# load with a fast "busy" reply.
+
+
+class SenderScheduler:
+    def __init__(self, max_workers: int = 16, max_queue_per_sender: int = 4, max_queued: int = 256,
+                 logger=None):
+        self.max_workers = max_workers
+        self.max_queue_per_sender = max_queue_per_sender
+        self.max_queued = max_queued
+        self.logger = logger
+        self._queues = OrderedDict()  # sender -> deque[(enqueued_at, job)], in round-robin order
+        self._running = set()  # senders with a job in flight
+        self._tasks = set()
+        self._queued = 0
+        self._waits = deque(maxlen=1024)  # recent queue wait times (seconds)
+        self.stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    @property
+    def active(self) -> int:
+        return len(self._running)
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def depth(self, sender: str) -> int:
+        return len(self._queues.get(sender, ()))
+
+    def submit(self, sender: str, job) -> bool:
+        # job: async () -> None
+        if self._queued >= self.max_queued or self.depth(sender) >= self.max_queue_per_sender:
+            self.stats["rejected"] += 1
+            return False
+        self._queues.setdefault(sender, deque()).append((time.monotonic(), job))
+        self._queued += 1
+        self.stats["submitted"] += 1
+        self._dispatch()
+        return True
+
+    def _dispatch(self):
+        if len(self._running) >= self.max_workers:
+            return
+        for sender in list(self._queues):
+            if len(self._running) >= self.max_workers:
+                break
+            if sender in self._running:
+                continue
+            queue = self._queues.pop(sender)
+            enqueued_at, job = queue.popleft()
+            self._queued -= 1
+            if queue:
+                # Back of the line for this sender's next job
+                self._queues[sender] = queue
+            self._running.add(sender)
+            task = asyncio.create_task(self._run(sender, enqueued_at, job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, sender: str, enqueued_at: float, job):
+        self._waits.append(time.monotonic() - enqueued_at)
+        try:
+            await job()
+            self.stats["completed"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            if self.logger:
+                self.logger.error(f"Scheduled job for {sender} failed: {str(e)}")
+        finally:
+            self._running.discard(sender)
+            self._dispatch()
+
+    def wait_percentile(self, q: float) -> float:
+        if not self._waits:
+            return 0.0
+        waits = sorted(self._waits)
+        return waits[min(len(waits) - 1, int(q * len(waits)))]
+
+    def metrics(self) -> dict:
+        return {
+            **self.stats,
+            "active": self.active,
+            "queued": self.queued,
+            "senders_waiting": len(self._queues),
+            "max_sender_depth": max((len(q) for q in self._queues.values()), default=0),
+            "wait_p50_ms": self.wait_percentile(0.50) * 1000,
+            "wait_p95_ms": self.wait_percentile(0.95) * 1000,
+            "wait_max_ms": max(self._waits, default=0.0) * 1000,
+        }
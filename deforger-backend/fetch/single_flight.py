@@ -0,0 +1,47 @@
+import asyncio
+
+# Coalesces concurrent identical requests: the first caller for a key starts
+# the work, and callers arriving while it is still in flight await the same
+# task instead of sending their own request. The work runs as its own task, so
+# a cancelled caller doesn't cancel it for the others. Callers share the result
+# object and must not mutate it.
+
+
+class SingleFlight:
+    def __init__(self):
+        self._in_flight = {}  # key -> asyncio.Task
+        self.stats = {"executed": 0, "coalesced": 0}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def __contains__(self, key) -> bool:
+        return key in self._in_flight
+
+    def start(self, key, fn) -> asyncio.Task:
+        # Like do(), but returns the task without awaiting it; await it shielded
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.stats["executed"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        return task
+
+    async def do(self, key, fn):
+        # fn: async () -> result, only called when no identical request is in flight
+        return await asyncio.shield(self.start(key, fn))
+
+    def forget_all(self):
+        # Later callers start fresh requests; tasks already running still finish
+        self._in_flight.clear()
+
+    def _finish(self, key, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,241 @@
+import re
+
+import numpy as np
+from scipy import sparse
+
+# Ranked skill matching between users and projects' open roles.
+# Each open role is one row of a sparse role x skill matrix. Skills are
+# weighted by inverse role frequency, so a rare skill counts for more than one
+# every role asks for. A user's fit for a role is the weighted share of the
+# role's required skills the user has (coverage). A project scores as its
+# best-covered role, with total weighted overlap as the tie-breaker.
+#
+# Updates are incremental. A changed project's old rows are masked out and its
+# new rows appended. The matrix is compacted once masked rows dominate.
+
+
+def normalize_skill(skill: str) -> str:
+    return re.sub(r"[\s_]+", "-", str(skill).strip().lower())
+
+
+def _roles_signature(project: dict) -> tuple:
+    return tuple(
+        (role.get("roleName", ""), tuple(sorted({normalize_skill(s) for s in role.get("requiredSkills") or []})))
+        for role in project.get("openRoles") or []
+    )
+
+
+class SkillMatcher:
+    def __init__(self, compact_ratio: float = 0.5):
+        self.compact_ratio = compact_ratio
+        self.vocabulary = {}  # normalized skill -> column
+        self.skill_names = []  # column -> normalized skill
+        self.projects = {}  # projectId -> {"name", "signature", "rows"}
+        self.users = {}  # userId -> set of columns
+        self._row_roles = []  # row -> (projectId, roleName)
+        self._row_columns = []  # row -> column array
+        self._active = []  # row -> still an open role of its project
+        self._matrix = sparse.csr_matrix((0, 0), dtype=np.float64)  # rows appended since are pending
+        self._row_project_ids = None
+        self._weights = None
+        self._user_matrix = None
+        self._user_ids = []
+        self.stats = {"project_updates": 0, "rows_appended": 0, "compactions": 0}
+
+    def clear(self):
+        self.__init__(self.compact_ratio)
+
+    def _column(self, skill: str) -> int:
+        skill = normalize_skill(skill)
+        column = self.vocabulary.get(skill)
+        if column is None:
+            column = self.vocabulary[skill] = len(self.skill_names)
+            self.skill_names.append(skill)
+        return column
+
+    def _columns(self, skills) -> np.ndarray:
+        return np.array(sorted({self._column(s) for s in skills or []}), dtype=np.int32)
+
+    # Index maintenance
+
+    def update_project(self, project: dict):
+        project_id = project["id"]
+        signature = _roles_signature(project)
+        entry = self.projects.get(project_id)
+        if entry is not None:
+            entry["name"] = project.get("name")
+            if entry["signature"] == signature:
+                return
+            self._deactivate(entry["rows"])
+        rows = []
+        for role in project.get("openRoles") or []:
+            columns = self._columns(role.get("requiredSkills"))
+            if columns.size == 0:
+                continue
+            rows.append(len(self._row_roles))
+            self._row_roles.append((project_id, role.get("roleName", "")))
+            self._row_columns.append(columns)
+            self._active.append(True)
+        self.projects[project_id] = {"name": project.get("name"), "signature": signature, "rows": rows}
+        self._weights = None
+        self.stats["project_updates"] += 1
+        self.stats["rows_appended"] += len(rows)
+
+    def update_user(self, user: dict):
+        self.users[user["id"]] = {self._column(s) for s in user.get("skills") or []}
+        self._user_matrix = None
+
+    def apply_changes(self, change_set: dict):
+        # CanisterMirror listener: feed projects and users from each change set
+        for project in change_set.get("projects") or []:
+            self.update_project(project)
+        for user in change_set.get("users") or []:
+            self.update_user(user)
+
+    def _deactivate(self, rows: list):
+        for row in rows:
+            self._active[row] = False
+        self._weights = None
+
+    def _role_matrix(self) -> sparse.csr_matrix:
+        # Appends pending rows (and any new skill columns) to the matrix
+        width = len(self.skill_names)
+        if self._matrix.shape[1] != width:
+            self._matrix.resize((self._matrix.shape[0], width))
+        built = self._matrix.shape[0]
+        if built < len(self._row_roles):
+            block = self._rows_to_csr(range(built, len(self._row_roles)), width)
+            self._matrix = sparse.vstack([self._matrix, block], format="csr")
+        inactive = len(self._active) - sum(self._active)
+        if inactive and inactive > self.compact_ratio * len(self._active):
+            self._compact()
+        return self._matrix
+
+    def _rows_to_csr(self, rows, width: int) -> sparse.csr_matrix:
+        columns = [self._row_columns[r] for r in rows]
+        indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([c.size for c in columns])
+        indices = np.concatenate(columns) if columns else np.zeros(0, dtype=np.int32)
+        data = np.ones(indices.size, dtype=np.float64)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(columns), width))
+
+    def _compact(self):
+        keep = [row for row, active in enumerate(self._active) if active]
+        remap = {old: new for new, old in enumerate(keep)}
+        self._row_roles = [self._row_roles[r] for r in keep]
+        self._row_columns = [self._row_columns[r] for r in keep]
+        self._active = [True] * len(keep)
+        for entry in self.projects.values():
+            entry["rows"] = [remap[r] for r in entry["rows"]]
+        self._matrix = self._rows_to_csr(range(len(keep)), len(self.skill_names))
+        self._row_project_ids = None
+        self._weights = None
+        self.stats["compactions"] += 1
+
+    def _row_projects(self) -> np.ndarray:
+        if self._row_project_ids is None or self._row_project_ids.size != len(self._row_roles):
+            self._row_project_ids = np.array([p for p, _ in self._row_roles], dtype=np.int64)
+        return self._row_project_ids
+
+    def _skill_weights(self) -> np.ndarray:
+        matrix = self._role_matrix()
+        if self._weights is None or self._weights.size != matrix.shape[1]:
+            active = np.array(self._active, dtype=np.float64)
+            document_frequency = np.asarray(matrix.T @ active).ravel()
+            role_count = max(active.sum(), 1.0)
+            self._weights = np.log1p(role_count / (1.0 + document_frequency)) + 1e-9
+        return self._weights
+
+    def _skill_vector(self, columns) -> np.ndarray:
+        vector = np.zeros(len(self.skill_names), dtype=np.float64)
+        if columns:
+            vector[list(columns)] = 1.0
+        return vector
+
+    # Queries
+
+    def top_projects(self, skills, k: int = 5) -> list:
+        # skills: the user's skill names; returns the k best-fitting projects
+        # Skills no role or user has don't get a column; they can't match anything
+        columns = {self.vocabulary.get(normalize_skill(s)) for s in skills or []} - {None}
+        weights = self._skill_weights()
+        matrix = self._matrix
+        if matrix.shape[0] == 0 or not columns:
+            return []
+        role_totals = matrix @ weights
+        overlap = matrix @ (weights * self._skill_vector(columns))
+        coverage = np.divide(overlap, role_totals, out=np.zeros_like(overlap), where=role_totals > 0)
+        coverage[~np.array(self._active, dtype=bool)] = 0.0
+
+        rows = np.flatnonzero(coverage > 0)
+        if rows.size == 0:
+            return []
+        # Group matching roles by project: best role first within each project
+        projects = self._row_projects()[rows]
+        order = np.lexsort((-overlap[rows], -coverage[rows], projects))
+        rows, projects = rows[order], projects[order]
+        project_ids, first, group = np.unique(projects, return_index=True, return_inverse=True)
+        best_rows = rows[first]
+        total_overlap = np.bincount(group, weights=overlap[rows])
+        ranked = np.lexsort((project_ids, -total_overlap, -coverage[best_rows]))[:k]
+
+        results = []
+        for index in ranked:
+            project_id, role_name = self._row_roles[best_rows[index]]
+            required = self._row_columns[best_rows[index]]
+            results.append({
+                "projectId": project_id,
+                "name": self.projects[project_id]["name"],
+                "bestRole": role_name,
+                "coverage": round(float(coverage[best_rows[index]]), 3),
+                "score": round(float(total_overlap[index]), 3),
+                "matchedSkills": [self.skill_names[c] for c in required if c in columns],
+                "missingSkills": [self.skill_names[c] for c in required if c not in columns],
+            })
+        return results
+
+    def top_candidates(self, project_id: int, role_name: str, k: int = 5, exclude=()) -> list:
+        # Users ranked by weighted coverage of one open role's required skills
+        entry = self.projects.get(project_id)
+        if entry is None:
+            return []
+        self._role_matrix()
+        role_rows = [r for r in entry["rows"] if self._row_roles[r][1].lower() == role_name.lower()]
+        if not role_rows or not self.users:
+            return []
+        required = self._row_columns[role_rows[0]]
+        weights = self._skill_weights()
+        role_vector = np.zeros(len(self.skill_names), dtype=np.float64)
+        role_vector[required] = weights[required]
+        total = role_vector.sum()
+
+        users = self._users_matrix()
+        coverage = (users @ role_vector) / total if total > 0 else np.zeros(users.shape[0])
+        order = np.argsort(-coverage, kind="stable")
+        results = []
+        for index in order:
+            if coverage[index] <= 0 or len(results) >= k:
+                break
+            user_id = self._user_ids[index]
+            if user_id in exclude:
+                continue
+            skills = self.users[user_id]
+            results.append({
+                "userId": user_id,
+                "coverage": round(float(coverage[index]), 3),
+                "matchedSkills": [self.skill_names[c] for c in required if c in skills],
+                "missingSkills": [self.skill_names[c] for c in required if c not in skills],
+            })
+        return results
+
+    def _users_matrix(self) -> sparse.csr_matrix:
+        width = len(self.skill_names)
+        if self._user_matrix is None or self._user_matrix.shape[1] != width:
+            self._user_ids = sorted(self.users)
+            rows, columns = [], []
+            for row, user_id in enumerate(self._user_ids):
+                rows.extend([row] * len(self.users[user_id]))
+                columns.extend(self.users[user_id])
+            self._user_matrix = sparse.csr_matrix(
+                (np.ones(len(rows)), (rows, columns)), shape=(len(self._user_ids), width))
+        return self._user_matrix
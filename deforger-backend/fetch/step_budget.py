@@ -0,0 +1,63 @@
+import json
+import time
+
+from result_compactor import estimate_tokens
+
+# Per-query budget for the agent's tool loop. Each round runs the tool calls of
+# one ASI1 turn; the loop offers tools again only while the query has rounds,
+# wall-clock time and ASI1 tokens left. Once any limit is hit, ASI1 is asked for
+# a final answer without tools, from the results gathered so far. ASI1 calls
+# inside the loop are given the time left as their timeout, so one slow call
+# can't overrun the time limit.
+
+
+def _message_tokens(message: dict) -> int:
+    tokens = estimate_tokens(str(message.get("content") or ""))
+    if message.get("tool_calls"):
+        tokens += estimate_tokens(json.dumps(message["tool_calls"], separators=(",", ":")))
+    return tokens
+
+
+def usage_tokens(response: dict, messages: list = (), tools_json: str = None) -> int:
+    # Tokens an ASI1 completion cost: its reported usage, else (e.g. when
+    # streamed) an estimate from the messages and tool schemas sent and the reply
+    usage = response.get("usage") or {}
+    reported = usage.get("total_tokens") or (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+    if reported:
+        return reported
+    reply = ((response.get("choices") or [{}])[0]).get("message") or {}
+    return sum(_message_tokens(message) for message in [*messages, reply]) + estimate_tokens(tools_json or "")
+
+
+class StepBudget:
+    def __init__(self, max_rounds: int = 4, max_seconds: float = 45.0, max_tokens: int = 12000):
+        # A limit of 0 disables that limit (rounds are always at least 1)
+        self.max_rounds = max(1, max_rounds)
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+        self.rounds = 0
+        self.tokens = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        # Seconds left before the time limit, or None without one
+        if self.max_seconds <= 0:
+            return None
+        return max(self.max_seconds - self.elapsed, 0.0)
+
+    def charge(self, tokens: int):
+        self.tokens += tokens
+
+    def exhausted(self):
+        # Returns the limit that stops another round, or None
+        if self.rounds >= self.max_rounds:
+            return "rounds"
+        if self.max_seconds > 0 and self.elapsed >= self.max_seconds:
+            return "seconds"
+        if self.max_tokens > 0 and self.tokens >= self.max_tokens:
+            return "tokens"
+        return None
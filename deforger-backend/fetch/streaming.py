@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+# Buffers streamed completion text and forwards it to the sender in chunks.
+# A chunk goes out once flush_chars characters are buffered or flush_interval
+# seconds have passed since the last one; the full text is kept for logging.
+# A timer is armed whenever text is waiting, so a stream that stalls still
+# delivers what it has after flush_interval; any flush cancels the timer.
+
+
+class ChunkFlusher:
+    def __init__(self, send, flush_chars: int = 160, flush_interval: float = 0.4):
+        # send: async (text) -> None
+        self.send = send
+        self.flush_chars = flush_chars
+        self.flush_interval = flush_interval
+        self.chunks_sent = 0
+        self._parts = []
+        self._buffer = ""
+        self._last_flush = time.monotonic()
+        self._timer = None  # task flushing the buffer once flush_interval is up
+        self._lock = asyncio.Lock()  # keeps chunks in order when the timer and add() both flush
+
+    @property
+    def streamed(self) -> bool:
+        return self.chunks_sent > 0 or bool(self._buffer)
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts) + self._buffer
+
+    async def add(self, text: str):
+        if not text:
+            return
+        self._buffer += text
+        if len(self._buffer) >= self.flush_chars or time.monotonic() - self._last_flush >= self.flush_interval:
+            await self.flush(at_word_boundary=True)
+        else:
+            self._arm()
+
+    async def flush(self, at_word_boundary: bool = False):
+        self.close()
+        async with self._lock:
+            if not self._buffer:
+                return
+            cut = len(self._buffer)
+            if at_word_boundary:
+                # Hold back a trailing partial word so chunks don't split words
+                space = self._buffer.rfind(" ")
+                if space > 0:
+                    cut = space + 1
+            chunk, self._buffer = self._buffer[:cut], self._buffer[cut:]
+            self._parts.append(chunk)
+            self._last_flush = time.monotonic()
+            self.chunks_sent += 1
+            await self.send(chunk)
+        if self._buffer:
+            self._arm()
+
+    def close(self):
+        # Cancels a pending timed flush; text still buffered stays unsent
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _arm(self):
+        if self._timer is None:
+            delay = max(0.0, self.flush_interval - (time.monotonic() - self._last_flush))
+            self._timer = asyncio.ensure_future(self._flush_later(delay))
+
+    async def _flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        # Detach first, so the flush below doesn't cancel this task mid-send
+        self._timer = None
+        await self.flush(at_word_boundary=True)
@@ -0,0 +1,26 @@
+import pytest
+
+import canister_mirror
+import idempotency
+import query_cache
+import resilience
+
+
+class FakeClock:
+    # Stands in for the `time` module of the stateful pieces, so tests move time forward
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    for module in (canister_mirror, idempotency, query_cache, resilience):
+        monkeypatch.setattr(module, "time", fake)
+    return fake
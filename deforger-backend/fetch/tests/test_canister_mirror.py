@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from canister_mirror import CanisterMirror
+from fake_upstreams import FakeCanister, build_dataset
+
+DATASET = build_dataset(projects=12, users=20, messages_per_project=6, reviews_per_project=2)
+
+
+def mirror_of(canister: FakeCanister, batch_size: int = 25, **kwargs) -> CanisterMirror:
+    async def fetch_changes(since, limit, cursor=None):
+        return canister.changes_since(since, limit, cursor)
+    return CanisterMirror(fetch_changes, batch_size=batch_size, **kwargs)
+
+
+def synced(canister: FakeCanister, **kwargs) -> CanisterMirror:
+    mirror = mirror_of(canister, **kwargs)
+    asyncio.run(mirror.sync())
+    return mirror
+
+
+def test_sync_applies_every_change_in_batches():
+    canister = FakeCanister(DATASET)
+    mirror = synced(canister)
+    assert mirror.version == len(canister.changes)
+    assert mirror.stats["changes"] == len(canister.changes)
+    assert len(mirror.projects) == 12 and len(mirror.users) == 20
+    assert sum(len(m) for m in mirror.messages.values()) == len(DATASET["messages"])
+    assert mirror.is_fresh()
+    assert mirror.query("get_project", {"id": 3}) == (True, mirror.projects[3])
+    assert mirror.query("create_project", {}) == (False, None)
+
+
+def test_pages_mimic_the_canister():
+    mirror = synced(FakeCanister(DATASET))
+    hit, page = mirror.query("get_all_projects", {"offset": 10, "limit": 5, "fields": "name"})
+    assert hit
+    assert [p["id"] for p in page["items"]] == [11, 12]
+    assert page["total"] == 12 and page["nextOffset"] is None
+    assert page["items"][0]["vision"] is None and page["items"][0]["teamSize"] >= 1
+
+
+def test_writes_make_the_mirror_stale_until_the_next_sync(clock):
+    mirror = synced(FakeCanister(DATASET), max_staleness=10.0)
+    mirror.mark_stale()
+    assert not mirror.is_fresh()
+    asyncio.run(mirror.sync())
+    assert mirror.is_fresh()
+    clock.advance(11.0)
+    assert not mirror.is_fresh()
+
+
+def test_a_lagging_mirror_reloads_in_pages_and_matches_a_full_sync():
+    canister = FakeCanister(DATASET)
+    full = synced(canister)
+    windowed = FakeCanister(DATASET, change_window=40)
+    mirror = mirror_of(windowed, batch_size=17)
+    # A snapshot taken at version 10, long since trimmed from the log
+    asyncio.run(mirror.restore(canister.changes_since(0, 10)))
+    asyncio.run(mirror.sync())
+    assert mirror.stats["resyncs"] == 1
+    assert mirror.snapshot() == full.snapshot()
+
+
+def test_changes_repeated_after_a_resync_are_not_applied_twice():
+    canister = FakeCanister(DATASET)
+    mirror = synced(canister)
+    before = mirror.snapshot()
+    mirror._apply({**canister.changes_since(0, len(canister.changes)), "version": mirror.version})
+    assert mirror.snapshot() == before
+
+
+def test_a_failed_resync_leaves_the_mirror_unserved():
+    canister = FakeCanister(DATASET, change_window=40)
+    pages = []
+
+    async def fetch_changes(since, limit, cursor=None):
+        if pages:
+            raise ConnectionError("dropped")
+        pages.append(cursor)
+        return canister.changes_since(since, limit, cursor)
+
+    mirror = CanisterMirror(fetch_changes, batch_size=10)
+    mirror.version = 1  # behind the window
+    with pytest.raises(ConnectionError):
+        asyncio.run(mirror.sync())
+    assert not mirror.is_fresh()
+    assert mirror.version == 0 and mirror.stats["sync_errors"] == 1
+
+
+def test_a_reinstalled_canister_is_mirrored_from_scratch():
+    mirror = synced(FakeCanister(DATASET))
+    smaller = FakeCanister(build_dataset(projects=2, users=3, messages_per_project=1, reviews_per_project=1))
+    mirror.fetch_changes = lambda since, limit, cursor=None: asyncio.sleep(0, smaller.changes_since(since, limit, cursor))
+    asyncio.run(mirror.sync())
+    assert mirror.stats["resets"] == 1
+    assert len(mirror.projects) == 2 and len(mirror.users) == 3
@@ -0,0 +1,15 @@
+from cassette import diff_stages
+
+
+def stage(ms: float) -> dict:
+    return {"mean_ms": ms, "p50_ms": ms, "p95_ms": ms}
+
+
+def test_only_upstream_bound_stages_fail_the_diff():
+    baseline = {"plan": stage(20.0), "tool:get_project": stage(0.05), "tool:batch": stage(30.0)}
+    current = {"plan": stage(20.5), "tool:get_project": stage(4.0), "tool:batch": stage(40.0)}
+    diff, regressions = diff_stages(current, baseline, tolerance=0.1, min_delta_ms=2.0)
+    assert regressions == ["tool:batch"]
+    assert diff["tool:get_project"]["p50_ms"] == [0.05, 4.0, 7900.0]
+    _, regressions = diff_stages(current, baseline, tolerance=0.1, min_delta_ms=2.0, gated=None)
+    assert regressions == ["tool:batch", "tool:get_project"]
@@ -0,0 +1,168 @@
+import asyncio
+
+import aiohttp
+
+from icp_batch import IcpBatcher
+from query_cache import QueryCache
+from single_flight import SingleFlight
+
+
+class FakeCanister:
+    # Answers calls and batches in order, logging what was sent and when it finished
+    def __init__(self, fail_batches=0, error=None):
+        self.log = []
+        self.invalidated = []
+        self.fail_batches = fail_batches
+        self.error = error or RuntimeError("batch trapped")
+
+    async def call(self, func_name, args):
+        self.log.append(("call", func_name))
+        await asyncio.sleep(0.01)
+        self.log.append(("done", func_name))
+        return {"via": "call", "name": func_name}
+
+    async def fetch(self, func_name, args, key):
+        self.log.append(("fetch", func_name))
+        return {"via": "fetch", "name": func_name}
+
+    async def send(self, ops, writes):
+        self.log.append(("batch", [op["url"].split("?")[0] for op in ops]))
+        await asyncio.sleep(0.01)
+        if self.fail_batches:
+            self.fail_batches -= 1
+            raise self.error
+        return {"results": [{"status": 200, "body": {"via": "batch", "url": op["url"]}} for op in ops]}
+
+    def after_update(self, func_name, args, result):
+        self.invalidated.append((func_name, result))
+
+
+def make_batcher(canister, cache=None, flight=None, local=None, max_ops=32):
+    cache = cache or QueryCache()
+    local = local or {}
+    return IcpBatcher(canister.call, canister.fetch, canister.send,
+                      lambda name, args: (name in local, local.get(name)), canister.after_update,
+                      cache, flight or SingleFlight(), lambda: None, local_tools={"get_role_candidates"},
+                      max_ops=max_ops)
+
+
+def run(batcher, calls):
+    return asyncio.run(batcher.run(calls))
+
+
+def test_plan_routes_each_call():
+    cache = QueryCache()
+    cache.put(cache.make_key("get_project", {"id": 2}), {"id": 2}, {}, etag='"e"')
+    batcher = make_batcher(FakeCanister(), cache=cache, local={"get_all_projects": []})
+    plan = batcher.plan([
+        ("get_all_projects", {}),         # local hit
+        ("get_project", {"id": 2}),       # has an ETag: sent on its own
+        ("get_project", {"id": 3}),       # batched, open to joiners
+        ("buy_shares", {"projectId": 3}),
+        ("get_all_projects", {}),         # after a write: never local
+        ("get_role_candidates", {}),      # local tool
+    ])
+    assert plan.local == {0: []}
+    assert plan.single == [1]
+    assert plan.ops == [2, 3, 4]
+    assert list(plan.flights) == [2]
+    assert plan.after == [5]
+    assert plan.wrote
+
+
+def test_single_reads_finish_before_a_lone_write():
+    cache = QueryCache()
+    cache.put(cache.make_key("get_project", {"id": 1}), {"id": 1}, {}, etag='"e"')
+    canister = FakeCanister()
+    results = run(make_batcher(canister, cache=cache),
+                  [("get_project", {"id": 1}), ("buy_shares", {"projectId": 1})])
+    assert canister.log == [("call", "get_project"), ("done", "get_project"),
+                            ("call", "buy_shares"), ("done", "buy_shares")]
+    assert [batched for _, _, batched in results] == [False, False]
+
+
+def test_single_reads_finish_before_a_batch_with_writes():
+    cache = QueryCache()
+    cache.put(cache.make_key("get_project", {"id": 1}), {"id": 1}, {}, etag='"e"')
+    canister = FakeCanister()
+    run(make_batcher(canister, cache=cache),
+        [("get_project", {"id": 1}), ("buy_shares", {"projectId": 1}), ("get_project", {"id": 1})])
+    assert canister.log == [("call", "get_project"), ("done", "get_project"),
+                            ("batch", ["/buy-shares", "/get-project"])]
+
+
+def test_results_come_back_in_call_order_with_one_shared_duration():
+    canister = FakeCanister()
+    results = run(make_batcher(canister), [("get_project", {"id": 1}), ("get_project", {"id": 2}),
+                                           ("get_role_candidates", {})])
+    assert [outcome["via"] for outcome, _, _ in results] == ["batch", "batch", "call"]
+    assert results[0][1] == results[1][1] and results[0][2] and results[1][2]
+    assert not results[2][2]
+
+
+def test_batched_reads_are_joined_by_identical_reads():
+    flight = SingleFlight()
+    canister = FakeCanister()
+    batcher = make_batcher(canister, flight=flight)
+    key = batcher.cache.make_key("get_project", {"id": 1})
+
+    async def scenario():
+        batch = asyncio.ensure_future(batcher.run([("get_project", {"id": 1}), ("get_project", {"id": 2})]))
+        await asyncio.sleep(0)
+        joined = await flight.do(key, lambda: canister.fetch("get_project", {"id": 1}, key))
+        return joined, await batch
+
+    joined, results = asyncio.run(scenario())
+    assert joined == results[0][0]
+    assert flight.stats == {"executed": 2, "coalesced": 1}
+    assert ("fetch", "get_project") not in canister.log
+
+
+def test_turns_are_split_into_batches_of_max_ops():
+    canister = FakeCanister()
+    calls = [("buy_shares", {"projectId": 1})] + [("get_project", {"id": i}) for i in range(4)]
+    results = run(make_batcher(canister, max_ops=2), calls)
+    assert [entry[1] for entry in canister.log] == [["/buy-shares", "/get-project"],
+                                                    ["/get-project", "/get-project"], ["/get-project"]]
+    assert all(not isinstance(outcome, Exception) for outcome, _, _ in results)
+
+
+def test_read_only_batch_failure_falls_back_to_single_reads():
+    canister = FakeCanister(fail_batches=1)
+    batcher = make_batcher(canister)
+    results = run(batcher, [("get_project", {"id": 1}), ("get_project", {"id": 2})])
+    assert [outcome["via"] for outcome, _, _ in results] == ["fetch", "fetch"]
+    assert batcher.stats["fallbacks"] == 1
+
+
+def test_missing_batch_route_falls_back_even_with_writes():
+    error = aiohttp.ClientResponseError(None, (), status=404)
+    canister = FakeCanister(fail_batches=1, error=error)
+    results = run(make_batcher(canister), [("buy_shares", {"projectId": 1}), ("get_project", {"id": 1})])
+    assert [outcome["via"] for outcome, _, _ in results] == ["call", "call"]
+    assert canister.log[1:] == [("call", "buy_shares"), ("done", "buy_shares"),
+                                ("call", "get_project"), ("done", "get_project")]
+
+
+def test_failed_batch_with_writes_invalidates_and_stops():
+    canister = FakeCanister(fail_batches=1)
+    calls = [("get_project", {"id": 9}), ("buy_shares", {"projectId": 1}),
+             ("add_review", {"projectId": 1}), ("get_project", {"id": 1})]
+    results = run(make_batcher(canister, max_ops=3), calls)
+    # The first batch failed: its writes may have been applied, so they aren't replayed
+    assert [entry[0] for entry in canister.log] == ["batch"]
+    assert all(isinstance(outcome, RuntimeError) for outcome, _, _ in results)
+    assert canister.invalidated == [("buy_shares", None), ("add_review", None)]
+
+
+def test_op_errors_are_reported_per_call():
+    canister = FakeCanister()
+
+    async def send(ops, writes):
+        return {"results": [{"status": 200, "body": {"ok": True}}, {"status": 404, "body": {"error": "Not found"}}]}
+
+    canister.send = send
+    results = run(make_batcher(canister), [("buy_shares", {"projectId": 1}), ("get_project", {"id": 7})])
+    assert results[0][0] == {"ok": True}
+    assert isinstance(results[1][0], RuntimeError)
+    assert canister.invalidated == [("buy_shares", {"ok": True})]
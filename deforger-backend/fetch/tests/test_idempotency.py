@@ -0,0 +1,72 @@
+import asyncio
+
+from idempotency import IdempotencyStore
+
+
+def test_duplicates_get_the_first_replies():
+    async def scenario():
+        store = IdempotencyStore()
+        assert store.begin(("alice", "m1")) is None
+        pending = store.begin(("alice", "m1"))  # redelivered while in flight
+        store.complete(("alice", "m1"), ["answer"])
+        return await pending, await store.begin(("alice", "m1")), store.stats
+
+    attached, replayed, stats = asyncio.run(scenario())
+    assert attached == replayed == ["answer"]
+    assert stats == {"started": 1, "replayed": 1, "attached": 1, "evicted": 0}
+
+
+def test_completed_entries_expire_after_the_ttl(clock):
+    async def scenario():
+        store = IdempotencyStore(ttl=60.0)
+        store.begin(("alice", "m1"))
+        store.complete(("alice", "m1"), ["answer"])
+        clock.advance(59.0)
+        kept = store.begin(("alice", "m1")) is not None
+        clock.advance(2.0)
+        return kept, store.begin(("alice", "m1")), store.snapshot()
+
+    kept, again, snapshot = asyncio.run(scenario())
+    assert kept
+    assert again is None  # handled afresh
+    assert snapshot == []  # the fresh delivery is still in flight
+
+
+def test_abandoned_messages_are_handled_afresh():
+    async def scenario():
+        store = IdempotencyStore()
+        store.begin(("alice", "m1"))
+        waiting = store.begin(("alice", "m1"))
+        store.abandon(("alice", "m1"))
+        return await waiting, store.begin(("alice", "m1"))
+
+    assert asyncio.run(scenario()) == (None, None)
+
+
+def test_eviction_skips_entries_in_flight():
+    async def scenario():
+        store = IdempotencyStore(max_entries=2)
+        store.begin(("a", "1"))
+        for key in (("b", "1"), ("c", "1")):
+            store.begin(key)
+            store.complete(key, [key[0]])
+        return store
+
+    store = asyncio.run(scenario())
+    assert len(store) == 2
+    assert store.stats["evicted"] == 1
+    assert [key for key, _, _ in store.snapshot()] == [("c", "1")]
+
+
+def test_private_replies_are_not_snapshotted_and_old_ones_not_restored():
+    async def scenario():
+        store = IdempotencyStore(ttl=60.0)
+        store.begin(("alice", "login"))
+        store.complete(("alice", "login"), ["token abc"], private=True)
+        store.restore(("bob", "m1"), ["hi"], age=10.0)
+        store.restore(("carol", "m1"), ["hi"], age=120.0)
+        return store
+
+    store = asyncio.run(scenario())
+    assert [key for key, _, _ in store.snapshot()] == [("bob", "m1")]
+    assert len(store) == 2
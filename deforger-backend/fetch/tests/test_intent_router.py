@@ -0,0 +1,57 @@
+import json
+
+from intent_router import RULES, IntentRouter
+
+
+def route(query: str):
+    calls = IntentRouter({rule.tool for rule in RULES}).route(query)
+    if calls is None:
+        return None
+    return calls[0]["function"]["name"], json.loads(calls[0]["function"]["arguments"])
+
+
+def test_change_password_keeps_trailing_punctuation():
+    assert route("change password for session token abc to supersecure!") == (
+        "change_password", {"token": "abc", "newPassword": "supersecure!"})
+
+
+def test_login_keeps_trailing_punctuation():
+    assert route("log in as alice with password hunter2!!") == (
+        "login", {"username": "alice", "password": "hunter2!!"})
+
+
+def test_trailing_punctuation_after_ids_is_dropped():
+    assert route("Show project 5?") == ("get_project", {"id": 5})
+    assert route("What is the trust score of user-3?") == ("get_user_trust_score", {"userId": "user-3"})
+
+
+def test_ambiguous_or_unknown_queries_fall_back():
+    router = IntentRouter({rule.tool for rule in RULES})
+    assert router.route("tell me something interesting") is None
+    assert router.stats["fallback"] == 1
+
+
+def test_arguments_are_extracted_and_typed():
+    assert route("buy 10 shares in project 3 with token abc") == (
+        "buy_shares", {"numShares": 10, "projectId": 3, "token": "abc"})
+    assert route("tokenize project 4 with total shares 1000, price per share 5 token tk") == (
+        "tokenize_project", {"projectId": 4, "totalShares": 1000, "pricePerShare": 5, "token": "tk"})
+    assert route("how many shares does user-2 have in project 9") == (
+        "get_project_share_balance", {"userId": "user-2", "projectId": 9})
+    assert route("show contract #12") == ("get_contract", {"contractId": 12})
+
+
+def test_verbs_decide_review_outcomes():
+    assert route("reject application 7 token t1") == (
+        "review_application", {"token": "t1", "applicationId": 7, "accept": "false"})
+    assert route("review application 4, accept true token t2") == (
+        "review_application", {"token": "t2", "applicationId": 4, "accept": "true"})
+
+
+def test_free_text_is_kept_up_to_the_next_field():
+    assert route("send a message to project 2: hello team! token tk") == (
+        "send_message", {"projectId": 2, "content": "hello team!", "token": "tk"})
+    assert route("create contract for project 3, user-4 terms build the MVP token tk") == (
+        "create_contract", {"projectId": 3, "userId": "user-4", "terms": "build the MVP", "token": "tk"})
+    assert route("add a review to project 6: great work, rating 5 token tk") == (
+        "add_review", {"token": "tk", "projectId": 6, "content": "great work", "rating": 5})
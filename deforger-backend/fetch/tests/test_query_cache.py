@@ -0,0 +1,88 @@
+from query_cache import QueryCache
+
+
+def test_null_and_error_bodies_are_not_cached():
+    cache = QueryCache()
+    missing = cache.make_key("get_user_profile", {"userId": "user-9"})
+    failed = cache.make_key("get_project", {"id": 9})
+    cache.put(missing, {"userId": "user-9"}, None)
+    cache.put(failed, {"id": 9}, {"error": "Not found"})
+    assert cache.get(missing) == (False, None)
+    assert cache.get(failed) == (False, None)
+    assert len(cache) == 0
+
+
+def test_register_and_change_password_invalidate_profiles():
+    cache = QueryCache()
+    key = cache.make_key("get_user_profile", {"userId": "user-1"})
+    for func_name in ("register", "change_password"):
+        cache.put(key, {"userId": "user-1"}, {"id": "user-1"})
+        cache.invalidate_for(func_name, {"token": "t"}, True)
+        assert cache.get(key) == (False, None)
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = QueryCache(ttl=30.0)
+    key = cache.make_key("get_project", {"id": 1})
+    cache.put(key, {"id": 1}, {"id": 1})
+    clock.advance(29.0)
+    assert cache.get(key) == (True, {"id": 1})
+    clock.advance(2.0)
+    assert cache.get(key) == (False, None)
+    assert len(cache) == 0
+
+
+def test_expired_entries_with_an_etag_are_kept_for_revalidation(clock):
+    cache = QueryCache(ttl=30.0)
+    key = cache.make_key("get_project", {"id": 1})
+    cache.put(key, {"id": 1}, {"id": 1}, etag='"v1"')
+    clock.advance(60.0)
+    assert cache.get(key) == (False, None)
+    assert cache.validator(key) == '"v1"'
+    assert cache.revalidate(key) == (True, {"id": 1})
+    assert cache.get(key) == (True, {"id": 1})
+
+
+def test_invalidation_matches_on_the_named_argument():
+    cache = QueryCache()
+    for project_id in (1, 2):
+        cache.put(cache.make_key("get_project_messages", {"projectId": project_id}),
+                  {"projectId": project_id}, [])
+    cache.put(cache.make_key("get_all_projects", {}), {}, [])
+    cache.invalidate_for("send_message", {"projectId": 2, "token": "t"}, True)
+    assert cache.get(cache.make_key("get_project_messages", {"projectId": 1}))[0]
+    assert not cache.get(cache.make_key("get_project_messages", {"projectId": 2}))[0]
+    assert cache.get(cache.make_key("get_all_projects", {}))[0]
+
+
+def test_failed_writes_invalidate_nothing():
+    cache = QueryCache()
+    key = cache.make_key("get_project", {"id": 1})
+    cache.put(key, {"id": 1}, {"id": 1})
+    generation = cache.generation
+    cache.invalidate_for("buy_shares", {"projectId": 1}, {"error": "Insufficient shares"})
+    assert cache.generation == generation
+    assert cache.get(key)[0]
+
+
+def test_reads_that_raced_a_write_are_not_cached():
+    cache = QueryCache()
+    key = cache.make_key("get_project", {"id": 1})
+    generation = cache.generation  # read before the request
+    cache.invalidate_for("buy_shares", {"projectId": 1}, True)  # a write lands meanwhile
+    cache.put(key, {"id": 1}, {"id": 1, "availableShares": 10}, generation=generation)
+    assert cache.get(key) == (False, None)
+    assert cache.stats["stale_puts"] == 1
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = QueryCache(max_entries=2)
+    keys = [cache.make_key("get_project", {"id": i}) for i in range(3)]
+    cache.put(keys[0], {"id": 0}, {"id": 0})
+    cache.put(keys[1], {"id": 1}, {"id": 1})
+    cache.get(keys[0])
+    cache.put(keys[2], {"id": 2}, {"id": 2})
+    assert [cache.get(key)[0] for key in keys] == [True, False, True]
+    small = QueryCache(max_bytes=20)
+    small.put(keys[0], {"id": 0}, {"text": "x" * 40})
+    assert len(small) == 0
@@ -0,0 +1,102 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from http_client import CircuitOpenError
+from resilience import CircuitBreaker, RetryPolicy
+
+
+async def fail():
+    raise aiohttp.ClientConnectionError("refused")
+
+
+async def bad_request():
+    raise aiohttp.ClientResponseError(None, (), status=400)
+
+
+async def succeed():
+    return "ok"
+
+
+def call(breaker, fn, timeout=None):
+    return asyncio.run(breaker.call(fn, timeout))
+
+
+def test_opens_after_consecutive_failures_then_fails_fast():
+    breaker = CircuitBreaker("icp", failure_threshold=2, reset_timeout=30.0)
+    for _ in range(2):
+        with pytest.raises(aiohttp.ClientConnectionError):
+            call(breaker, fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        call(breaker, succeed)
+    assert breaker.stats["rejected"] == 1 and breaker.stats["opened"] == 1
+
+
+def test_client_errors_and_successes_reset_the_count():
+    breaker = CircuitBreaker("icp", failure_threshold=2)
+    with pytest.raises(aiohttp.ClientConnectionError):
+        call(breaker, fail)
+    with pytest.raises(aiohttp.ClientResponseError):
+        call(breaker, bad_request)
+    with pytest.raises(aiohttp.ClientConnectionError):
+        call(breaker, fail)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_timeouts_count_as_failures():
+    breaker = CircuitBreaker("asi1", failure_threshold=1)
+    with pytest.raises(asyncio.TimeoutError):
+        call(breaker, lambda: asyncio.sleep(1), timeout=0.01)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.stats["timeouts"] == 1
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("icp", failure_threshold=1, reset_timeout=30.0)
+    with pytest.raises(aiohttp.ClientConnectionError):
+        call(breaker, fail)
+    clock.advance(30.0)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()  # the probe
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("icp", failure_threshold=3, reset_timeout=30.0)
+    for _ in range(3):
+        with pytest.raises(aiohttp.ClientConnectionError):
+            call(breaker, fail)
+    clock.advance(31.0)
+    with pytest.raises(aiohttp.ClientConnectionError):
+        call(breaker, fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.stats["opened"] == 2
+    assert breaker.retry_in() == 30.0
+
+
+def test_retries_only_unavailability_errors():
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise aiohttp.ClientConnectionError("reset")
+        return "ok"
+
+    policy = RetryPolicy(max_attempts=3, base_delay=0.0)
+    assert asyncio.run(policy.run(CircuitBreaker("icp"), flaky, 1.0)) == "ok"
+    assert policy.stats["retries"] == 2
+    attempts.clear()
+
+    async def rejected():
+        attempts.append(1)
+        await bad_request()
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(policy.run(CircuitBreaker("icp"), rejected, 1.0))
+    assert len(attempts) == 1
@@ -0,0 +1,21 @@
+from step_budget import StepBudget, usage_tokens
+
+
+def test_remaining_time_counts_down_to_zero():
+    budget = StepBudget(max_seconds=10.0)
+    budget.started -= 4.0
+    assert 5.9 < budget.remaining() <= 6.0
+    budget.started -= 10.0
+    assert budget.remaining() == 0.0
+    assert budget.exhausted() == "seconds"
+    assert StepBudget(max_seconds=0).remaining() is None
+
+
+def test_streamed_replies_without_usage_are_estimated():
+    reply = {"role": "assistant", "content": "",
+             "tool_calls": [{"id": "1", "type": "function",
+                             "function": {"name": "get_project", "arguments": "{\"id\": 4}"}}]}
+    estimate = usage_tokens({"choices": [{"message": reply}], "usage": {}},
+                            [{"role": "user", "content": "x" * 400}], tools_json="y" * 800)
+    assert estimate > 100 + 200
+    assert usage_tokens({"usage": {"total_tokens": 42}}, [{"content": "x" * 400}]) == 42
@@ -0,0 +1,62 @@
+import pytest
+
+from agent import tools
+from tool_registry import ToolArgumentError, ToolRegistry
+
+registry = ToolRegistry(tools)
+
+
+def test_enum_values_are_coerced_then_matched():
+    args = registry.validate("review_application", {"token": "t", "applicationId": 1, "accept": True})
+    assert args["accept"] == "true"
+    args = registry.validate("review_application", {"token": "t", "applicationId": 1, "accept": " False "})
+    assert args["accept"] == "false"
+
+
+def test_values_outside_the_enum_are_rejected():
+    with pytest.raises(ToolArgumentError) as raised:
+        registry.validate("review_application", {"token": "t", "applicationId": 1, "accept": "maybe"})
+    assert raised.value.problems == [{"field": "accept", "problem": "must be one of 'true', 'false', got 'maybe'"}]
+
+
+def test_numbers_are_coerced_to_nats():
+    args = registry.validate("buy_shares", {"token": "t", "projectId": "3", "numShares": 10.0})
+    assert args == {"token": "t", "projectId": 3, "numShares": 10}
+    assert registry.stats["coerced"] >= 1
+
+
+def test_fractional_negative_and_boolean_numbers_are_rejected():
+    with pytest.raises(ToolArgumentError) as raised:
+        registry.validate("buy_shares", {"token": "t", "projectId": 2.5, "numShares": -1})
+    assert raised.value.problems == [{"field": "projectId", "problem": "must be a whole number, got 2.5"},
+                                     {"field": "numShares", "problem": "must not be negative, got -1"}]
+    with pytest.raises(ToolArgumentError):
+        registry.validate("get_project", {"id": True})
+
+
+def test_nullable_parameters_may_be_left_out():
+    assert registry.validate("get_all_projects", {}) == {"offset": None, "limit": None, "fields": None}
+    assert registry.validate("get_all_projects", {"limit": "20"})["limit"] == 20
+
+
+def test_nested_objects_and_string_lists_are_coerced():
+    args = registry.validate("create_project", {
+        "token": "t", "name": "Nova", "vision": 42, "projectType": "Startup",
+        "openRoles": [{"roleName": "Dev", "requiredSkills": "python, rust"}]})
+    assert args["vision"] == "42"
+    assert args["projectType"] == "startup"
+    assert args["openRoles"] == [{"roleName": "Dev", "requiredSkills": ["python", "rust"]}]
+
+
+def test_missing_unknown_and_malformed_arguments_are_reported():
+    with pytest.raises(ToolArgumentError) as raised:
+        registry.validate("get_project", {"projectId": 1})
+    assert raised.value.problems == [{"field": "id", "problem": "is required"},
+                                     {"field": "projectId", "problem": "is not a parameter of this tool"}]
+    assert raised.value.to_content()["expected"] == {"id": "number"}
+    with pytest.raises(ToolArgumentError) as raised:
+        registry.validate("get_project", "7")
+    assert raised.value.problems == [{"field": "arguments", "problem": "must be a JSON object"}]
+    with pytest.raises(ToolArgumentError) as raised:
+        registry.validate("delete_everything", {})
+    assert raised.value.problems == [{"field": "name", "problem": "is not a known tool"}]
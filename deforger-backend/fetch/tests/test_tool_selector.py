@@ -0,0 +1,12 @@
+from agent import tools
+from tool_selector import ToolSelector
+
+
+def test_encoded_subsets_are_kept_lru_first():
+    selector = ToolSelector(tools, max_encoded=2)
+    names = list(selector.by_name)
+    first = selector.encoded(names[:1])
+    selector.encoded(names[:2])
+    assert selector.encoded(names[:1]) is first
+    selector.encoded(names[:3])
+    assert list(selector._encoded) == [tuple(names[:1]), tuple(names[:3])]
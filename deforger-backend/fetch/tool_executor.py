@@ -0,0 +1,127 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+
+from tool_registry import ToolArgumentError
+
+# Runs the tool calls of one ASI1 turn. Consecutive read-only get_* calls run
+# concurrently; mutating calls act as barriers and run alone, in emitted order,
+# so a read that follows a write still observes it. With call_batch, a turn of
+# several calls is handed over whole instead, to be sent as one ordered batch;
+# calls that went out in the batch share its duration and are marked batched.
+# With validate, arguments are checked and coerced first; invalid calls never
+# reach call/call_batch and come back as structured errors.
+
+
+def is_read_only(func_name: str) -> bool:
+    return func_name.startswith("get_")
+
+
+@dataclass
+class ToolResult:
+    tool_call_id: str
+    name: str
+    arguments: dict
+    content: str
+    ok: bool
+    elapsed: float
+    batched: bool = False  # elapsed is the whole batch's, shared with its other calls
+
+
+class ToolExecutor:
+    def __init__(self, call, max_concurrency: int = 8, call_batch=None, validate=None):
+        # call: async (func_name, args) -> JSON-serializable result
+        # call_batch: async [(func_name, args)] -> [(result or Exception, seconds, batched)], in order
+        # validate: (func_name, args) -> coerced args, raising ToolArgumentError
+        self.call = call
+        self.max_concurrency = max(1, max_concurrency)
+        self.call_batch = call_batch
+        self.validate = validate
+
+    def _arguments(self, tool_call: dict) -> dict:
+        arguments = json.loads(tool_call["function"]["arguments"] or "{}")
+        if self.validate is not None:
+            arguments = self.validate(tool_call["function"]["name"], arguments)
+        return arguments
+
+    async def execute(self, tool_calls: list, logger=None) -> list:
+        if self.call_batch is not None and len(tool_calls) > 1:
+            return await self._execute_batch(tool_calls, logger)
+        results = [None] * len(tool_calls)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(index: int):
+            async with semaphore:
+                results[index] = await self._run_one(tool_calls[index], logger)
+
+        pending_reads = []
+        for index, tool_call in enumerate(tool_calls):
+            if is_read_only(tool_call["function"]["name"]):
+                pending_reads.append(index)
+                continue
+            if pending_reads:
+                await asyncio.gather(*(run(i) for i in pending_reads))
+                pending_reads = []
+            await run(index)
+        if pending_reads:
+            await asyncio.gather(*(run(i) for i in pending_reads))
+
+        # Results stay in the original tool_call order
+        return results
+
+    async def _execute_batch(self, tool_calls: list, logger=None) -> list:
+        started = time.perf_counter()
+        parsed = []
+        for tool_call in tool_calls:
+            try:
+                parsed.append(self._arguments(tool_call))
+            except (ValueError, ToolArgumentError) as e:
+                parsed.append(e)
+        calls = [(tc["function"]["name"], args) for tc, args in zip(tool_calls, parsed)
+                 if not isinstance(args, Exception)]
+        if logger:
+            logger.info(f"Executing batch: {[name for name, _ in calls]}")
+        outcomes = iter(await self.call_batch(calls) if calls else [])
+        if logger:
+            logger.info(f"Batch of {len(calls)} call(s) finished in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        results = []
+        for tool_call, args in zip(tool_calls, parsed):
+            if isinstance(args, Exception):
+                results.append(self._result(tool_call, {}, args, 0.0))
+            else:
+                outcome, elapsed, batched = next(outcomes)
+                results.append(self._result(tool_call, args, outcome, elapsed, batched))
+        return results
+
+    @staticmethod
+    def _result(tool_call: dict, arguments: dict, outcome, elapsed: float, batched: bool = False) -> ToolResult:
+        if isinstance(outcome, ToolArgumentError):
+            content, ok = json.dumps(outcome.to_content()), False
+        elif isinstance(outcome, Exception):
+            error_content = {
+                "error": f"Tool execution failed: {str(outcome)}",
+                "status": "failed"
+            }
+            content, ok = json.dumps(error_content), False
+        else:
+            content, ok = json.dumps(outcome), True
+        return ToolResult(tool_call["id"], tool_call["function"]["name"], arguments, content, ok, elapsed, batched)
+
+    async def _run_one(self, tool_call: dict, logger=None) -> ToolResult:
+        func_name = tool_call["function"]["name"]
+        tool_call_id = tool_call["id"]
+        started = time.perf_counter()
+        arguments = {}
+        try:
+            arguments = self._arguments(tool_call)
+            if logger:
+                logger.info(f"Executing {func_name} with arguments: {arguments}")
+            outcome = await self.call(func_name, arguments)
+        except Exception as e:
+            outcome = e
+        elapsed = time.perf_counter() - started
+        if logger:
+            logger.info(f"{func_name} ({tool_call_id}) finished in {elapsed * 1000:.1f} ms")
+        return self._result(tool_call, arguments, outcome, elapsed)
@@ -0,0 +1,211 @@
+import math
+
+# Validates and coerces tool-call arguments before they reach the canister.
+# Each tool's JSON schema is compiled once into a tree of small checker
+# functions. JSON "number" parameters are Nats in the canister, so they must be
+# whole and non-negative; 3.0 and "3" become 3, so they don't reach the
+# canister as "3.0", which Nat.fromText rejects. Strings accept scalars, and
+# string lists accept a comma-separated string. Enumerated values are matched
+# after coercion, ignoring case and surrounding spaces for strings. An invalid
+# call is rejected locally with a structured error the model can act on,
+# without an HTTP round trip.
+
+
+class ToolArgumentError(Exception):
+    def __init__(self, tool: str, problems: list, expected: dict = None):
+        # problems: [{"field": parameter name, "problem": text}]
+        super().__init__(f"Invalid arguments for {tool}: " +
+                         "; ".join(f"{p['field']} {p['problem']}" for p in problems))
+        self.tool = tool
+        self.problems = problems
+        self.expected = expected or {}
+
+    def to_content(self) -> dict:
+        return {
+            "error": str(self),
+            "status": "invalid_arguments",
+            "problems": self.problems,
+            "expected": self.expected,
+        }
+
+
+class _Invalid(Exception):
+    def __init__(self, problem: str):
+        self.problem = problem
+
+
+def _describe(value) -> str:
+    text = repr(value)
+    return text if len(text) <= 40 else text[:37] + "..."
+
+
+def _nat(value):
+    if isinstance(value, bool):
+        raise _Invalid(f"must be a whole number, got {_describe(value)}")
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            value = int(text) if text.isdigit() else float(text)
+        except ValueError:
+            raise _Invalid(f"must be a whole number, got {_describe(value)}")
+    if isinstance(value, float):
+        if not math.isfinite(value) or not value.is_integer():
+            raise _Invalid(f"must be a whole number, got {_describe(value)}")
+        value = int(value)
+    if not isinstance(value, int):
+        raise _Invalid(f"must be a whole number, got {_describe(value)}")
+    if value < 0:
+        raise _Invalid(f"must not be negative, got {value}")
+    return value
+
+
+def _text(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise _Invalid(f"must be a string, got {_describe(value)}")
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    raise _Invalid(f"must be true or false, got {_describe(value)}")
+
+
+def _one_of(check, members: list):
+    folded = {member.strip().lower(): member for member in members if isinstance(member, str)}
+    listed = ", ".join(_describe(member) for member in members)
+
+    def check_member(value):
+        checked = check(value)
+        if checked in members:
+            return checked
+        if isinstance(checked, str) and checked.strip().lower() in folded:
+            return folded[checked.strip().lower()]
+        raise _Invalid(f"must be one of {listed}, got {_describe(value)}")
+    return check_member
+
+
+SCALARS = {"number": _nat, "integer": _nat, "string": _text, "boolean": _boolean}
+
+
+def _types(schema: dict) -> list:
+    kind = schema.get("type", "object" if "properties" in schema else None)
+    return kind if isinstance(kind, list) else [kind]
+
+
+def compile_schema(schema: dict):
+    # Returns check(value) -> coerced value, raising _Invalid
+    types = _types(schema)
+    nullable = "null" in types
+    kind = next((t for t in types if t != "null"), None)
+
+    if kind == "array":
+        check_item = compile_schema(schema.get("items") or {})
+        of_strings = (schema.get("items") or {}).get("type") == "string"
+
+        def check(value):
+            if isinstance(value, str) and of_strings:
+                value = [part.strip() for part in value.split(",") if part.strip()]
+            if not isinstance(value, list):
+                raise _Invalid(f"must be a list, got {_describe(value)}")
+            checked = []
+            for index, item in enumerate(value):
+                try:
+                    checked.append(check_item(item))
+                except _Invalid as e:
+                    raise _Invalid(f"item {index}: {e.problem}")
+            return checked
+    elif kind == "object":
+        check_fields = compile_fields(schema)
+
+        def check(value):
+            if not isinstance(value, dict):
+                raise _Invalid(f"must be an object, got {_describe(value)}")
+            checked, problems = check_fields(value)
+            if problems:
+                raise _Invalid(", ".join(f"{p['field']} {p['problem']}" for p in problems))
+            return checked
+    elif kind in SCALARS:
+        check = SCALARS[kind]
+    else:
+        def check(value):
+            return value
+
+    if "enum" in schema:
+        check = _one_of(check, schema["enum"])
+    if not nullable:
+        return check
+    return lambda value: None if value is None else check(value)
+
+
+def compile_fields(schema: dict):
+    # Returns check_fields(args) -> (coerced args, problems) for an object schema
+    properties = {name: compile_schema(prop) for name, prop in (schema.get("properties") or {}).items()}
+    required, nullable = set(), set()
+    for name in schema.get("required") or []:
+        # Required-but-nullable parameters may be left out; they are passed on as null
+        (nullable if "null" in _types(schema["properties"].get(name, {})) else required).add(name)
+    closed = schema.get("additionalProperties") is False
+
+    def check_fields(args: dict):
+        checked, problems = {}, []
+        for name, check in properties.items():
+            value = args.get(name)
+            if value is None:
+                if name in required:
+                    problems.append({"field": name, "problem": "is required"})
+                elif name in nullable or name in args:
+                    checked[name] = None
+                continue
+            try:
+                checked[name] = check(value)
+            except _Invalid as e:
+                problems.append({"field": name, "problem": e.problem})
+        if closed:
+            problems += [{"field": name, "problem": "is not a parameter of this tool"}
+                         for name in args if name not in properties]
+        return checked, problems
+    return check_fields
+
+
+class ToolRegistry:
+    def __init__(self, tools: list):
+        self.validators = {}  # tool name -> check_fields
+        self.expected = {}  # tool name -> {parameter: type}, echoed back in errors
+        for tool in tools:
+            function = tool["function"]
+            parameters = function.get("parameters") or {}
+            self.validators[function["name"]] = compile_fields(parameters)
+            self.expected[function["name"]] = {
+                name: "|".join(t for t in _types(prop) if t)
+                for name, prop in (parameters.get("properties") or {}).items()
+            }
+        self.stats = {"validated": 0, "coerced": 0, "rejected": 0}
+
+    def validate(self, func_name: str, args) -> dict:
+        # Returns the coerced arguments or raises ToolArgumentError
+        check_fields = self.validators.get(func_name)
+        if check_fields is None:
+            problems = [{"field": "name", "problem": "is not a known tool"}]
+            expected = {"tools": sorted(self.validators)}
+        elif not isinstance(args, dict):
+            problems = [{"field": "arguments", "problem": "must be a JSON object"}]
+            expected = self.expected[func_name]
+        else:
+            checked, problems = check_fields(args)
+            expected = self.expected[func_name]
+        if problems:
+            self.stats["rejected"] += 1
+            raise ToolArgumentError(func_name, problems, expected)
+        self.stats["validated"] += 1
+        if checked != args:
+            self.stats["coerced"] += 1
+        return checked
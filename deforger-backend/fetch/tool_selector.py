@@ -0,0 +1,125 @@
+import json
+import math
+import re
+from collections import Counter, OrderedDict
+
+# Picks the tools worth sending with a first-turn ASI1 request.
+# Tools are indexed once with TF-IDF over their name, description and
+# parameter names; a query gets the top-k tools by cosine similarity plus a
+# fixed fallback set. The JSON encodings of the most recently used subsets are
+# cached, LRU-first, so the schema part of the payload is only serialized once.
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "for", "to", "in", "on", "with", "by", "is", "are",
+    "me", "my", "i", "what", "whats", "show", "get", "list", "all", "every", "please", "can",
+    "using", "from", "this", "that", "it", "its", "be", "as", "at", "do", "does",
+}
+
+# Extra vocabulary users reach for that the short tool descriptions don't contain
+SYNONYMS = {
+    "register": "signup sign up account create new user",
+    "login": "log sign in authenticate session credentials",
+    "change_password": "password new update set",
+    "update_user_profile": "profile modify update info details skills portfolio",
+    "create_project": "start initiate new project vision roles",
+    "record_agent_match": "match agent connection record log",
+    "apply_to_project": "apply application submit join cover letter",
+    "review_application": "accept reject approve decline application app",
+    "send_message": "message chat post send team",
+    "tokenize_project": "tokenize tokenization shares price enable",
+    "buy_shares": "buy purchase acquire shares",
+    "withdraw_project_funds": "withdraw funds earnings pull extract",
+    "add_review": "review rating feedback",
+    "create_contract": "contract nft terms draft agreement",
+    "get_all_projects": "projects available browse",
+    "get_project": "project details information",
+    "get_user_profile": "user profile info",
+    "get_project_messages": "messages chat conversation",
+    "get_project_reviews": "reviews ratings feedback",
+    "get_all_agent_matches": "matches agent",
+    "get_project_share_balance": "shares share balance own hold many",
+    "get_matching_projects": "match matching skills recommended join recommend",
+    "get_ranked_matching_projects": "match matching skills recommended recommend best fit rank ranked suit",
+    "get_role_candidates": "candidates candidate hire find who fit role people talent recommend",
+    "get_contract": "contract details",
+    "get_user_trust_score": "trust score credit reputation",
+}
+
+
+def tokenize(text: str) -> list:
+    words = re.findall(r"[a-z0-9]+", re.sub(r"([a-z])([A-Z])", r"\1 \2", text).lower())
+    return [w[:-1] if w.endswith("s") and len(w) > 3 else w for w in words if w not in STOPWORDS]
+
+
+def _tool_text(tool: dict) -> str:
+    function = tool["function"]
+    name = function["name"]
+    params = " ".join(function.get("parameters", {}).get("properties", {}).keys())
+    return " ".join([name.replace("_", " "), function.get("description", ""), params, SYNONYMS.get(name, "")])
+
+
+class ToolSelector:
+    def __init__(self, tools: list, top_k: int = 6, fallback: tuple = ("get_all_projects", "get_project"),
+                 min_score: float = 0.05, max_encoded: int = 256):
+        self.tools = tools
+        self.by_name = {tool["function"]["name"]: tool for tool in tools}
+        self.top_k = top_k
+        self.fallback = [name for name in fallback if name in self.by_name]
+        self.min_score = min_score
+        self.max_encoded = max_encoded
+        self._encoded = OrderedDict()  # tuple of names -> JSON text
+        self.stats = {"selections": 0, "full_set": 0, "dropped_tool_requests": 0, "retries_with_full_set": 0}
+
+        documents = {name: Counter(tokenize(_tool_text(tool))) for name, tool in self.by_name.items()}
+        df = Counter(term for terms in documents.values() for term in terms)
+        n = len(documents)
+        self.idf = {term: math.log((1 + n) / (1 + count)) + 1 for term, count in df.items()}
+        self.vectors = {name: self._weigh(terms) for name, terms in documents.items()}
+
+    def _weigh(self, terms: Counter) -> dict:
+        vector = {t: (1 + math.log(c)) * self.idf[t] for t, c in terms.items() if t in self.idf}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {t: v / norm for t, v in vector.items()}
+
+    def score(self, query: str) -> list:
+        query_vector = self._weigh(Counter(tokenize(query)))
+        scores = [
+            (sum(weight * vector.get(term, 0.0) for term, weight in query_vector.items()), name)
+            for name, vector in self.vectors.items()
+        ]
+        return sorted(scores, reverse=True)
+
+    def select(self, query: str) -> list:
+        # Returns the tool names to send, in the original tools order
+        self.stats["selections"] += 1
+        ranked = [name for score, name in self.score(query)[:self.top_k] if score >= self.min_score]
+        if not ranked:
+            self.stats["full_set"] += 1
+            return list(self.by_name)
+        chosen = set(ranked) | set(self.fallback)
+        return [name for name in self.by_name if name in chosen]
+
+    def encoded(self, names: list) -> str:
+        # Pre-encoded JSON array of the tool schemas for this subset
+        key = tuple(names)
+        text = self._encoded.get(key)
+        if text is None:
+            text = json.dumps([self.by_name[name] for name in names], separators=(",", ":"))
+            self._encoded[key] = text
+            while len(self._encoded) > self.max_encoded:
+                self._encoded.popitem(last=False)
+        else:
+            self._encoded.move_to_end(key)
+        return text
+
+    def is_full_set(self, names: list) -> bool:
+        return len(names) == len(self.by_name)
+
+    def record_dropped(self, offered: list, tool_calls: list) -> int:
+        # Counts tool calls for tools that exist but were left out of the subset
+        dropped = [
+            tc["function"]["name"] for tc in tool_calls
+            if tc["function"]["name"] in self.by_name and tc["function"]["name"] not in offered
+        ]
+        self.stats["dropped_tool_requests"] += len(dropped)
+        return len(dropped)
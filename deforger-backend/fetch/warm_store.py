@@ -0,0 +1,110 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+# Optional on-disk snapshot of the agent's warm state, so a restart doesn't
+# start cold. Rows live in SQLite under a namespace (e.g. "icp" for the read
+# cache) and carry the canister state version they were valid at, so the
+# caller can tell whether a row is still current. Opening reads only the keys,
+# in a worker thread; a row's value is read the first time its key is needed.
+
+# Argument names whose values must never be written to disk
+SENSITIVE_KEYS = {"password", "oldpassword", "newpassword", "token", "apikey", "api_key", "authorization", "secret"}
+
+
+def carries_secrets(value) -> bool:
+    # True if any sensitive field (password, token, ...) holds a value
+    if isinstance(value, dict):
+        return any((k.lower() in SENSITIVE_KEYS and isinstance(v, str) and v) or carries_secrets(v)
+                   for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return any(carries_secrets(v) for v in value)
+    return False
+
+
+class WarmStore:
+    def __init__(self, path: str, max_age: float = 86400.0):
+        self.path = path
+        self.max_age = max_age  # rows older than this are pruned on open
+        self.ready = False
+        self._db = None
+        self._lock = threading.Lock()  # one connection, used from worker threads
+        self._pending = {}  # namespace -> keys on disk not yet taken
+        self.stats = {"keys": 0, "taken": 0, "saved": 0, "pruned": 0, "errors": 0}
+
+    def _open(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS entries (namespace TEXT NOT NULL, key TEXT NOT NULL, "
+                   "value TEXT NOT NULL, version INTEGER, saved_at REAL NOT NULL, PRIMARY KEY (namespace, key))")
+        pruned = db.execute("DELETE FROM entries WHERE saved_at < ?", (time.time() - self.max_age,)).rowcount
+        db.commit()
+        pending = {}
+        for namespace, key in db.execute("SELECT namespace, key FROM entries"):
+            pending.setdefault(namespace, set()).add(key)
+        return db, pending, pruned
+
+    async def open(self):
+        self._db, self._pending, self.stats["pruned"] = await asyncio.to_thread(self._open)
+        self.stats["keys"] = sum(len(keys) for keys in self._pending.values())
+        self.ready = True
+
+    def pending(self, namespace: str, key: str) -> bool:
+        return key in self._pending.get(namespace, ())
+
+    def _read(self, namespace: str, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT value, version, saved_at FROM entries WHERE namespace = ? AND key = ?",
+                                   (namespace, key)).fetchone()
+        if row is None:
+            return None
+        value, version, saved_at = row
+        return json.loads(value), version, time.time() - saved_at
+
+    async def take(self, namespace: str, key: str):
+        # Returns (value, version, seconds since saved) the first time a stored key
+        # is asked for, else None; later calls go to the in-memory caches
+        if not self.ready or not self.pending(namespace, key):
+            return None
+        self._pending[namespace].discard(key)
+        try:
+            row = await asyncio.to_thread(self._read, namespace, key)
+        except (sqlite3.Error, ValueError):
+            self.stats["errors"] += 1
+            return None
+        if row is not None:
+            self.stats["taken"] += 1
+        return row
+
+    def _write(self, namespace: str, rows: list):
+        saved_at = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, version, saved_at) VALUES (?, ?, ?, ?, ?)",
+                [(namespace, key, json.dumps(value, separators=(",", ":")), version, saved_at)
+                 for key, value, version in rows])
+            self._db.commit()
+
+    async def save(self, namespace: str, rows: list):
+        # rows: [(key, JSON-serializable value, canister version or None)]; encoded
+        # in the worker thread and upserted, so rows nobody asked for this run are
+        # kept until they age out
+        if not self.ready or not rows:
+            return
+        try:
+            await asyncio.to_thread(self._write, namespace, rows)
+        except sqlite3.Error:
+            self.stats["errors"] += 1
+            raise
+        self.stats["saved"] += len(rows)
+
+    def _close(self, db):
+        with self._lock:
+            db.close()
+
+    async def close(self):
+        if self._db is not None:
+            db, self._db, self.ready = self._db, None, False
+            await asyncio.to_thread(self._close, db)